@@ -0,0 +1,139 @@
+import threading
+import time
+import album_bits
+
+# --- MÉTRICAS DEL PANEL DE ADMIN (MANTENIDAS AL ESCRIBIR) ---
+# Antes el panel bajaba las tablas users y transaction_requests enteras a pandas y hacía
+# dos count="exact" sobre inventory en CADA rerun del admin, sólo para 4 KPIs y 2 gráficos.
+# Ahora hay UN store por proceso con los contadores ya calculados; el panel lo lee en O(1).
+# Lo actualizan las escrituras de database.py (registro, perfil, premium, votos, inventario).
+# Se arma con un recálculo completo la primera vez y se puede recalcular a mano (botón del
+# admin) o cada 'recalculo' segundos, para corregir la deriva (ej: escrituras de otro proceso).
+# El recálculo corre en un hilo aparte (uno a la vez): mientras tanto el panel sigue leyendo
+# las métricas anteriores. Las escrituras que llegan durante el recálculo se aplican a las
+# actuales y además se anotan; al terminar se re-aplican sobre el resultado nuevo antes de
+# publicarlo (antes se pisaba _m y se perdían). Una escritura que el recálculo ya alcanzó a
+# leer puede quedar contada dos veces: esa deriva la corrige el recálculo siguiente.
+
+STATUS = ('tengo', 'repetida', 'wishlist')
+TOP_K = 5
+
+def _status(valor):
+    return 'repetida' if valor in album_bits.ALIAS_REPETIDA else valor
+
+def _contar(rows):
+    conteo = {}
+    for r in rows:
+        s = _status(r.get('status'))
+        conteo[s] = conteo.get(s, 0) + 1
+    return conteo
+
+class MetricasAdmin:
+    def __init__(self, recalcular, recalculo=6 * 3600):
+        """recalcular(): dict con usuarios, premium, activos, por_provincia, inventario y top (ver database)."""
+        self._recalcular = recalcular
+        self._recalculo = recalculo
+        self._lock = threading.Lock()
+        self._m = None
+        self._en_curso = None  # Event del recálculo que está corriendo
+        self._durante = None   # cambios anotados mientras corre
+        self.recalculado_en = None
+        self.error = None
+
+    def leer(self):
+        """Copia de las métricas actuales (chica: contadores y un top de TOP_K)."""
+        if self._m is None or time.time() - self.recalculado_en > self._recalculo:
+            fin = self._lanzar()
+            if self._m is None: fin.wait()  # la primera vez no hay nada que mostrar
+        with self._lock:
+            if self._m is None: raise RuntimeError(f"No se pudieron calcular las métricas: {self.error}")
+            m = dict(self._m)
+            m['por_provincia'] = dict(m['por_provincia'])
+            m['inventario'] = dict(m['inventario'])
+            m['top'] = [dict(u) for u in m['top']]
+            m['recalculado_en'] = self.recalculado_en
+            m['recalculando'] = self._en_curso is not None
+            return m
+
+    def recalcular(self):
+        """Recálculo a pedido (botón del admin): espera a que termine el que esté corriendo."""
+        self._lanzar().wait()
+        if self.error: raise RuntimeError(self.error)
+
+    def _lanzar(self):
+        with self._lock:
+            if self._en_curso is None:
+                self._en_curso, self._durante = threading.Event(), []
+                threading.Thread(target=self._correr, args=(self._en_curso,), name="metricas-admin", daemon=True).start()
+            return self._en_curso
+
+    def _correr(self, fin):
+        try:
+            m = self._recalcular()
+            m['top'] = sorted(m['top'], key=lambda u: (-int(u.get('reputation') or 0), u['id']))[:TOP_K]
+            with self._lock:
+                for cambio in self._durante: cambio(m)
+                self._m = m
+                self.recalculado_en = time.time()
+                self.error = None
+        except Exception as e:
+            print(f"Error recalculando métricas del admin: {e}")
+            self.error = str(e)
+        finally:
+            with self._lock: self._en_curso, self._durante = None, None
+            fin.set()
+
+    def _aplicar(self, cambio):
+        with self._lock:
+            if self._durante is not None: self._durante.append(cambio)
+            if self._m is not None: cambio(self._m)
+
+    # --- ESCRITURAS (antes del primer recálculo sólo se anotan para re-aplicarlas) ---
+    def usuario_nuevo(self, provincia):
+        def cambio(m):
+            m['usuarios'] += 1
+            self._sumar(m['por_provincia'], provincia, 1)
+        self._aplicar(cambio)
+
+    def provincia_cambiada(self, user_id, antes, despues):
+        if antes == despues: return
+        def cambio(m):
+            self._sumar(m['por_provincia'], antes, -1)
+            self._sumar(m['por_provincia'], despues, 1)
+            for u in m['top']:
+                if u['id'] == user_id: u['province'] = despues
+        self._aplicar(cambio)
+
+    def premium_cambiado(self, user_id, antes, despues):
+        if bool(antes) == bool(despues): return
+        def cambio(m):
+            m['premium'] += 1 if despues else -1
+            for u in m['top']:
+                if u['id'] == user_id: u['is_premium'] = bool(despues)
+        self._aplicar(cambio)
+
+    def reputacion_cambiada(self, usuario, antes):
+        """usuario: fila de users ya actualizada (id, nick, province, is_premium, reputation)."""
+        despues = int(usuario.get('reputation') or 0)
+        fila = {k: usuario.get(k) for k in ('id', 'nick', 'reputation', 'province', 'is_premium')}
+        def cambio(m):
+            m['activos'] += int(despues > 0) - int(antes > 0)
+            top = [u for u in m['top'] if u['id'] != fila['id']]
+            top.append(dict(fila))
+            # Los votos sólo suben la reputación: el que entra al top sólo puede desplazar al último
+            m['top'] = sorted(top, key=lambda u: (-int(u.get('reputation') or 0), u['id']))[:TOP_K]
+        self._aplicar(cambio)
+
+    def inventario(self, antes, despues):
+        """Filas de inventory de una escritura: las que había y las que quedaron (mismas figuritas)."""
+        delta = _contar(despues)
+        for s, n in _contar(antes).items(): delta[s] = delta.get(s, 0) - n
+        def cambio(m):
+            for s, n in delta.items():
+                if n: self._sumar(m['inventario'], s, n)
+        self._aplicar(cambio)
+
+    @staticmethod
+    def _sumar(conteo, clave, n):
+        conteo[clave] = conteo.get(clave, 0) + n
+        if conteo[clave] <= 0: del conteo[clave]
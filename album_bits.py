@@ -0,0 +1,97 @@
+from array import array
+from dataclasses import dataclass, field
+import numpy as np
+import config
+
+# --- INVENTARIO COMO BITSETS ---
+# El álbum es un rango denso de figuritas (1..N), así que cada estado del inventario
+# de un usuario entra en un entero de N+1 bits: el bit i prendido = figurita #i.
+# "Qué le puedo dar a B" pasa a ser un AND-NOT entre enteros en vez de sets.
+
+ALBUM_SIZE = max(fin for _, fin in config.ALBUM_PAGES.values())
+ALIAS_REPETIDA = ('repetida', 'repe')
+
+def mascara(ids):
+    """Lista/set de números de figurita -> entero con esos bits prendidos."""
+    m = 0
+    for num in ids:
+        m |= 1 << int(num)
+    return m
+
+def ids(m):
+    """Entero -> lista ordenada de números de figurita."""
+    res = []
+    while m:
+        bajo = m & -m
+        res.append(bajo.bit_length() - 1)
+        m ^= bajo
+    return res
+
+def menor(m):
+    """Figurita de menor número en la máscara (None si está vacía)."""
+    return (m & -m).bit_length() - 1 if m else None
+
+def contar(m):
+    return m.bit_count()
+
+def contiene(m, nums):
+    """Versión vectorizada de 'num in máscara' para un array de números (NumPy)."""
+    nums = np.asarray(nums, dtype=np.int64)
+    n_bits = max(ALBUM_SIZE, m.bit_length()) + 1
+    bits = np.unpackbits(np.frombuffer(m.to_bytes((n_bits + 7) // 8, 'little'), dtype=np.uint8), bitorder='little')
+    fuera = (nums < 0) | (nums >= len(bits))
+    return np.where(fuera, False, bits[np.clip(nums, 0, len(bits) - 1)].astype(bool))
+
+@dataclass
+class InventarioBits:
+    tengo: int = 0
+    repetidas: int = 0
+    wishlist: int = 0
+    # Cantidad de repetidas por figurita (índice = número). Los precios son pocos: dict disperso.
+    cantidades: array = field(default_factory=lambda: array('H', [0] * (ALBUM_SIZE + 1)))
+    precios: dict = field(default_factory=dict)
+
+    @property
+    def poseidas(self):
+        """Pegadas en el álbum: 'tengo' más las repetidas (una repe implica tenerla)."""
+        return self.tengo | self.repetidas
+
+    def falta(self):
+        """Figuritas del álbum que todavía no tiene."""
+        return ((1 << (ALBUM_SIZE + 1)) - 2) & ~self.poseidas
+
+def desde_filas(rows):
+    """Filas de la tabla inventory (dicts) -> InventarioBits."""
+    inv = InventarioBits()
+    for row in rows:
+        num = int(row.get('sticker_num') or 0)
+        status = str(row.get('status', '')).lower().strip()
+        if status == 'tengo':
+            inv.tengo |= 1 << num
+        elif status in ALIAS_REPETIDA:
+            inv.repetidas |= 1 << num
+            if num < len(inv.cantidades):
+                inv.cantidades[num] = int(row.get('quantity') or 1)
+            precio = int(row.get('price') or 0)
+            if precio > 0: inv.precios[num] = precio
+        elif status == 'wishlist':
+            inv.wishlist |= 1 << num
+    return inv
+
+def a_filas(inv, user_id):
+    """InventarioBits -> filas listas para insertar en inventory."""
+    rows = []
+    for num in ids(inv.tengo):
+        rows.append({"user_id": user_id, "sticker_num": num, "status": "tengo", "price": 0, "quantity": 1})
+    for num in ids(inv.repetidas):
+        qty = inv.cantidades[num] if num < len(inv.cantidades) and inv.cantidades[num] else 1
+        rows.append({"user_id": user_id, "sticker_num": num, "status": "repetida", "price": inv.precios.get(num, 0), "quantity": qty})
+    for num in ids(inv.wishlist):
+        rows.append({"user_id": user_id, "sticker_num": num, "status": "wishlist", "price": 0, "quantity": 1})
+    return rows
+
+def puede_dar(a, b, solo_wishlist=False):
+    """Repetidas de A que B no tiene (opcionalmente, sólo las que B marcó en su wishlist)."""
+    res = a.repetidas & ~b.poseidas
+    if solo_wishlist: res &= b.wishlist
+    return res
@@ -16,6 +16,21 @@ st.set_page_config(page_title="Figus 26", layout="wide", page_icon="⚽", initia
 # --- CARGAR ESTILOS CSS ---
 styles.load_css()
 
+# --- SNAPSHOT POR RERUN (inventario propio + contador de consultas) ---
+db.nuevo_rerun()
+
+# --- OUTBOX DE ALERTAS (un drenador por proceso: retoma lo pendiente después de un deploy) ---
+db.start_outbox_worker()
+
+# --- SERIES DE ACTIVIDAD (un plegador por proceso, ver rollups.py) ---
+db.start_rollup_worker()
+
+# --- ÍNDICE DE ALERTAS PREMIUM (se arma en segundo plano, ver premium_index.py) ---
+db.start_premium_index()
+
+# --- MANTENIMIENTO (retoma el trabajo por lotes que un deploy haya cortado) ---
+db.start_maintenance()
+
 # --- MEMORIA GLOBAL ---
 if 'unlocked_users' not in st.session_state: st.session_state.unlocked_users = set()
 if 'skip_security_modal' not in st.session_state: st.session_state.skip_security_modal = False
@@ -71,7 +86,6 @@ else:
         # Inicializaciones silenciosas
         if not st.session_state.unlocked_users:
             st.session_state.unlocked_users = db.get_unlocked_ids(user['id'])
-        db.verify_daily_reset(user)
 
         # --- SIDEBAR (SIEMPRE DISPONIBLE) ---
         sidebar.render_user_sidebar(user)
@@ -138,4 +152,8 @@ else:
         if fc2.button("❓ FAQ", use_container_width=True, type="secondary"): modals.mostrar_faq()
         if fc3.button("⚖️ Legales", use_container_width=True, type="secondary"): modals.mostrar_legales()
         
-        st.markdown("<div class='footer-text'>© 2026 Figus 26. Hecho en Mendoza 🍷</div>", unsafe_allow_html=True)
\ No newline at end of file
+        st.markdown("<div class='footer-text'>© 2026 Figus 26. Hecho en Mendoza 🍷</div>", unsafe_allow_html=True)
+
+        if config.DEBUG:
+            actual, anterior = db.get_roundtrips_rerun()
+            st.caption(f"🔌 Consultas a la base: {actual} en este rerun (anterior: {anterior})")
\ No newline at end of file
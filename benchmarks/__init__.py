@@ -0,0 +1,2 @@
+# Benchmarks de los caminos calientes de Figus 26.
+# Se corren como módulos: python -m benchmarks.bench_matching
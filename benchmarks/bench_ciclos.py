@@ -0,0 +1,63 @@
+import argparse
+import time
+import numpy as np
+import album_bits
+import graph_engine
+from benchmarks import synthetic
+
+# --- CADENAS DE 4 Y 5 PARTES SOBRE UN MERCADO GRANDE ---
+# python -m benchmarks.bench_ciclos --usuarios 100000 --muestras 200 --presupuesto-ms 300
+# Arma el grafo del mercado sintético (sin backend) y busca ciclos de hasta k partes para
+# usuarios de zonas chicas, una figurita de su wishlist cada uno. Reporta latencia (p50/p95/máx),
+# cuántas búsquedas se cortaron por presupuesto y cuántas figuritas sólo tenían cadena larga.
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de ciclos de k partes con presupuesto.")
+    parser.add_argument("--usuarios", type=int, default=100000)
+    parser.add_argument("--muestras", type=int, default=200)
+    parser.add_argument("--k-max", type=int, default=5)
+    parser.add_argument("--presupuesto-ms", type=float, default=300)
+    parser.add_argument("--max-nodos", type=int, default=50000)
+    parser.add_argument("--alcance", default="zona", choices=graph_engine.ALCANCES)
+    parser.add_argument("--seed", type=int, default=26)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    mercado = synthetic.generar_mercado(args.usuarios, seed=args.seed)
+    market_df = mercado.market_df()
+    del mercado
+    t_gen = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    grafo = graph_engine.GrafoMercado(market_df)
+    t_build = time.perf_counter() - t0
+    print(f"{args.usuarios} usuarios, {len(market_df)} filas (generado {t_gen:.1f}s, grafo {t_build:.1f}s)")
+    del market_df
+
+    # Muestra: usuarios con repes y wishlist, de zonas de todos los tamaños (muchas chicas)
+    rng = np.random.default_rng(args.seed)
+    aptos = [i for i in range(grafo.usuarios) if grafo.repetidas[i] and grafo.wishlist[i] & ~grafo.poseidas[i]]
+    muestra = rng.choice(aptos, size=min(args.muestras, len(aptos)), replace=False)
+
+    tiempos, cortadas, sin_triangulo, con_largas = [], 0, 0, 0
+    por_largo = {}
+    for i in muestra.tolist():
+        faltan = album_bits.ids(grafo.wishlist[i] & ~grafo.poseidas[i])
+        figu = faltan[rng.integers(len(faltan))]
+        presupuesto = graph_engine.Presupuesto(ms=args.presupuesto_ms, nodos=args.max_nodos)
+        t0 = time.perf_counter()
+        cadenas = grafo.ciclos(int(grafo.uids[i]), figu, args.k_max, args.alcance, 20, presupuesto)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+        cortadas += presupuesto.cortado
+        largos = {c['largo'] for c in cadenas}
+        for k in largos: por_largo[k] = por_largo.get(k, 0) + 1
+        if 3 not in largos:
+            sin_triangulo += 1
+            con_largas += bool(largos)
+
+    p = np.percentile(tiempos, [50, 95, 100])
+    print(f"búsquedas: {len(tiempos)} | p50 {p[0]:.1f}ms p95 {p[1]:.1f}ms máx {p[2]:.1f}ms | cortadas por presupuesto: {cortadas}")
+    print(f"búsquedas con cadena de cada largo: {dict(sorted(por_largo.items()))}")
+    print(f"sin triángulo: {sin_triangulo}, de las cuales con cadena de 4-5: {con_largas}")
+
+if __name__ == "__main__":
+    main()
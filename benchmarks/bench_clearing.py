@@ -0,0 +1,51 @@
+import argparse
+import time
+import album_bits
+import market_clearing
+from benchmarks import synthetic
+
+# --- COMPENSACIÓN GLOBAL: THROUGHPUT Y VALIDACIÓN ---
+# python -m benchmarks.bench_clearing --usuarios 7600   (~1M filas de inventario)
+# Corre el job sobre un mercado sintético y verifica que el resultado no tenga conflictos:
+# nadie entrega más copias de las que tiene repetidas (ni repes a la venta), y cada
+# figurita que se recibe estaba en la wishlist, faltaba y se recibe una sola vez.
+
+def validar(market_df, rows):
+    repes, precio, buscadas = {}, {}, set()
+    for uid, num, status, q, p in zip(market_df['user_id'], market_df['sticker_num'], market_df['status'],
+                                      market_df['quantity'], market_df['price']):
+        if status in album_bits.ALIAS_REPETIDA:
+            repes[(uid, num)] = repes.get((uid, num), 0) + int(q)
+            precio[(uid, num)] = int(p)
+        elif status == 'wishlist':
+            buscadas.add((uid, num))
+    poseidas = set(repes) | set(zip(market_df.loc[market_df['status'] == 'tengo', 'user_id'], market_df.loc[market_df['status'] == 'tengo', 'sticker_num']))
+    entregadas, recibidas = {}, set()
+    for r in rows:
+        clave = (r['user_id'], r['give_sticker'])
+        entregadas[clave] = entregadas.get(clave, 0) + 1
+        assert entregadas[clave] <= repes.get(clave, 0), f"Entrega de más: {clave}"
+        assert precio[clave] == 0, f"Se comprometió una repe a la venta: {clave}"
+        recibe = (r['user_id'], r['receive_sticker'])
+        assert recibe in buscadas and recibe not in poseidas, f"Recibe algo que no buscaba: {recibe}"
+        assert recibe not in recibidas, f"Recibe dos veces: {recibe}"
+        recibidas.add(recibe)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del job de compensación global.")
+    parser.add_argument("--usuarios", type=int, default=7600)
+    parser.add_argument("--seed", type=int, default=26)
+    parser.add_argument("--sin-validar", action="store_true")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    market_df = synthetic.generar_mercado(args.usuarios, seed=args.seed).market_df()
+    print(f"mercado: {len(market_df)} filas, {args.usuarios} usuarios (generado en {time.perf_counter() - t0:.1f}s)")
+    rows, metricas = market_clearing.correr(market_df)
+    for k, v in metricas.items(): print(f"{k:>20}: {v}")
+    if not args.sin_validar:
+        validar(market_df, rows)
+        print("validación: OK (sin conflictos)")
+
+if __name__ == "__main__":
+    main()
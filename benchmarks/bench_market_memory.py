@@ -0,0 +1,54 @@
+import argparse
+import pickle
+import time
+import tracemalloc
+import market_cache
+from benchmarks import synthetic
+
+# --- MEMORIA: CACHE POR USUARIO vs SNAPSHOT COMPARTIDO ---
+# Legacy: st.cache_data(user_id) guarda un pickle del mercado (menos el usuario) por sesión,
+# y cada hit devuelve una copia nueva deserializada.
+# Nuevo: un MarketSnapshot por proceso; cada sesión sólo guarda la referencia.
+
+def simular_legacy(rows, user_ids):
+    cache = {}
+    vivos = []
+    for uid in user_ids:
+        df = market_cache.normalizar_market_df([r for r in rows if r['user_id'] != uid])
+        cache[uid] = pickle.dumps(df)
+        vivos.append(pickle.loads(cache[uid]))  # lo que tiene en mano la sesión durante el rerun
+    return cache, vivos
+
+def simular_compartido(rows, user_ids):
+    snapshot = market_cache.crear_snapshot(rows)
+    vivos = [snapshot.df for _ in user_ids]  # misma referencia, sin copia
+    return snapshot, vivos
+
+def _medir(fn, *args):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    res = fn(*args)
+    dt = time.perf_counter() - t0
+    actual, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del res
+    return actual / 2**20, pico / 2**20, dt
+
+def main():
+    parser = argparse.ArgumentParser(description="Memoria del cache de mercado con N sesiones simuladas.")
+    parser.add_argument("--filas", type=int, default=5000)
+    parser.add_argument("--sesiones", type=int, default=500)
+    args = parser.parse_args()
+
+    rows = synthetic.generar_market_df(args.filas).to_dict('records')
+    n_users = len({r['user_id'] for r in rows})
+    user_ids = [(i % n_users) + 1 for i in range(args.sesiones)]
+
+    print(f"Mercado: {len(rows)} filas, {n_users} usuarios, {args.sesiones} sesiones")
+    print(f"{'enfoque':>12} {'retenido (MB)':>14} {'pico (MB)':>10} {'tiempo (s)':>11}")
+    for nombre, fn in (("por usuario", simular_legacy), ("compartido", simular_compartido)):
+        actual, pico, dt = _medir(fn, rows, user_ids)
+        print(f"{nombre:>12} {actual:>14.1f} {pico:>10.1f} {dt:>11.2f}")
+
+if __name__ == "__main__":
+    main()
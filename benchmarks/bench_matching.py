@@ -0,0 +1,66 @@
+import argparse
+import time
+import matching
+import album_bits
+from benchmarks import synthetic
+
+# --- REFERENCIA: LOOP ORIGINAL DE database.find_matches ---
+# Se conserva acá sólo para comparar resultados y tiempos.
+def find_matches_legacy(market_df, mis_tengo_set, mis_repes_set, mis_wishlist_set):
+    if market_df.empty: return [], []
+    market_df = market_df.copy()
+    directos, ventas = [], []
+    market_df['nick'] = market_df['users'].apply(lambda x: x['nick'])
+    market_df['province'] = market_df['users'].apply(lambda x: x.get('province', 'Mendoza'))
+    market_df['zone'] = market_df['users'].apply(lambda x: x['zone'])
+    market_df['phone_encrypted'] = market_df['users'].apply(lambda x: x.get('phone_encrypted', ''))
+    market_df['reputation'] = market_df['users'].apply(lambda x: x.get('reputation', 0))
+    market_df['other_id'] = market_df['users'].apply(lambda x: x.get('id', 0))
+    ofertas = market_df[market_df['status'] == 'repetida']
+    for _, row in ofertas.iterrows():
+        figu = int(row['sticker_num'])
+        if figu not in mis_tengo_set:
+            es_wishlist = figu in mis_wishlist_set
+            match = {'nick': row['nick'], 'province': row['province'], 'zone': row['zone'], 'phone_encrypted': row['phone_encrypted'], 'figu': figu, 'price': row['price'], 'reputation': row['reputation'], 'target_id': row['user_id'], 'is_wishlist': es_wishlist}
+            if row['price'] > 0: ventas.append(match)
+            else:
+                sus_tengo_df = market_df[(market_df['user_id'] == row['user_id']) & (market_df['status'] == 'tengo')]
+                sus_tengo_set = set(sus_tengo_df['sticker_num'].tolist())
+                sirven = [r for r in mis_repes_set if r not in sus_tengo_set]
+                if sirven:
+                    match['te_pide'] = sirven[0]
+                    directos.append(match)
+    directos.sort(key=lambda x: (not x['is_wishlist'], -x['reputation']))
+    ventas.sort(key=lambda x: (not x['is_wishlist'], x['price'], -x['reputation']))
+    return directos, ventas
+
+def _medir(fn, *args):
+    t0 = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - t0
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del motor de matching (legacy vs vectorizado).")
+    parser.add_argument("--tamanios", default="1000,10000,100000,1000000", help="Filas de inventario a probar.")
+    parser.add_argument("--max-legacy", type=int, default=20000, help="Tope de filas para correr el loop legacy (es cuadrático).")
+    args = parser.parse_args()
+
+    tengo, repes, wish = synthetic.generar_sets_usuario()
+    mi_inv = album_bits.InventarioBits(tengo=album_bits.mascara(tengo), repetidas=album_bits.mascara(repes), wishlist=album_bits.mascara(wish))
+    # El loop original se queda con la primera repe que le sirve al otro según el orden de
+    # iteración; el motor de bits elige la de menor número. Se le pasan las repes ordenadas
+    # para que ese orden sea el mismo y la comparación sea exacta sin tocar la referencia.
+    repes_ordenadas = sorted(repes)
+    print(f"{'filas':>10} {'legacy (s)':>12} {'vectorizado (s)':>16} {'speedup':>8}  iguales")
+    for n in [int(x) for x in args.tamanios.split(',')]:
+        df = synthetic.generar_market_df(n)
+        nuevo, t_nuevo = _medir(matching.calcular_matches, df, mi_inv)
+        if n <= args.max_legacy:
+            viejo, t_viejo = _medir(find_matches_legacy, df, tengo, repes_ordenadas, wish)
+            iguales = "sí" if viejo == nuevo else "NO"
+            print(f"{n:>10} {t_viejo:>12.3f} {t_nuevo:>16.3f} {t_viejo / t_nuevo:>7.1f}x  {iguales}")
+        else:
+            print(f"{n:>10} {'-':>12} {t_nuevo:>16.3f} {'-':>8}  -")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import notifications
+
+# --- DESPACHADOR DE NOTIFICACIONES CONTRA UN TELEGRAM FALSO ---
+# python -m benchmarks.bench_notifications --cargas 200 --chats 50 --tasa-429 0.05 --tasa-500 0.05
+# Levanta un servidor HTTP local que imita sendMessage (con latencia, 429 con retry_after y 500
+# al azar), simula una ráfaga de cargas y verifica: todo se entrega una vez, ningún chat recibe
+# más de lo que permite su bucket y el total respeta la tasa global. Reporta las métricas.
+
+class TelegramFalso(BaseHTTPRequestHandler):
+    recibidos = defaultdict(list)  # chat_id -> [instantes]
+    lock = threading.Lock()
+    latencia = 0.02
+    tasa_429 = 0.0
+    tasa_500 = 0.0
+
+    def do_POST(self):
+        datos = parse_qs(self.rfile.read(int(self.headers.get('Content-Length', 0))).decode())
+        time.sleep(self.latencia)
+        azar = random.random()
+        if azar < self.tasa_429:
+            self._responder(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 1}})
+        elif azar < self.tasa_429 + self.tasa_500:
+            self._responder(500, {"ok": False})
+        else:
+            with self.lock: self.recibidos[datos['chat_id'][0]].append(time.monotonic())
+            self._responder(200, {"ok": True})
+
+    def _responder(self, codigo, cuerpo):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(codigo)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def log_message(self, *args):
+        pass
+
+def _max_en_ventana(instantes, ventana):
+    instantes = sorted(instantes)
+    maximo, j = 0, 0
+    for i, t in enumerate(instantes):
+        while t - instantes[j] >= ventana: j += 1
+        maximo = max(maximo, i - j + 1)
+    return maximo
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del despachador de notificaciones.")
+    parser.add_argument("--cargas", type=int, default=200, help="Cargas simultáneas (cada una notifica a varios chats).")
+    parser.add_argument("--chats", type=int, default=50)
+    parser.add_argument("--chats-por-carga", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--tasa-global", type=float, default=25)
+    parser.add_argument("--tasa-chat", type=float, default=1)
+    parser.add_argument("--latencia-ms", type=float, default=20)
+    parser.add_argument("--tasa-429", type=float, default=0.05)
+    parser.add_argument("--tasa-500", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=26)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    TelegramFalso.latencia = args.latencia_ms / 1000
+    TelegramFalso.tasa_429, TelegramFalso.tasa_500 = args.tasa_429, args.tasa_500
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), TelegramFalso)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    n = notifications.Notificador("TEST", base_url=f"http://127.0.0.1:{servidor.server_port}", workers=args.workers,
+                                  tasa_global=args.tasa_global, tasa_chat=args.tasa_chat, max_reintentos=8, backoff=0.2)
+    hilos_antes = threading.active_count()
+    t0 = time.perf_counter()
+    esperados = 0
+    for c in range(args.cargas):
+        chats = random.sample(range(args.chats), args.chats_por_carga)
+        for chat in chats: n.encolar(str(chat), notifications.texto_alerta(f"user{c}", [c % 600 + 1]))
+        esperados += len(chats)
+    t_encolar = time.perf_counter() - t0
+    hilos_pico = threading.active_count() - hilos_antes
+    pendientes = n.cerrar(timeout=600)
+    total = time.perf_counter() - t0
+    servidor.shutdown()
+
+    recibidos = TelegramFalso.recibidos
+    entregados = sum(len(v) for v in recibidos.values())
+    todos = [t for v in recibidos.values() for t in v]
+    pico_chat = max((_max_en_ventana(v, 1.0) for v in recibidos.values()), default=0)
+    pico_global = _max_en_ventana(todos, 1.0)
+    print(f"mensajes: {esperados} encolados en {t_encolar * 1000:.1f}ms | hilos nuevos: {hilos_pico} | entregados: {entregados} en {total:.1f}s")
+    print(f"máx por chat en 1s: {pico_chat} (bucket: {args.tasa_chat:g}/s) | máx global en 1s: {pico_global} (bucket: {args.tasa_global:g}/s + ráfaga)")
+    for k, v in n.metricas().items(): print(f"{k:>16}: {v}")
+    assert pendientes == 0 and entregados + n.fallidos == esperados, "Se perdieron mensajes"
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import random
+import time
+from datetime import datetime, timedelta, timezone
+import rollups
+
+# --- ROLLUPS DE ACTIVIDAD: THROUGHPUT Y COMPACTACIÓN ---
+# python -m benchmarks.bench_rollups --eventos 1000000 --semanas 8
+# Pliega eventos sintéticos (desbloqueos, solicitudes y votos repartidos en N semanas) en
+# tramos de --lote filas, como el job, y reporta filas/s, cuántas filas de rollup quedan y
+# cuántas lee el gráfico diario del admin frente a las filas crudas que recorría antes.
+
+PROVINCIAS = ["Buenos Aires", "Córdoba", "Santa Fe", "Mendoza", "Tucumán", "Salta", "Neuquén", "Chubut"]
+
+def generar(fuente, n, semanas, usuarios, rng):
+    ahora = datetime.now(timezone.utc)
+    for i in range(1, n + 1):
+        row = {"id": i, "created_at": (ahora - timedelta(seconds=rng.uniform(0, semanas * 7 * 86400))).isoformat(),
+               "user_id": rng.randrange(usuarios), "sender_id": rng.randrange(usuarios), "target_id": rng.randrange(usuarios)}
+        if fuente == 'transaction_requests':
+            row.update(type=rng.choice(("exchange", "purchase")), status=rng.choice(("pending", "accepted")),
+                       fig_sent=rng.randint(1, 980), fig_received=rng.randint(1, 980))
+        yield row
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del plegado de rollups.")
+    parser.add_argument("--eventos", type=int, default=1_000_000, help="Total entre las tres fuentes.")
+    parser.add_argument("--semanas", type=int, default=8)
+    parser.add_argument("--usuarios", type=int, default=50_000)
+    parser.add_argument("--lote", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=26)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    provincias = {u: PROVINCIAS[u % len(PROVINCIAS)] for u in range(args.usuarios)}
+    reparto = {'contact_logs': 0.6, 'transaction_requests': 0.3, 'votes': 0.1}
+    guardadas, pendientes, t_total = {}, 0, 0.0
+    for fuente, parte in reparto.items():
+        rows = list(generar(fuente, int(args.eventos * parte), args.semanas, args.usuarios, rng))
+        t0 = time.perf_counter()
+        for i in range(0, len(rows), args.lote):
+            plegado = rollups.Plegado()
+            pendientes += len(rollups.plegar(fuente, rows[i:i + args.lote], provincias, plegado))
+            for fila in plegado.filas():  # Lo que haría fold_rollups: sumar por clave
+                clave = tuple(fila[k] for k in ('granularity', 'bucket', 'dimension', 'key', 'metric'))
+                guardadas[clave] = guardadas.get(clave, 0) + fila['value']
+        t = time.perf_counter() - t0
+        t_total += t
+        print(f"{fuente:>22}: {len(rows)} filas en {t:.1f}s ({len(rows) / t:,.0f} filas/s)")
+
+    por_tipo = {}
+    for g, _, d, _, _ in guardadas: por_tipo[(g, d)] = por_tipo.get((g, d), 0) + 1
+    grafico = por_tipo.get(('d', 'total'), 0)
+    print(f"total: {args.eventos} eventos en {t_total:.1f}s | {len(guardadas)} filas de rollup | {pendientes} solicitudes pendientes")
+    print("filas por (granularidad, dimensión):", dict(sorted(por_tipo.items())))
+    print(f"gráfico diario de {args.semanas} semanas: lee {grafico} filas (antes: {args.eventos} crudas)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import os
+import time
+import numpy as np
+
+os.environ.setdefault("FIGUS_BACKEND", "local")
+
+import album_bits
+import graph_engine
+import triangulation
+from benchmarks import synthetic
+
+# --- MOTOR DE GRAFOS vs RPC find_triangulations (backend local) ---
+# python -m benchmarks.bench_triangulation --usuarios 1000,10000 --muestras 20 --top-k 20
+# Para cada escala: arma el grafo una vez y busca, para una muestra de usuarios de zonas
+# pobladas, las mejores top-k triangulaciones de una figurita de su wishlist por los dos caminos.
+# Verifica que ambos devuelvan el mismo ranking (los empates pueden salir en otro orden).
+
+def _clave(c):
+    return (c['bridge_id'], c['target_id'], c['bridge_quiere'], c['bridge_tiene'], c['target_tiene'])
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de triangulación: motor de grafos vs RPC.")
+    parser.add_argument("--usuarios", default="1000,10000")
+    parser.add_argument("--muestras", type=int, default=20, help="Búsquedas por escala.")
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--alcance", default="zona", choices=graph_engine.ALCANCES)
+    parser.add_argument("--seed", type=int, default=26)
+    args = parser.parse_args()
+    import database as db
+
+    print(f"{'usuarios':>9} {'filas':>10} {'build grafo':>12} {'grafo/búsq':>12} {'rpc/búsq':>12} {'cadenas':>9}")
+    for n in [int(x) for x in args.usuarios.split(',')]:
+        mercado = synthetic.generar_mercado(n, seed=args.seed)
+        market_df = mercado.market_df()
+        mercado.cargar_en(db.supabase)
+
+        t0 = time.perf_counter()
+        grafo = graph_engine.GrafoMercado(market_df)
+        t_build = time.perf_counter() - t0
+
+        # Usuarios con repes y wishlist, priorizando las zonas más pobladas
+        tamanio_zona = np.bincount(grafo.zona)[grafo.zona]
+        candidatos = np.argsort(-tamanio_zona, kind='stable').tolist()
+        casos = []
+        for i in candidatos:
+            if grafo.repetidas[i] and grafo.wishlist[i]:
+                casos.append((int(grafo.uids[i]), album_bits.menor(grafo.wishlist[i])))
+            if len(casos) >= args.muestras: break
+
+        t_grafo = t_rpc = 0.0
+        cadenas = 0
+        reputacion = {u['id']: u['reputation'] for u in mercado.users}
+        zona = {u['id']: u['zone'] for u in mercado.users}
+        for uid, figu in casos:
+            t0 = time.perf_counter()
+            por_grafo = grafo.triangulaciones(uid, figu, args.alcance, args.top_k)
+            t_grafo += time.perf_counter() - t0
+            t0 = time.perf_counter()
+            filas = db.get_triangulations_sql(uid, figu, args.alcance, args.top_k)
+            por_rpc = [triangulation._formatear_fila_sql(r) for r in filas]
+            t_rpc += time.perf_counter() - t0
+
+            def costo(c):
+                fuera = (zona[c['bridge_id']] != zona[uid]) + (zona[c['target_id']] != zona[uid])
+                return (fuera, -(reputacion[c['bridge_id']] + reputacion[c['target_id']]))
+            assert [costo(c) for c in por_grafo] == [costo(c) for c in por_rpc], f"Distinto ranking para {uid} / #{figu}"
+            if len(por_grafo) < args.top_k:
+                assert sorted(map(_clave, por_grafo)) == sorted(map(_clave, por_rpc)), f"Distinto resultado para {uid} / #{figu}"
+            cadenas += len(por_grafo)
+        k = max(len(casos), 1)
+        print(f"{n:>9} {mercado.filas:>10} {t_build:>11.3f}s {t_grafo / k * 1000:>10.2f}ms {t_rpc / k * 1000:>10.2f}ms {cadenas:>9}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import random
+import statistics
+import time
+import resource
+import user_search
+
+# --- BÚSQUEDA DE USUARIOS DEL ADMIN: ARMADO Y LATENCIA ---
+# python -m benchmarks.bench_user_search --usuarios 1000000
+# Arma el índice con usuarios sintéticos (nicks con acentos y mayúsculas, zonas y provincias
+# de un vocabulario chico), mide el armado y la memoria del proceso, y reporta p50/p95 de consultas
+# típicas del admin. Verifica cada resultado contra un recorrido lineal en una muestra.
+
+NOMBRES = ["Martín", "Lucía", "Juan", "Sofía", "Ramón", "Agustina", "Nicolás", "Valentina", "Tomás", "Camila",
+           "Ezequiel", "Florencia", "Matías", "Belén", "Gonzalo", "Julieta", "Ignacio", "Rocío", "Facundo", "Milagros"]
+SUFIJOS = ["", "_figus", "10", "Colecciona", "Qatar", "_ok", "Messi", "Albiceleste"]
+PROVINCIAS = ["Buenos Aires", "Córdoba", "Santa Fe", "Mendoza", "Tucumán", "Entre Ríos", "Salta", "Neuquén",
+              "Río Negro", "Chubut", "Misiones", "Corrientes", "San Juan", "Jujuy", "Santiago del Estero"]
+
+def generar_usuarios(n, seed=26):
+    rng = random.Random(seed)
+    zonas = {p: [f"{p[:3]} Zona {i}" for i in range(40)] + ["Capital", "Centro", "Norte"] for p in PROVINCIAS}
+    for uid in range(1, n + 1):
+        prov = rng.choice(PROVINCIAS)
+        yield {"id": uid, "nick": f"{rng.choice(NOMBRES)}{rng.choice(SUFIJOS)}{uid}",
+               "province": prov, "zone": rng.choice(zonas[prov])}
+
+def lineal(filas, texto):
+    palabras = user_search.normalizar(texto).split()
+    res = set()
+    for r in filas:
+        campos = [user_search.normalizar(r[k]) for k in ("nick", "zone", "province")] + [str(r["id"])]
+        if all(any(p in c for c in campos) for p in palabras): res.add(r["id"])
+    return res
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del índice de búsqueda de usuarios.")
+    parser.add_argument("--usuarios", type=int, default=1_000_000)
+    parser.add_argument("--consultas", type=int, default=200)
+    parser.add_argument("--limite", type=int, default=50)
+    parser.add_argument("--muestra", type=int, default=20_000, help="Usuarios del índice chico que se verifica contra el recorrido lineal.")
+    parser.add_argument("--seed", type=int, default=26)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    consultas = (["martin", "Lucía", "juan_fig", "sofia10", "tomas qatar", "cordoba", "rio", "entre rios capital",
+                  "ez", "m", "belen messi", "zona 12", "santiago", "xyzxyz"]
+                 + [str(rng.randint(1, args.usuarios)) for _ in range(6)]
+                 + [f"{rng.choice(NOMBRES)}{rng.choice(SUFIJOS)}{rng.randint(1, args.usuarios)}" for _ in range(10)])
+
+    # Correctitud: en un índice chico, lo encontrado es exactamente lo que encuentra el recorrido
+    # lineal cuando no se llega al límite, y un subconjunto cuando sí
+    filas = list(generar_usuarios(args.muestra, args.seed))
+    chico = user_search.IndiceUsuarios(lambda: filas, lambda _: [], sync=10 ** 9)
+    chico.construir()
+    for q in consultas:
+        ids, esperado = chico.buscar(q, args.limite), lineal(filas, q)
+        assert len(ids) == len(set(ids)) and set(ids) <= esperado, f"Resultado de más: {q!r}"
+        assert len(ids) == min(args.limite, len(esperado)), f"Faltan resultados: {q!r}"
+
+    t0 = time.perf_counter()
+    indice = user_search.IndiceUsuarios(lambda: generar_usuarios(args.usuarios, args.seed), lambda _: [], sync=10 ** 9)
+    indice.construir()
+    armado = time.perf_counter() - t0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"índice de {args.usuarios} usuarios armado en {armado:.1f}s | RSS máx del proceso {rss:.0f} MiB | {indice.stats()}")
+
+    tiempos = []
+    for i in range(args.consultas):
+        q = consultas[i % len(consultas)]
+        t0 = time.perf_counter()
+        indice.buscar(q, args.limite)
+        tiempos.append((time.perf_counter() - t0) * 1000)
+    tiempos.sort()
+    p95 = tiempos[int(len(tiempos) * 0.95) - 1]
+    print(f"{args.consultas} consultas: p50 {statistics.median(tiempos):.2f}ms | p95 {p95:.2f}ms | máx {tiempos[-1]:.2f}ms")
+    for q in ("martin", "cordoba", "tomas qatar", str(args.usuarios // 2)):
+        print(f"  {q!r}: {indice.buscar(q, 3)}")
+
+if __name__ == "__main__":
+    main()
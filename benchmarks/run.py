@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+# El backend local se elige ANTES de importar database (la conexión se arma al importar)
+os.environ.setdefault("FIGUS_BACKEND", "local")
+
+import pandas as pd
+import album_bits
+import config
+import database as db
+import graph_engine
+import matching
+import triangulation
+import utils
+from benchmarks import synthetic
+
+# --- SUITE DE BENCHMARKS DE LOS CAMINOS CALIENTES ---
+# python -m benchmarks.run --usuarios 1000,10000,100000 --out bench.json
+# Genera un mercado sintético sembrado por escala, lo carga en el backend local y mide
+# tiempo (mediana de N repeticiones) y pico de memoria (tracemalloc, en una corrida aparte).
+# La primera corrida de cada caso (precalentamiento) se reporta aparte como seg_frio: incluye la
+# carga del mercado y el armado del grafo, y con pocas repeticiones inflaba la mediana.
+# El JSON es estable para poder diffear entre releases.
+# El backend local guarda dicts en memoria: por encima de --max-usuarios-backend (100k usuarios
+# son ~13M filas) no se carga, y matching y triangulación se miden directo sobre el DataFrame
+# sintético (el mismo motor de grafos que usa la app, sin pasar por database ni por el cache).
+# Los guardados (save_inventory_positive, process_csv_upload) sólo se miden con backend.
+
+def medir(fn, repeticiones):
+    t0 = time.perf_counter()
+    fn()
+    frio = time.perf_counter() - t0
+    tiempos = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        tiempos.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    fn()
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seg_frio": round(frio, 6), "seg_mediana": round(statistics.median(tiempos), 6), "seg_min": round(min(tiempos), 6),
+            "mem_pico_mb": round(pico / 2**20, 3), "repeticiones": repeticiones}
+
+def _usuario_de_muestra(mercado, market_df):
+    """El usuario con más repetidas de la zona más poblada: el caso más caro para matching y triangulación."""
+    zonas = Counter((u['province'], u['zone']) for u in mercado.users)
+    zona = zonas.most_common(1)[0][0]
+    vecinos = {u['id'] for u in mercado.users if (u['province'], u['zone']) == zona}
+    repes = market_df[(market_df['status'] == 'repetida') & market_df['user_id'].isin(vecinos)].groupby('user_id').size()
+    uid = int(repes.idxmax())
+    return next(u for u in mercado.users if u['id'] == uid)
+
+def casos_por_escala(mercado, repeticiones, con_backend=True):
+    """Casos medidos a una escala. Sin backend sólo se mide lo que corre sobre el DataFrame del mercado."""
+    market_df = mercado.market_df()
+    user = _usuario_de_muestra(mercado, market_df)
+    uid = user['id']
+    if not con_backend:
+        mi_inv = album_bits.desde_filas(market_df[market_df['user_id'] == uid].to_dict('records'))
+        wish = album_bits.ids(mi_inv.wishlist)
+        objetivo = wish[0] if wish else 1
+        grafo = graph_engine.GrafoMercado(market_df)
+        return {
+            "find_matches": lambda: matching.calcular_matches(market_df, mi_inv, excluir_user_id=uid),
+            "grafo_mercado": lambda: graph_engine.GrafoMercado(market_df),
+            "buscar_triangulacion": lambda: grafo.triangulaciones(uid, objetivo, "zona", config.TRIANGULACION_TOP_K),
+            "triangular_wishlist": lambda: grafo.mejores_por_figurita(uid, alcance="zona"),
+        }
+
+    mercado.cargar_en(db.supabase)
+    db.nuevo_rerun()
+    mi_inv = db.get_inventory_bits(uid)
+    wish = album_bits.ids(mi_inv.wishlist)
+    repes = album_bits.ids(mi_inv.repetidas)
+    objetivo = wish[0] if wish else 1
+    start, end = next(iter(config.ALBUM_PAGES.values()))
+
+    def guardar_pagina():
+        # Guardado con un cambio chico (una pill), como en el uso real
+        db.nuevo_rerun()
+        tengo, wish_pag, repes_info, _ = db.get_inventory_status(uid, start, end)
+        tengo = sorted(set(tengo) ^ {start})
+        repe_df = pd.DataFrame([{"Figurita": n, "Cantidad": i['quantity'], "Modo": "🔄 Canje", "Precio": 0}
+                                for n, i in repes_info.items() if n in tengo])
+        db.save_inventory_positive(uid, start, end, tengo, [w for w in wish_pag if w not in tengo], repe_df)
+
+    def sin_cache(fn):
+        # buscar_triangulacion / triangular_wishlist pasan por el cache compartido: se vacía en
+        # cada repetición para medir el cálculo y no un hit
+        def medido():
+            db.get_triangulation_cache().vaciar()
+            return fn()
+        return medido
+
+    csv_df = pd.DataFrame({"num": list(range(start, end + 1)), "status": ["tengo"] * (end - start + 1), "price": [0] * (end - start + 1)})
+
+    return {
+        "find_matches": lambda: matching.calcular_matches(market_df, mi_inv, excluir_user_id=uid),
+        "buscar_triangulacion": sin_cache(lambda: triangulation.buscar_triangulacion(user, objetivo, repes)),
+        "triangular_wishlist": sin_cache(lambda: triangulation.triangular_wishlist(user)),
+        "save_inventory_positive": guardar_pagina,
+        "process_csv_upload": lambda: db.process_csv_upload(csv_df.copy(), uid),
+    }
+
+def casos_sin_escala():
+    texto = ", ".join(f"{i}-{i + 3}" for i in range(1, 200, 5)) + "\n" + " ".join(str(i) for i in range(1, 200, 2))
+    return {"parse_smart_input": lambda: utils.parse_smart_input(texto, 1, 200)}
+
+def _commit():
+    try: return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip() or None
+    except Exception: return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks de los caminos calientes sobre mercados sintéticos.")
+    parser.add_argument("--usuarios", default="1000,10000,100000", help="Escalas (cantidad de usuarios).")
+    parser.add_argument("--seed", type=int, default=26)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument("--max-usuarios-backend", type=int, default=20000,
+                        help="Por encima de esta escala no se carga el backend local (sólo casos sobre el DataFrame).")
+    parser.add_argument("--casos", default="", help="Filtrar casos (separados por coma). Vacío = todos.")
+    parser.add_argument("--out", default="", help="Ruta del reporte JSON.")
+    args = parser.parse_args()
+    filtro = {c for c in args.casos.split(',') if c}
+
+    reporte = {
+        "meta": {"fecha": datetime.now().isoformat(timespec='seconds'), "commit": _commit(), "seed": args.seed,
+                 "python": platform.python_version(), "maquina": platform.machine(), "backend": db.BACKEND},
+        "resultados": [],
+    }
+
+    def correr(casos, escala, extra):
+        for nombre, fn in casos.items():
+            if filtro and nombre not in filtro: continue
+            res = dict({"caso": nombre, "usuarios": escala}, **extra, **medir(fn, args.repeticiones))
+            reporte["resultados"].append(res)
+            print(f"{nombre:>24} {str(escala):>8} {res['seg_frio'] * 1000:>10.2f} ms {res['seg_mediana'] * 1000:>10.2f} ms {res['mem_pico_mb']:>9.2f} MB")
+
+    print(f"{'caso':>24} {'usuarios':>8} {'frío':>13} {'mediana':>13} {'pico mem':>12}")
+    correr(casos_sin_escala(), None, {})
+    for n in [int(x) for x in args.usuarios.split(',')]:
+        mercado = synthetic.generar_mercado(n, seed=args.seed)
+        con_backend = n <= args.max_usuarios_backend
+        correr(casos_por_escala(mercado, args.repeticiones, con_backend), n,
+               {"filas_inventario": mercado.filas, "backend_cargado": con_backend})
+        del mercado
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(reporte, f, indent=2, ensure_ascii=False)
+        print(f"Reporte: {args.out}")
+
+if __name__ == "__main__":
+    main()
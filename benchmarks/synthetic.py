@@ -0,0 +1,161 @@
+import random
+from datetime import date
+import numpy as np
+import pandas as pd
+import config
+import locations
+import utils
+
+# --- GENERADOR DE MERCADO SINTÉTICO ---
+# Arma un DataFrame con la misma forma que devuelve database.fetch_market
+# (filas de inventory + dict anidado 'users'), sin tocar la base.
+
+def generar_market_df(n_filas, album_size=200, seed=26):
+    """Genera ~n_filas de inventario repartidas entre usuarios de ~album_size/2 filas cada uno."""
+    rng = random.Random(seed)
+    filas_por_usuario = max(1, album_size // 2)
+    n_users = max(1, n_filas // filas_por_usuario)
+    rows = []
+    row_id = 1
+    for uid in range(1, n_users + 1):
+        u_data = {
+            'id': uid, 'nick': f"user{uid}", 'province': 'Mendoza', 'zone': 'Capital',
+            'phone_encrypted': str(2604000000 + uid), 'reputation': rng.randint(0, 20)
+        }
+        for num in rng.sample(range(1, album_size + 1), filas_por_usuario):
+            r = rng.random()
+            if r < 0.6: status, price = 'tengo', 0
+            elif r < 0.8: status, price = 'repetida', rng.choice([0, 0, 0, 500, 1000])
+            else: status, price = 'wishlist', 0
+            rows.append({'id': row_id, 'user_id': uid, 'sticker_num': num, 'status': status,
+                         'price': price, 'quantity': 1, 'users': u_data})
+            row_id += 1
+            if len(rows) >= n_filas: break
+        if len(rows) >= n_filas: break
+    return pd.DataFrame(rows)
+
+def generar_sets_usuario(album_size=200, seed=7):
+    """Sets (tengo, repes, wishlist) de un usuario 'yo' típico."""
+    rng = random.Random(seed)
+    nums = list(range(1, album_size + 1))
+    rng.shuffle(nums)
+    tengo = set(nums[:album_size // 2])
+    repes = set(rng.sample(sorted(tengo), max(1, album_size // 10)))
+    wishlist = set(nums[album_size // 2: album_size // 2 + album_size // 5])
+    return tengo, repes, wishlist
+
+# --- MERCADO REALISTA (SEMBRADO) ---
+# Usuarios repartidos en provincias/zonas de locations.ARGENTINA (zipf por zona), escasez de figuritas
+# con ley de potencias (unas pocas muy comunes, muchas difíciles) y proporciones
+# configurables de repetidas y wishlist sobre config.ALBUM_PAGES.
+# Se genera por columnas (NumPy) para poder llegar a 100k usuarios sin armar millones de dicts.
+
+STATUS = ('tengo', 'repetida', 'wishlist')
+
+class MercadoSintetico:
+    def __init__(self, users, user_id, sticker_num, status, price, quantity):
+        self.users = users                  # lista de filas de 'users'
+        self.user_id = user_id              # arrays NumPy, una posición por fila de inventory
+        self.sticker_num = sticker_num
+        self.status = status                # índice en STATUS
+        self.price = price
+        self.quantity = quantity
+
+    @property
+    def filas(self):
+        return len(self.user_id)
+
+    def filas_inventario(self):
+        """Filas de inventory como dicts (generador: no las materializa todas juntas)."""
+        for i in range(self.filas):
+            yield {'id': i + 1, 'user_id': int(self.user_id[i]), 'sticker_num': int(self.sticker_num[i]),
+                   'status': STATUS[self.status[i]], 'price': int(self.price[i]), 'quantity': int(self.quantity[i])}
+
+    def market_df(self):
+        """Mismo formato que database.fetch_market (con el dict 'users' anidado, compartido por usuario)."""
+        anidados = {u['id']: {k: u[k] for k in ('nick', 'province', 'zone', 'phone_encrypted', 'reputation')} for u in self.users}
+        return pd.DataFrame({
+            'id': np.arange(1, self.filas + 1),
+            'user_id': self.user_id,
+            'sticker_num': self.sticker_num,
+            'status': np.array(STATUS, dtype=object)[self.status],
+            'price': self.price,
+            'quantity': self.quantity,
+            'users': [anidados[int(u)] for u in self.user_id],
+        })
+
+    def cargar_en(self, cliente):
+        """Carga users + inventory en un local_backend.LocalClient."""
+        cliente.cargar({'users': self.users, 'inventory': list(self.filas_inventario())})
+
+def _pesos_escasez(album_size, alpha, rng):
+    """Peso de cada figurita (índice = número) según una ley de potencias sobre un ranking al azar."""
+    ranking = rng.permutation(album_size) + 1
+    pesos = np.zeros(album_size + 1)
+    pesos[1:] = 1.0 / ranking ** alpha
+    return pesos
+
+def generar_mercado(n_users, seed=26, provincias=None, alpha=1.0, alpha_zonas=1.0, owned_range=(0.1, 0.7),
+                    dup_ratio=0.15, wish_ratio=0.3, venta_ratio=0.2, premium_ratio=0.1, bloque=5000):
+    """
+    Mercado sintético reproducible (mismo seed -> mismo mercado).
+    - alpha_zonas: concentración geográfica (zipf sobre las zonas; 0 = uniforme).
+    - owned_range: fracción del álbum que pegó cada usuario (uniforme en el rango).
+    - dup_ratio: probabilidad media de que una pegada esté repetida (más alta en las comunes).
+    - wish_ratio: fracción de las faltantes que el usuario marca en la wishlist.
+    - venta_ratio: fracción de repetidas publicadas con precio.
+    """
+    rng = np.random.default_rng(seed)
+    album_size = max(fin for _, fin in config.ALBUM_PAGES.values())
+    pesos = _pesos_escasez(album_size, alpha, rng)
+    comunidad = pesos[1:] / pesos[1:].mean()
+
+    # Pocas zonas grandes concentran a la mayoría de los usuarios (como las ciudades reales)
+    zonas = [(p, z) for p in (provincias or locations.ARGENTINA.keys()) for z in locations.ARGENTINA[p]]
+    peso_zona = 1.0 / rng.permutation(np.arange(1, len(zonas) + 1)) ** alpha_zonas
+    zona_idx = rng.choice(len(zonas), size=n_users, p=peso_zona / peso_zona.sum())
+
+    users = []
+    for uid in range(1, n_users + 1):
+        prov, zona = zonas[zona_idx[uid - 1]]
+        premium = bool(rng.random() < premium_ratio)
+        phone = str(2600000000 + uid)
+        users.append({
+            'id': uid, 'nick': f"coleccionista{uid}", 'province': prov, 'zone': zona,
+            'phone_hash': utils.hash_phone_searchable(phone), 'phone_encrypted': utils.encrypt_phone(phone),
+            'password': utils.hash_password("figus"), 'reputation': int(rng.geometric(0.3) - 1),
+            'is_premium': premium, 'is_admin': False,
+            'telegram_chat_id': str(100000 + uid) if premium and rng.random() < 0.5 else None,
+            'daily_contacts_count': 0, 'last_contact_date': str(date.today()),
+        })
+
+    cols = {k: [] for k in ('user_id', 'sticker_num', 'status', 'price', 'quantity')}
+    log_pesos = np.log(pesos[1:])
+    for inicio in range(0, n_users, bloque):
+        n = min(bloque, n_users - inicio)
+        uids = np.arange(inicio + 1, inicio + n + 1)
+        # Gumbel top-k: muestreo ponderado sin reposición de las figuritas pegadas
+        claves = log_pesos + rng.gumbel(size=(n, album_size))
+        k = (rng.uniform(*owned_range, size=n) * album_size).astype(int)
+        orden = np.argsort(-claves, axis=1)
+        rango = np.empty_like(orden)
+        np.put_along_axis(rango, orden, np.arange(album_size)[None, :].repeat(n, axis=0), axis=1)
+        pegadas = rango < k[:, None]
+        repes = pegadas & (rng.random((n, album_size)) < np.clip(dup_ratio * comunidad, 0, 0.95))
+        deseo = ~pegadas & (rng.random((n, album_size)) < wish_ratio)
+        for codigo, mascara in ((0, pegadas), (1, repes), (2, deseo)):
+            filas, stickers = np.nonzero(mascara)
+            cols['user_id'].append(uids[filas])
+            cols['sticker_num'].append(stickers + 1)
+            cols['status'].append(np.full(len(filas), codigo, dtype=np.int8))
+            if codigo == 1:
+                en_venta = rng.random(len(filas)) < venta_ratio
+                cols['price'].append(np.where(en_venta, rng.choice([300, 500, 1000], size=len(filas)), 0))
+                cols['quantity'].append(rng.integers(1, 4, size=len(filas)))
+            else:
+                cols['price'].append(np.zeros(len(filas), dtype=np.int64))
+                cols['quantity'].append(np.ones(len(filas), dtype=np.int64))
+
+    arr = {k: np.concatenate(v) if v else np.array([], dtype=np.int64) for k, v in cols.items()}
+    orden = np.lexsort((arr['status'], arr['sticker_num'], arr['user_id']))
+    return MercadoSintetico(users, *(arr[k][orden] for k in ('user_id', 'sticker_num', 'status', 'price', 'quantity')))
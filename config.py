@@ -3,6 +3,7 @@ import streamlit as st
 
 # Configuración General
 PRECIO_PREMIUM = 5000 
+CREDITOS_DIARIOS = 1  # Contactos gratis por día (los premium no tienen límite)
 MP_LINK = "https://mpago.la/1DR8e6S" # Tu link real aquí
 
 # Obtener ADMIN_PHONE de forma segura
@@ -13,6 +14,22 @@ if not ADMIN_PHONE:
     except:
         ADMIN_PHONE = "0000000000" # Valor dummy para que no rompa si falta
 
+# Modo diagnóstico: muestra métricas internas (ej: consultas a la base por rerun)
+DEBUG = os.environ.get("FIGUS_DEBUG") == "1"
+
+# Motor de triangulación: "grafo" (en proceso, graph_engine.py) o "sql" (RPC find_triangulations)
+TRIANGULACION_MOTOR = os.environ.get("FIGUS_TRIANGULACION", "grafo").lower()
+TRIANGULACION_TOP_K = 20  # Cadenas que se muestran por búsqueda (las mejores)
+# Cadenas de 4 y 5 partes (graph_engine.GrafoMercado.ciclos): tope de largo y presupuesto por búsqueda
+CICLOS_K_MAX = 5
+CICLOS_PRESUPUESTO_MS = 300
+CICLOS_MAX_NODOS = 50000
+# Cache de triangulaciones entre sesiones: segundos hasta ver cadenas nuevas de cargas de terceros
+TRIANGULACION_CACHE_TTL = 600
+# Calentamiento del cache: premium encolados al arrancar y figuritas sueltas por premium
+TRIANGULACION_CALENTAR_INICIAL = 200
+TRIANGULACION_CALENTAR_POR_USUARIO = 10
+
 # --- TELEGRAM (SEGURO) ---
 # Leemos el token desde los secretos de Streamlit para no exponerlo en GitHub.
 # Si estás en local, asegurate de tenerlo en .streamlit/secrets.toml
@@ -22,6 +39,36 @@ except Exception:
     # Valor por defecto para evitar que la app crashee si no hay secrets configurados
     TELEGRAM_BOT_TOKEN = "TOKEN_NO_CONFIGURADO"
 
+# API de Telegram (se puede apuntar a un servidor falso para pruebas) y despachador de alertas (notifications.py)
+TELEGRAM_API_URL = os.environ.get("FIGUS_TELEGRAM_API", "https://api.telegram.org")
+NOTIF_WORKERS = 4           # Hilos del pool de envío (fijo, no uno por carga)
+NOTIF_MAX_COLA = 10000      # Mensajes en memoria; si se llena se descartan (y se cuentan)
+NOTIF_TASA_GLOBAL = 25      # Mensajes por segundo del bot (Telegram corta cerca de 30)
+NOTIF_TASA_CHAT = 1         # Mensajes por segundo a un mismo chat
+NOTIF_MAX_REINTENTOS = 5
+# Resumen por chat: segundos que se juntan alertas antes de mandar un solo mensaje (0 = al instante)
+NOTIF_DIGEST_SEG = int(os.environ.get("FIGUS_NOTIF_DIGEST", "120"))
+# Outbox durable: cada cuánto se revisan pendientes y hasta qué antigüedad (días) vale la pena mandarlas
+OUTBOX_INTERVALO = 30
+OUTBOX_MAX_DIAS = 2
+
+# Métricas del admin (admin_metrics.py): recálculo completo automático para corregir deriva
+METRICAS_RECALCULO_SEG = 6 * 3600
+
+# Series de actividad (rollups.py): cada cuánto se pliega, filas por tramo, días que se guardan
+# las cubetas horarias y offset de la hora local (Argentina, sin horario de verano)
+ROLLUP_INTERVALO = 300
+ROLLUP_LOTE = 1000
+ROLLUP_HORAS_DIAS = 14
+ROLLUP_UTC_OFFSET = -3
+
+# Mantenimiento por lotes (maintenance.py): carpeta de archivos y checkpoints, filas por lote,
+# pausa entre lotes y antigüedad a partir de la cual se archivan los desbloqueos
+MANTENIMIENTO_DIR = os.environ.get("FIGUS_ARCHIVO", "archivo")
+MANTENIMIENTO_LOTE = 500
+MANTENIMIENTO_PAUSA = 0.2
+MANTENIMIENTO_CONTACTOS_DIAS = 90
+
 # --- DATOS DEL ÁLBUM (Mundial 2026) ---
 # Estructura: "NOMBRE_PAIS": (ID_INICIAL, ID_FINAL)
 ALBUM_PAGES = {
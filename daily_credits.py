@@ -0,0 +1,33 @@
+from datetime import date
+
+# --- CRÉDITOS DIARIOS (SIN ESCRITURA AL LEER) ---
+# Cada usuario guarda (last_contact_date, daily_contacts_count): cuántos contactos desbloqueó
+# ese día. Los créditos de hoy se derivan al leer: si la fecha no es hoy, lleva 0 usados.
+# No hay reset diario (ni por login ni global): el día nuevo empieza solo.
+# Consumir es atómico en la base (consume_daily_credit, sql/007_daily_credits.sql).
+
+def usados_hoy(user, hoy=None):
+    if not user: return 0
+    hoy = str(hoy or date.today())
+    if str(user.get('last_contact_date') or '')[:10] != hoy: return 0
+    return int(user.get('daily_contacts_count') or 0)
+
+def restantes(user, limite, hoy=None):
+    """Créditos que le quedan hoy (None = sin límite, premium)."""
+    if user and user.get('is_premium', False): return None
+    return max(limite - usados_hoy(user, hoy), 0)
+
+# --- VERSIÓN LOCAL DE consume_daily_credit ---
+def consume_daily_credit(tablas, p_user_id, p_today, p_limit):
+    users = tablas.get('users', [])
+    i = next((i for i, u in enumerate(users) if u['id'] == p_user_id), None)
+    if i is None: return {'ok': False, 'usados': 0, 'error': 'Usuario no encontrado.'}
+    if users[i].get('is_premium'): return {'ok': True, 'usados': 0, 'error': None}
+    usados = usados_hoy(users[i], p_today)
+    if usados >= p_limit: return {'ok': False, 'usados': p_limit, 'error': 'Te quedaste sin créditos por hoy.'}
+    # Fila nueva (no se modifica la original): el backend la publica como cambio
+    users[i] = dict(users[i], daily_contacts_count=usados + 1, last_contact_date=str(p_today))
+    return {'ok': True, 'usados': usados + 1, 'error': None}
+
+PROCEDIMIENTOS = {'consume_daily_credit': consume_daily_credit}
+TABLAS = {'consume_daily_credit': ('users',)}
@@ -2,10 +2,24 @@ import streamlit as st
 import pandas as pd
 from supabase import create_client, Client
 import mercadopago
-from datetime import date
+from datetime import date, datetime, timedelta, timezone
 import time
 import config 
 import utils
+import notifications
+import matching
+import album_bits
+import market_cache
+import graph_engine
+import triangulation_cache
+import premium_index
+import admin_metrics
+import user_search
+import rollups
+import daily_credits
+import maintenance
+import inventory_diff
+import local_backend
 import os
 
 # --- HELPER PARA GESTIONAR SECRETOS ---
@@ -22,21 +36,31 @@ def get_secret(key_name):
         return None
 
 # --- CONEXIÓN ---
-try:
-    url = get_secret("SUPABASE_URL")
-    key = get_secret("SUPABASE_KEY")
-    mp_token = get_secret("MP_ACCESS_TOKEN")
-
-    # Validación explícita para saber qué falta
-    if not url: raise Exception("Falta la variable SUPABASE_URL")
-    if not key: raise Exception("Falta la variable SUPABASE_KEY")
-    if not mp_token: raise Exception("Falta la variable MP_ACCESS_TOKEN")
-
-    supabase: Client = create_client(url, key)
-    sdk = mercadopago.SDK(mp_token)
-except Exception as e:
-    st.error(f"Error de Configuración: {e}")
-    st.stop()
+# Backend de datos intercambiable: cualquier objeto con la interfaz del cliente de Supabase
+# que usa este módulo (.table(...) con select/insert/update/upsert/delete + filtros, y .rpc()).
+#   FIGUS_BACKEND=supabase (default) -> proyecto real de Supabase (requiere secretos)
+#   FIGUS_BACKEND=local              -> local_backend.LocalClient, en memoria y sin red
+BACKEND = (get_secret("FIGUS_BACKEND") or "supabase").lower()
+
+if BACKEND == "local":
+    supabase = local_backend.crear_cliente()
+    sdk = None  # Sin Mercado Pago: verificar_pago_mp responde error
+else:
+    try:
+        url = get_secret("SUPABASE_URL")
+        key = get_secret("SUPABASE_KEY")
+        mp_token = get_secret("MP_ACCESS_TOKEN")
+
+        # Validación explícita para saber qué falta
+        if not url: raise Exception("Falta la variable SUPABASE_URL")
+        if not key: raise Exception("Falta la variable SUPABASE_KEY")
+        if not mp_token: raise Exception("Falta la variable MP_ACCESS_TOKEN")
+
+        supabase: Client = create_client(url, key)
+        sdk = mercadopago.SDK(mp_token)
+    except Exception as e:
+        st.error(f"Error de Configuración: {e}")
+        st.stop()
 
 # --- VALIDACIONES AUXILIARES ---
 def check_nick_exists(nick):
@@ -98,6 +122,8 @@ def register_user(nick, phone, province, zone, password, secret_q, secret_a, cou
             "country_code": country_code # Preparación para expansión LATAM
         }
         response = supabase.table("users").insert(data).execute()
+        _metricas_admin().usuario_nuevo(province)
+        _indice_usuarios("agregar", response.data[0])
         return response.data[0], "OK"
     except Exception as e: return None, f"Error DB: {str(e)}"
 
@@ -129,10 +155,14 @@ def reset_password(phone, answer_input, new_password):
 # --- EDICIÓN DE PERFIL ---
 def update_profile(user_id, province, zone):
     try:
+        antes = (get_user_by_id(user_id) or {}).get('province')
         supabase.table("users").update({
             "province": province, 
             "zone": zone
         }).eq("id", user_id).execute()
+        _inventario_modificado(user_id)  # Cambió su zona: sus filas del mercado y sus cadenas
+        _metricas_admin().provincia_cambiada(user_id, antes, province)
+        _indice_usuarios("actualizar", user_id, province, zone)
         return True, "Perfil actualizado correctamente."
     except Exception as e:
         return False, f"Error al actualizar: {str(e)}"
@@ -156,11 +186,84 @@ def remove_unlock(user_id, target_id):
         return True
     except: return False
 
+# --- LECTURA / ESCRITURA POR LOTES ---
+# PostgREST corta las respuestas en el max-rows del proyecto (1000 por defecto en Supabase):
+# una consulta sin paginar sobre una tabla grande se trunca sin avisar.
+PAGE_SIZE = 1000
+
+def iter_paginas(armar_query, page_size=PAGE_SIZE):
+    """
+    Recorre una consulta por páginas con keyset sobre 'id' (ORDER BY id, id > último).
+    armar_query() debe devolver un builder NUEVO (select + filtros) en cada llamada,
+    y el select tiene que incluir 'id'. Devuelve las filas de a una página por vez.
+    """
+    ultimo_id = None
+    while True:
+        q = armar_query()
+        if ultimo_id is not None: q = q.gt("id", ultimo_id)
+        chunk = q.order("id").limit(page_size).execute().data
+        # Se corta sólo con una página vacía: si el servidor devuelve menos filas que
+        # page_size (max-rows más chico), igual se sigue pidiendo y no se pierde nada.
+        if not chunk: return
+        yield chunk
+        ultimo_id = chunk[-1]['id']
+
+def fetch_table_df(table, columns="*", page_size=PAGE_SIZE):
+    """Tabla completa en un DataFrame, armado página a página."""
+    frames = [pd.DataFrame(chunk) for chunk in iter_paginas(lambda: supabase.table(table).select(columns), page_size)]
+    if not frames: return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+def _en_lotes(items, size=PAGE_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+# --- SNAPSHOT DEL INVENTARIO PROPIO (POR RERUN) ---
+# Sidebar, álbum y mercado necesitan el inventario del usuario: se trae UNA vez por rerun
+# y todos leen de acá. Las escrituras lo invalidan (ver _inventario_modificado).
+
+def _contar_roundtrip(request):
+    try: st.session_state['_db_roundtrips'] = st.session_state.get('_db_roundtrips', 0) + 1
+    except Exception: pass  # Hilos sin sesión (notificaciones, jobs)
+
+def nuevo_rerun():
+    """Se llama al principio de cada rerun: descarta el snapshot y reinicia el contador de consultas."""
+    st.session_state['_db_roundtrips_prev'] = st.session_state.get('_db_roundtrips', 0)
+    st.session_state['_db_roundtrips'] = 0
+    st.session_state['_inv_snapshot'] = {}
+    # El cliente de PostgREST se puede recrear (cambio de token): el hook se re-engancha si falta
+    try:
+        hooks = supabase.event_hooks['request'] if BACKEND == "local" else supabase.postgrest.session.event_hooks['request']
+        if _contar_roundtrip not in hooks: hooks.append(_contar_roundtrip)
+    except Exception: pass
+
+def get_roundtrips_rerun():
+    """(consultas del rerun actual hasta ahora, consultas del rerun anterior completo)."""
+    return st.session_state.get('_db_roundtrips', 0), st.session_state.get('_db_roundtrips_prev', 0)
+
+def get_user_inventory_rows(user_id):
+    """Todas las filas de inventory del usuario, cacheadas durante el rerun."""
+    cache = st.session_state.setdefault('_inv_snapshot', {})
+    if user_id not in cache:
+        # Paginado: tengo + repetida + wishlist de un álbum lleno pasa el max-rows de PostgREST (1000)
+        cache[user_id] = [r for chunk in iter_paginas(lambda: supabase.table("inventory").select("*").eq("user_id", user_id)) for r in chunk]
+    return cache[user_id]
+
+def _invalidar_inventario(user_id):
+    try: st.session_state.get('_inv_snapshot', {}).pop(user_id, None)
+    except Exception: pass
+
+def _inventario_modificado(user_id, stickers=None):
+    """Después de cada escritura: parche del mercado compartido + snapshot propio invalidado."""
+    _invalidar_inventario(user_id)
+    _patch_market(user_id, stickers)
+    _invalidar_triangulaciones(user_id, stickers)  # Después del parche: el recálculo ve el mercado nuevo
+    _actualizar_indice_premium(user_id, stickers)
+
 # --- INVENTARIO ---
 def get_inventory_status(user_id, start, end):
     try:
-        response = supabase.table("inventory").select("*").eq("user_id", user_id).execute()
-        df = pd.DataFrame(response.data)
+        df = pd.DataFrame(get_user_inventory_rows(user_id))
         if df.empty: df = pd.DataFrame(columns=['sticker_num', 'status', 'price', 'quantity', 'user_id'])
         else:
             df['sticker_num'] = pd.to_numeric(df['sticker_num'], errors='coerce').fillna(0).astype(int)
@@ -182,62 +285,60 @@ def get_inventory_status(user_id, start, end):
         return db_tengo, db_wishlist, db_repetidas_info, df
     except Exception: return [], [], {}, pd.DataFrame()
 
-def save_inventory_positive(user_id, start, end, ui_owned_list, ui_wishlist_list, ui_repe_df):
-    page_numbers = list(range(start, end + 1))
-    max_retries = 3
-    # NOTA: Para máxima eficiencia en el futuro, esto debería ser un RPC masivo también.
-    # Por ahora mantenemos la lógica python porque funciona bien para updates pequeños.
+def _con_reintentos(fn, max_retries=3):
+    """Reintenta fn() con backoff corto (0.1s, 0.2s...) en vez de bloquear 1s por intento."""
     for attempt in range(max_retries):
         try:
-            supabase.table("inventory").delete().eq("user_id", user_id).in_("sticker_num", page_numbers).execute()
-            break 
-        except Exception as e:
-            if attempt < max_retries - 1: time.sleep(1); continue
-            else: st.error("Error de conexión."); raise e
-
-    new_rows = []
-    for num in ui_owned_list:
-        new_rows.append({"user_id": user_id, "sticker_num": num, "status": "tengo", "price": 0, "quantity": 1})
-    for num in ui_wishlist_list:
-        if num not in ui_owned_list:
-            new_rows.append({"user_id": user_id, "sticker_num": num, "status": "wishlist", "price": 0, "quantity": 1})
-    if not ui_repe_df.empty:
-        for _, row in ui_repe_df.iterrows():
-            es_venta = "Venta" in str(row['Modo'])
-            qty = int(row.get('Cantidad', 1))
-            new_rows.append({"user_id": user_id, "sticker_num": row['Figurita'], "status": "repetida", "price": int(row['Precio']) if es_venta else 0, "quantity": qty})
-    
-    if new_rows:
-        for attempt in range(max_retries):
-            try:
-                supabase.table("inventory").insert(new_rows).execute()
-                break
-            except Exception as e:
-                if attempt < max_retries - 1: time.sleep(1)
-                else: raise e
-    
-    fetch_market.clear()
+            return fn()
+        except Exception:
+            if attempt < max_retries - 1: time.sleep(0.1 * 2 ** attempt)
+            else: raise
 
-def get_full_wishlist(user_id):
+def _leer_filas_pagina(user_id, start, end):
+    return [r for r in get_user_inventory_rows(user_id) if start <= int(r.get('sticker_num') or 0) <= end]
+
+def _aplicar_diff_pagina(user_id, start, end, filas_deseadas):
+    """
+    [OPTIMIZADO] Compara lo deseado con lo que hay en la base y manda sólo las diferencias:
+    un upsert por lotes (altas y cambios de precio/cantidad) y un delete por id de lo que sobra.
+    La página nunca queda vacía para los que leen el mercado. Devuelve cuántas filas cambiaron.
+    Requiere el índice único de sql/001_inventory_unique.sql.
+    """
+    actuales = _con_reintentos(lambda: _leer_filas_pagina(user_id, start, end))
+    upserts, ids_a_borrar = inventory_diff.calcular_diff(actuales, filas_deseadas)
+    if upserts:
+        _con_reintentos(lambda: supabase.table("inventory").upsert(upserts, on_conflict="user_id,sticker_num,status").execute())
+    if ids_a_borrar:
+        _con_reintentos(lambda: supabase.table("inventory").delete().in_("id", ids_a_borrar).execute())
+    if upserts or ids_a_borrar: _metricas_admin().inventario(actuales, filas_deseadas)
+    return len(upserts) + len(ids_a_borrar)
+
+def save_inventory_positive(user_id, start, end, ui_owned_list, ui_wishlist_list, ui_repe_df):
+    nuevas = inventory_diff.filas_pagina(user_id, ui_owned_list, ui_wishlist_list, ui_repe_df)
     try:
-        resp = supabase.table("inventory").select("sticker_num").eq("user_id", user_id).eq("status", "wishlist").execute()
-        return sorted([int(x['sticker_num']) for x in resp.data])
-    except: return []
+        cambios = _aplicar_diff_pagina(user_id, start, end, nuevas)
+    except Exception as e:
+        st.error("Error de conexión."); raise e
+    if cambios: _inventario_modificado(user_id, list(range(start, end + 1)))
+    return cambios
+
+def get_full_wishlist(user_id):
+    inv = get_inventory_bits(user_id)
+    if inv is None: return []
+    return album_bits.ids(inv.wishlist)
+
+def get_inventory_bits(user_id):
+    """
+    [OPTIMIZADO] Inventario del usuario en bitsets (ver album_bits.py), armado desde
+    el snapshot del rerun. Devuelve None si falla la conexión.
+    """
+    try: return album_bits.desde_filas(get_user_inventory_rows(user_id))
+    except: return None
 
 def get_shareable_lists(user_id):
-    try:
-        resp = supabase.table("inventory").select("sticker_num, status").eq("user_id", user_id).in_("status", ["wishlist", "repetida", "repe"]).execute()
-        wish = []
-        repes = []
-        for row in resp.data:
-            num = int(row['sticker_num'])
-            st_val = str(row['status']).lower().strip()
-            if st_val == 'wishlist': 
-                wish.append(num)
-            elif st_val in ['repetida', 'repe']:
-                repes.append(num)
-        return sorted(wish), sorted(repes)
-    except: return [], []
+    inv = get_inventory_bits(user_id)
+    if inv is None: return [], []
+    return album_bits.ids(inv.wishlist), album_bits.ids(inv.repetidas)
 
 # --- GESTIÓN DE SOLICITUDES ---
 def get_pending_transactions(user_id):
@@ -246,31 +347,21 @@ def get_pending_transactions(user_id):
         return resp.data
     except Exception as e: return []
 
+def _liquidar(procedimiento, params):
+    """
+    [OPTIMIZADO] Liquida un canje/compra en UN round-trip y en una sola transacción
+    (ver sql/002_settle_trades.sql). Devuelve (ok, error).
+    """
+    res = supabase.rpc(procedimiento, params).execute().data or {}
+    return bool(res.get('ok')), res.get('error')
+
 def confirm_transaction_request(request_id, user_id_receiver):
     try:
-        req = supabase.table("transaction_requests").select("*").eq("id", request_id).execute().data[0]
-        type_tx = req['type']
-        fig_sent_by_sender = req['fig_sent']
-        fig_received_by_sender = req['fig_received']
-        
-        if fig_received_by_sender:
-            target_fig = int(fig_received_by_sender)
-            resp = supabase.table("inventory").select("*").eq("user_id", user_id_receiver).eq("sticker_num", target_fig).eq("status", "repetida").execute()
-            if resp.data:
-                row = resp.data[0]
-                curr = int(row.get('quantity') or 1)
-                if curr > 1: supabase.table("inventory").update({"quantity": curr - 1}).eq("id", row['id']).execute()
-                else: supabase.table("inventory").delete().eq("id", row['id']).execute()
-        
-        if type_tx == 'exchange' and fig_sent_by_sender:
-            target_get = int(fig_sent_by_sender)
-            supabase.table("inventory").delete().eq("user_id", user_id_receiver).eq("sticker_num", target_get).eq("status", "wishlist").execute()
-            check = supabase.table("inventory").select("*").eq("user_id", user_id_receiver).eq("sticker_num", target_get).eq("status", "tengo").execute()
-            if not check.data: supabase.table("inventory").insert({"user_id": user_id_receiver, "sticker_num": target_get, "status": "tengo", "price": 0, "quantity": 1}).execute()
-
-        supabase.table("transaction_requests").update({"status": "accepted"}).eq("id", request_id).execute()
-        remove_unlock(user_id_receiver, req['sender_id'])
-        fetch_market.clear()
+        antes = list(get_user_inventory_rows(user_id_receiver))
+        ok, error = _liquidar("confirm_transaction", {"p_request_id": request_id, "p_receiver_id": user_id_receiver})
+        if not ok: return False, error
+        _inventario_modificado(user_id_receiver)
+        _metricas_admin().inventario(antes, get_user_inventory_rows(user_id_receiver))
         return True, "Confirmado: Tu inventario se actualizó."
     except Exception as e: return False, str(e)
 
@@ -281,36 +372,29 @@ def reject_transaction_request(request_id):
     except: return False
 
 # --- INTERCAMBIO ---
+def _filas_de(user_id, stickers):
+    return [r for r in get_user_inventory_rows(user_id) if int(r.get('sticker_num') or 0) in stickers]
+
 def register_exchange(user_id, given_fig, received_fig, target_id_to_remove=None):
     try:
         given_fig = int(given_fig)
         received_fig = int(received_fig)
-        resp = supabase.table("inventory").select("*").eq("user_id", user_id).eq("sticker_num", given_fig).eq("status", "repetida").execute()
-        if not resp.data: return False, f"No tenés la #{given_fig} repetida."
-        row = resp.data[0]
-        current_qty = int(row.get('quantity') or 1)
-        if current_qty > 1: supabase.table("inventory").update({"quantity": current_qty - 1}).eq("id", row['id']).execute()
-        else: supabase.table("inventory").delete().eq("id", row['id']).execute()
-        supabase.table("inventory").delete().eq("user_id", user_id).eq("sticker_num", received_fig).eq("status", "wishlist").execute()
-        check = supabase.table("inventory").select("*").eq("user_id", user_id).eq("sticker_num", received_fig).eq("status", "tengo").execute()
-        if not check.data: supabase.table("inventory").insert({"user_id": user_id, "sticker_num": received_fig, "status": "tengo", "price": 0, "quantity": 1}).execute()
-        if target_id_to_remove:
-            supabase.table("transaction_requests").insert({"sender_id": user_id, "receiver_id": target_id_to_remove, "fig_sent": given_fig, "fig_received": received_fig, "type": "exchange"}).execute()
-            remove_unlock(user_id, target_id_to_remove)
-        fetch_market.clear()
+        antes = _filas_de(user_id, {given_fig, received_fig})
+        ok, error = _liquidar("settle_exchange", {"p_user_id": user_id, "p_given": given_fig, "p_received": received_fig, "p_target_id": target_id_to_remove})
+        if not ok: return False, error
+        _inventario_modificado(user_id, [given_fig, received_fig])
+        _metricas_admin().inventario(antes, _filas_de(user_id, {given_fig, received_fig}))
         return True, f"¡Listo! Actualicé tu álbum y le mandé la confirmación al otro usuario."
     except Exception as e: return False, f"Error: {str(e)}"
 
 def register_purchase(user_id, received_fig, target_id_to_remove=None):
     try:
         received_fig = int(received_fig)
-        supabase.table("inventory").delete().eq("user_id", user_id).eq("sticker_num", received_fig).eq("status", "wishlist").execute()
-        check = supabase.table("inventory").select("*").eq("user_id", user_id).eq("sticker_num", received_fig).eq("status", "tengo").execute()
-        if not check.data: supabase.table("inventory").insert({"user_id": user_id, "sticker_num": received_fig, "status": "tengo", "price": 0, "quantity": 1}).execute()
-        if target_id_to_remove:
-            supabase.table("transaction_requests").insert({"sender_id": user_id, "receiver_id": target_id_to_remove, "fig_sent": None, "fig_received": received_fig, "type": "purchase"}).execute()
-            remove_unlock(user_id, target_id_to_remove)
-        fetch_market.clear()
+        antes = _filas_de(user_id, {received_fig})
+        ok, error = _liquidar("settle_purchase", {"p_user_id": user_id, "p_received": received_fig, "p_target_id": target_id_to_remove})
+        if not ok: return False, error
+        _inventario_modificado(user_id, [received_fig])
+        _metricas_admin().inventario(antes, _filas_de(user_id, {received_fig}))
         return True, "¡Compra registrada! Le avisé al vendedor para que actualice su stock."
     except Exception as e: return False, f"Error: {str(e)}"
 
@@ -338,72 +422,130 @@ def search_market_sql(user_id, sticker_num, user_zone):
         return []
 
 # --- TRIANGULACIÓN EFICIENTE (NUEVO MOTOR) ---
-def get_triangulations_sql(user_id):
+def get_triangulations_sql(user_id, target=None, alcance="zona", limite=None):
     """
     [OPTIMIZACIÓN MAYOR]
-    Ejecuta la búsqueda de ciclos (A->B->C->A) en el servidor SQL.
-    Evita descargar todo el grafo de usuarios a Python.
+    Ejecuta la búsqueda de ciclos (A->B->C->A) en el servidor SQL (sql/003_find_triangulations.sql).
+    El objetivo, el alcance (zona/provincia) y el límite van dentro de la consulta:
+    el servidor devuelve sólo las cadenas pedidas, ya ordenadas.
     """
     try:
-        response = supabase.rpc("find_triangulations", {"start_user_id": user_id}).execute()
+        params = {"start_user_id": user_id, "p_target": target, "p_scope": alcance, "p_limit": limite}
+        response = supabase.rpc("find_triangulations", params).execute()
         return response.data
     except Exception as e:
         print(f"Error SQL Triangulation: {e}")
         return []
 
-# --- MERCADO LEGACY (Mantenido por compatibilidad visual, pero optimizable) ---
-@st.cache_data(ttl=60, show_spinner=False)
+# --- MERCADO (SNAPSHOT COMPARTIDO) ---
+MARKET_SELECT = "*, users(nick, province, zone, phone_encrypted, reputation)"
+
+def _fetch_market_rows():
+    for chunk in iter_paginas(lambda: supabase.table("inventory").select(MARKET_SELECT)):
+        yield from chunk
+
+def _fetch_market_rows_usuario(user_id, stickers=None):
+    def armar():
+        q = supabase.table("inventory").select(MARKET_SELECT).eq("user_id", user_id)
+        return q.in_("sticker_num", [int(x) for x in stickers]) if stickers is not None else q
+    return [r for chunk in iter_paginas(armar) for r in chunk]
+
+@st.cache_resource(show_spinner=False)
+def _market_cache():
+    """
+    [OPTIMIZADO] Un único cache versionado del mercado para todo el servidor.
+    Antes era st.cache_data por user_id: N sesiones = N copias del mercado (y un unpickle por hit).
+    """
+    return market_cache.MarketCache(_fetch_market_rows, _fetch_market_rows_usuario, ttl=60)
+
+def _market_snapshot():
+    return _market_cache().snapshot()
+
+def _patch_market(user_id, stickers=None):
+    """Actualiza en el cache sólo las filas que tocó esta escritura (no tira el mercado de los demás)."""
+    try: _market_cache().patch_usuario(user_id, stickers)
+    except Exception: _market_cache().invalidar()
+
+def get_market_cache_stats():
+    return _market_cache().stats()
+
+@st.cache_resource(show_spinner=False)
+def _graph_cache():
+    return graph_engine.GrafoCache()
+
+def get_market_graph():
+    """Grafo de intercambios del snapshot actual (se rearma sólo si cambió la versión del mercado)."""
+    return _graph_cache().para(_market_snapshot())
+
+# --- CACHE DE TRIANGULACIONES (triangulation_cache.py) ---
+def _premium_ids():
+    for chunk in iter_paginas(lambda: supabase.table("users").select("id").eq("is_premium", True)):
+        for row in chunk: yield row['id']
+
+@st.cache_resource(show_spinner=False)
+def _triang_cache():
+    """Cache de cadenas compartido por todas las sesiones (con calentamiento de los premium)."""
+    mercado, grafos = _market_cache(), _graph_cache()
+    return triangulation_cache.CacheTriangulaciones(
+        lambda: grafos.para(mercado.snapshot()), top_k=config.TRIANGULACION_TOP_K, ttl=config.TRIANGULACION_CACHE_TTL,
+        presupuesto=lambda: graph_engine.Presupuesto(ms=config.CICLOS_PRESUPUESTO_MS, nodos=config.CICLOS_MAX_NODOS),
+        cargar_premium=_premium_ids, calentar_inicial=config.TRIANGULACION_CALENTAR_INICIAL,
+        calentar_por_usuario=config.TRIANGULACION_CALENTAR_POR_USUARIO)
+
+def get_triangulation_cache():
+    return _triang_cache()
+
+def warm_triangulations(user_id):
+    """Precalcula en segundo plano la wishlist de un premium (y, la primera vez, la de todos los premium)."""
+    try: _triang_cache().calentar(user_id)
+    except Exception as e: print(f"Error calentando triangulaciones: {e}")
+
+def _invalidar_triangulaciones(user_id, stickers=None):
+    try: _triang_cache().invalidar_usuario(user_id, stickers)
+    except Exception: _triang_cache().vaciar()
+
 def fetch_market(user_id):
-    # NOTA: En el futuro, esta función debería eliminarse si logramos que toda la UI use search_market_sql
-    try:
-        resp = supabase.table("inventory").select("*, users(nick, province, zone, phone_encrypted, reputation)").neq("user_id", user_id).execute()
-        df = pd.DataFrame(resp.data)
-        if not df.empty:
-            df['sticker_num'] = pd.to_numeric(df['sticker_num'], errors='coerce').fillna(0).astype(int)
-            df['price'] = pd.to_numeric(df['price'], errors='coerce').fillna(0).astype(int)
-        return df
+    """
+    Devuelve el DataFrame compartido tal cual (sin copiar, NO modificarlo).
+    Las filas del propio usuario se descartan al consultar, en find_matches.
+    """
+    try: return _market_snapshot().df
     except: return pd.DataFrame()
 
 def find_matches(user_id, market_df):
     if market_df.empty: return [], []
-    market_df = market_df.copy()
-
-    try:
-        resp = supabase.table("inventory").select("sticker_num").eq("user_id", user_id).eq("status", "tengo").execute()
-        mis_tengo_set = set(int(item['sticker_num']) for item in resp.data)
-        resp_r = supabase.table("inventory").select("sticker_num").eq("user_id", user_id).eq("status", "repetida").execute()
-        mis_repes_set = set(int(item['sticker_num']) for item in resp_r.data)
-        resp_w = supabase.table("inventory").select("sticker_num").eq("user_id", user_id).eq("status", "wishlist").execute()
-        mis_wishlist_set = set(int(item['sticker_num']) for item in resp_w.data)
-    except: return [], []
-
-    directos, ventas = [], []
-    market_df['nick'] = market_df['users'].apply(lambda x: x['nick'])
-    market_df['province'] = market_df['users'].apply(lambda x: x.get('province', 'Mendoza'))
-    market_df['zone'] = market_df['users'].apply(lambda x: x['zone'])
-    market_df['phone_encrypted'] = market_df['users'].apply(lambda x: x.get('phone_encrypted', ''))
-    market_df['reputation'] = market_df['users'].apply(lambda x: x.get('reputation', 0))
-    market_df['other_id'] = market_df['users'].apply(lambda x: x.get('id', 0))
-    
-    ofertas = market_df[market_df['status'] == 'repetida']
-    
-    for _, row in ofertas.iterrows():
-        figu = int(row['sticker_num'])
-        if figu not in mis_tengo_set:
-            es_wishlist = figu in mis_wishlist_set
-            match = {'nick': row['nick'], 'province': row['province'], 'zone': row['zone'], 'phone_encrypted': row['phone_encrypted'], 'figu': figu, 'price': row['price'], 'reputation': row['reputation'], 'target_id': row['user_id'], 'is_wishlist': es_wishlist}
-            if row['price'] > 0: ventas.append(match)
-            else:
-                sus_tengo_df = market_df[(market_df['user_id'] == row['user_id']) & (market_df['status'] == 'tengo')]
-                sus_tengo_set = set(sus_tengo_df['sticker_num'].tolist())
-                sirven = [r for r in mis_repes_set if r not in sus_tengo_set]
-                if sirven:
-                    match['te_pide'] = sirven[0]
-                    directos.append(match)
-    
-    directos.sort(key=lambda x: (not x['is_wishlist'], -x['reputation']))
-    ventas.sort(key=lambda x: (not x['is_wishlist'], x['price'], -x['reputation']))
-    return directos, ventas
+
+    mi_inv = get_inventory_bits(user_id)
+    if mi_inv is None: return [], []
+
+    # [OPTIMIZADO] El cruce se hace por columnas en matching.py (un groupby, sin iterrows)
+    return matching.calcular_matches(market_df, mi_inv, excluir_user_id=user_id)
+
+# --- PROPUESTAS DE COMPENSACIÓN GLOBAL (market_clearing.py) ---
+def save_trade_proposals(batch_id, rows):
+    """
+    Publica una corrida del job: inserta la tanda nueva y recién después borra las anteriores.
+    Una corrida sin propuestas no borra nada: queda publicada la última buena.
+    """
+    if not rows: return False, f"Batch {batch_id} sin propuestas: se mantiene la tanda anterior."
+    try:
+        for lote in _en_lotes(rows):
+            _con_reintentos(lambda: supabase.table("trade_proposals").insert(lote).execute())
+        supabase.table("trade_proposals").delete().lt("batch_id", batch_id).execute()
+        return True, f"{len(rows)} propuestas publicadas (batch {batch_id})."
+    except Exception as e: return False, f"Error al publicar propuestas: {e}"
+
+def get_trade_proposals(user_id):
+    """
+    Propuestas precalculadas del usuario (una consulta por índice en user_id, sin tocar el mercado).
+    Si justo conviven dos corridas, se queda con la más nueva.
+    """
+    try:
+        rows = supabase.table("trade_proposals").select("*").eq("user_id", user_id).order("batch_id", desc=True).execute().data
+        if not rows: return []
+        ultimo = rows[0]['batch_id']
+        return [r for r in rows if r['batch_id'] == ultimo]
+    except: return []
 
 # --- UTILS ---
 def verificar_pago_mp(payment_id, user_id):
@@ -414,11 +556,24 @@ def verificar_pago_mp(payment_id, user_id):
         resp = payment_info["response"]
         if resp.get("status") == "approved" and resp.get("transaction_amount") >= config.PRECIO_PREMIUM:
             supabase.table("payments_log").insert({"payment_id": str(payment_id), "user_id": user_id, "amount": resp.get("transaction_amount"), "status": "approved"}).execute()
+            antes, _ = _estado_premium(user_id)
             supabase.table("users").update({"is_premium": True}).eq("id", user_id).execute()
+            _premium_modificado(user_id)
+            _metricas_admin().premium_cambiado(user_id, antes, True)
             return True, "¡Sos Premium!"
         else: return False, "Pago pendiente/rechazado."
     except Exception as e: return False, str(e)
 
+def set_premium(user_id, valor):
+    """Alta o baja manual de Premium (panel de admin)."""
+    try:
+        antes, _ = _estado_premium(user_id)
+        supabase.table("users").update({"is_premium": bool(valor)}).eq("id", user_id).execute()
+        _premium_modificado(user_id)
+        _metricas_admin().premium_cambiado(user_id, antes, valor)
+        return True, "Usuario actualizado a Premium" if valor else "Premium removido"
+    except Exception as e: return False, str(e)
+
 def votar_usuario(voter_id, target_id):
     if voter_id == target_id: return False, "No autovoto."
     try:
@@ -426,55 +581,72 @@ def votar_usuario(voter_id, target_id):
         if check.data: return False, "Ya votaste."
         supabase.table("votes").insert({"voter_id": voter_id, "target_id": target_id}).execute()
         curr_rep = supabase.table("users").select("reputation").eq("id", target_id).execute().data[0]['reputation'] or 0
-        supabase.table("users").update({"reputation": curr_rep + 1}).eq("id", target_id).execute()
+        actualizado = supabase.table("users").update({"reputation": curr_rep + 1}).eq("id", target_id).execute().data
+        if actualizado: _metricas_admin().reputacion_cambiada(actualizado[0], curr_rep)
         return True, "¡Este sí es Fair Player!"
     except Exception as e: return False, str(e)
 
-def verify_daily_reset(user):
-    if not user: return False
-    try:
-        hoy = str(date.today())
-        last_date = str(user.get('last_contact_date', ''))
-        if last_date != hoy:
-            supabase.table("users").update({"last_contact_date": hoy, "daily_contacts_count": 0}).eq("id", user['id']).execute()
-            user['last_contact_date'] = hoy
-            user['daily_contacts_count'] = 0
-            return True
-    except: pass
-    return False
+# --- CRÉDITOS DIARIOS (daily_credits.py, sql/007_daily_credits.sql) ---
+def credits_used_today(user):
+    """[OPTIMIZADO] Se deriva de (last_contact_date, daily_contacts_count): leer no escribe nada."""
+    return daily_credits.usados_hoy(user)
 
 def check_contact_limit(user):
-    if verify_daily_reset(user): return True
-    if user.get('is_premium', False): return True
-    return user.get('daily_contacts_count', 0) < 1
+    restantes = daily_credits.restantes(user, config.CREDITOS_DIARIOS)
+    return restantes is None or restantes > 0
 
 def consume_credit(user):
-    if not user.get('is_premium', False):
-        try:
-            nuevo = user.get('daily_contacts_count', 0) + 1
-            supabase.table("users").update({"daily_contacts_count": nuevo}).eq("id", user['id']).execute()
-            if 'user' in st.session_state: st.session_state.user['daily_contacts_count'] = nuevo
-        except: pass
+    """
+    Usa un crédito con UN update condicional en la base (no hay carrera entre pestañas).
+    Devuelve (ok, mensaje); actualiza la copia de la sesión con lo que quedó guardado.
+    """
+    try:
+        hoy = str(date.today())
+        res = supabase.rpc("consume_daily_credit", {"p_user_id": user['id'], "p_today": hoy, "p_limit": config.CREDITOS_DIARIOS}).execute().data or {}
+        if not res.get('ok'): return False, res.get('error') or "Te quedaste sin créditos por hoy."
+        if not user.get('is_premium', False):
+            cambios = {"daily_contacts_count": res.get('usados', 1), "last_contact_date": hoy}
+            user.update(cambios)
+            if st.session_state.get('user'): st.session_state.user.update(cambios)
+        return True, "OK"
+    except Exception as e: return False, f"Error: {str(e)}"
 
 def process_csv_upload(df, user_id):
     try:
         df.columns = [c.lower().strip() for c in df.columns]
         expected_cols = ['num', 'status', 'price']
         if not all(col in df.columns for col in expected_cols): return False, "CSV inválido."
-        rows_to_insert = []
+        if df.empty: return False, "CSV vacío."
+        nums_csv = pd.to_numeric(df['num'], errors='coerce')
+        invalidos = df['num'][nums_csv.isna() | (nums_csv % 1 != 0) | (nums_csv < 1) | (nums_csv > album_bits.ALBUM_SIZE)]
+        if not invalidos.empty:
+            return False, f"Números fuera del álbum (1-{album_bits.ALBUM_SIZE}): {', '.join(map(str, invalidos.head(5).tolist()))}"
+        df['num'] = nums_csv.astype(int)
+        nums = sorted({int(x) for x in df['num']})
+        deseadas = []
         for _, row in df.iterrows():
             st_val = str(row['status']).lower().strip()
             if st_val not in ['tengo', 'repetida', 'wishlist']: st_val = 'tengo'
             qty = 1
             if 'quantity' in df.columns and pd.notnull(row['quantity']): qty = int(row['quantity'])
-            rows_to_insert.append({"user_id": user_id, "sticker_num": int(row['num']), "status": st_val, "price": int(row['price']) if pd.notnull(row['price']) else 0, "quantity": qty})
-        if rows_to_insert:
-            nums = [r['sticker_num'] for r in rows_to_insert]
-            supabase.table("inventory").delete().eq("user_id", user_id).in_("sticker_num", nums).execute()
-            supabase.table("inventory").insert(rows_to_insert).execute()
-            fetch_market.clear()
-            return True, f"Cargadas {len(rows_to_insert)}."
-        return False, "CSV vacío."
+            deseadas.append({"user_id": user_id, "sticker_num": int(row['num']), "status": st_val, "price": int(row['price']) if pd.notnull(row['price']) else 0, "quantity": qty})
+        # Igual que el guardado por página: upsert de lo nuevo / cambiado y después delete por id
+        # de lo que el CSV ya no tiene. Si se corta a mitad de camino no se pierde nada.
+        en_csv = set(nums)
+        actuales = [r for r in get_user_inventory_rows(user_id) if int(r.get('sticker_num') or 0) in en_csv]
+        upserts, ids_a_borrar = inventory_diff.calcular_diff(actuales, deseadas)
+        escrito = False
+        try:
+            for lote in _en_lotes(upserts):
+                _con_reintentos(lambda: supabase.table("inventory").upsert(lote, on_conflict="user_id,sticker_num,status").execute())
+                escrito = True
+            for lote in _en_lotes(ids_a_borrar):
+                _con_reintentos(lambda: supabase.table("inventory").delete().in_("id", lote).execute())
+                escrito = True
+        finally:
+            if escrito: _inventario_modificado(user_id, nums)
+        if escrito: _metricas_admin().inventario(actuales, deseadas)
+        return True, f"Cargadas {len(deseadas)}."
     except Exception as e: return False, str(e)
 
 def get_user_by_id(user_id):
@@ -523,39 +695,44 @@ def get_wishlists_of_users(user_ids):
 def find_potential_bridges(needed_figus, my_repes):
     try:
         if not needed_figus or not my_repes: return []
+        needed_mask = album_bits.mascara(needed_figus)
+        my_repes_mask = album_bits.mascara(my_repes)
         holders = supabase.table("inventory").select("user_id, sticker_num, status, users(nick, province, zone, phone_encrypted)").in_("sticker_num", needed_figus).execute()
-        holder_map = {} 
+        holder_mask = {}
         user_info = {}
-        candidate_ids = []
         
         for row in holders.data:
-            if str(row.get('status', '')).lower().strip() not in ["repetida", "repe"]: continue
+            if str(row.get('status', '')).lower().strip() not in album_bits.ALIAS_REPETIDA: continue
             uid = row['user_id']
             u_data = row.get('users', {})
-            if uid not in holder_map: 
-                holder_map[uid] = []
-                candidate_ids.append(uid)
+            if uid not in holder_mask: 
+                holder_mask[uid] = 0
                 user_info[uid] = {
                     'nick': u_data.get('nick', 'Puente'),
                     'province': str(u_data.get('province', '')).strip(),
                     'zone': str(u_data.get('zone', '')).strip(),
                     'phone_encrypted': u_data.get('phone_encrypted', '')
                 }
-            holder_map[uid].append(row['sticker_num'])
+            holder_mask[uid] |= 1 << int(row['sticker_num'])
             
-        if not candidate_ids: return []
+        if not holder_mask: return []
         
-        wanters = supabase.table("inventory").select("user_id, sticker_num").in_("user_id", candidate_ids).in_("sticker_num", my_repes).eq("status", "wishlist").execute()
-        bridges = []
+        wanters = supabase.table("inventory").select("user_id, sticker_num").in_("user_id", list(holder_mask)).in_("sticker_num", my_repes).eq("status", "wishlist").execute()
+        wants_mask = {}
         for row in wanters.data:
-            uid = row['user_id']
-            if uid in holder_map:
-                for has in holder_map[uid]:
+            wants_mask[row['user_id']] = wants_mask.get(row['user_id'], 0) | (1 << int(row['sticker_num']))
+
+        bridges = []
+        for uid, w_mask in wants_mask.items():
+            # Lo que el puente tiene de lo que necesito x lo que quiere de mis repes
+            tiene = album_bits.ids(holder_mask[uid] & needed_mask)
+            for wants in album_bits.ids(w_mask & my_repes_mask):
+                for has in tiene:
                     bridges.append({
                         'user_id': uid, 'nick': user_info[uid]['nick'],
                         'province': user_info[uid]['province'], 'zone': user_info[uid]['zone'],
                         'phone_encrypted': user_info[uid]['phone_encrypted'],
-                        'has_figu': has, 'wants_figu': row['sticker_num']
+                        'has_figu': has, 'wants_figu': wants
                     })
         return bridges
     except: return []
@@ -566,12 +743,128 @@ def link_telegram_id(user_id, chat_id):
             return False, "El ID debe ser numérico."
             
         supabase.table("users").update({"telegram_chat_id": chat_id}).eq("id", user_id).execute()
+        _premium_modificado(user_id)
         return True, "¡Vinculado correctamente!"
     except Exception as e:
         return False, str(e)
 
+# --- ÍNDICE DE WISHLISTS PREMIUM (premium_index.py) ---
+def _premium_con_chat():
+    rows = []
+    for chunk in iter_paginas(lambda: supabase.table("users").select("id, telegram_chat_id").eq("is_premium", True)):
+        rows.extend((r['id'], r['telegram_chat_id']) for r in chunk if r.get('telegram_chat_id'))
+    return rows
+
+def _wishlists_de(user_ids, stickers=None):
+    rows = []
+    for lote in _en_lotes(user_ids):
+        def armar(lote=lote):
+            q = supabase.table("inventory").select("id, user_id, sticker_num").in_("user_id", lote).eq("status", "wishlist")
+            return q.in_("sticker_num", [int(x) for x in stickers]) if stickers is not None else q
+        for chunk in iter_paginas(armar): rows.extend((r['user_id'], r['sticker_num']) for r in chunk)
+    return rows
+
+def _estado_premium(user_id):
+    data = supabase.table("users").select("is_premium, telegram_chat_id").eq("id", user_id).execute().data
+    if not data: return False, None
+    return bool(data[0].get('is_premium')), data[0].get('telegram_chat_id')
+
+@st.cache_resource(show_spinner=False)
+def _premium_index():
+    """Figurita -> premium con Telegram que la buscan, para todo el servidor."""
+    return premium_index.IndicePremium(_premium_con_chat, _wishlists_de, _estado_premium)
+
+def _actualizar_indice_premium(user_id, stickers=None):
+    try: _premium_index().wishlist_modificada(user_id, stickers)
+    except Exception as e: print(f"Error actualizando índice premium: {e}")
+
+def _premium_modificado(user_id):
+    try: _premium_index().usuario_modificado(user_id)
+    except Exception as e: print(f"Error actualizando índice premium: {e}")
+
+def get_premium_index_stats():
+    return _premium_index().stats()
+
+def start_premium_index():
+    """El primer armado corre en segundo plano: hasta que termina, las alertas consultan la base."""
+    try: _premium_index().iniciar()
+    except Exception as e: print(f"Error iniciando el índice premium: {e}")
+
+# --- MÉTRICAS DEL ADMIN (admin_metrics.py) ---
+def _recalcular_metricas():
+    """Recálculo completo: usuarios de a páginas (sólo 5 columnas) y un conteo por status de inventario."""
+    m = {"usuarios": 0, "premium": 0, "activos": 0, "por_provincia": {}, "inventario": {}, "top": []}
+    for chunk in iter_paginas(lambda: supabase.table("users").select("id, nick, province, is_premium, reputation")):
+        for u in chunk:
+            m["usuarios"] += 1
+            m["premium"] += bool(u.get('is_premium'))
+            m["activos"] += int(u.get('reputation') or 0) > 0
+            if u.get('province'): m["por_provincia"][u['province']] = m["por_provincia"].get(u['province'], 0) + 1
+        m["top"] = sorted(m["top"] + chunk, key=lambda u: (-int(u.get('reputation') or 0), u['id']))[:admin_metrics.TOP_K]
+    for status in admin_metrics.STATUS:
+        valores = list(album_bits.ALIAS_REPETIDA) if status == 'repetida' else [status]
+        n = supabase.table("inventory").select("id", count="exact").in_("status", valores).limit(1).execute().count or 0
+        if n: m["inventario"][status] = n
+    return m
+
+@st.cache_resource(show_spinner=False)
+def _metricas_admin():
+    return admin_metrics.MetricasAdmin(_recalcular_metricas, recalculo=config.METRICAS_RECALCULO_SEG)
+
+def get_admin_metrics():
+    """KPIs del panel de admin, ya calculados (no recorre tablas)."""
+    return _metricas_admin().leer()
+
+def recompute_admin_metrics():
+    try:
+        _metricas_admin().recalcular()
+        return True, "Métricas recalculadas."
+    except Exception as e: return False, str(e)
+
+# --- BÚSQUEDA DE USUARIOS DEL ADMIN (user_search.py) ---
+_CAMPOS_BUSQUEDA = "id, nick, zone, province"
+
+def _usuarios_para_indice():
+    for chunk in iter_paginas(lambda: supabase.table("users").select(_CAMPOS_BUSQUEDA)): yield from chunk
+
+def _usuarios_desde(ultimo_id):
+    for chunk in iter_paginas(lambda: supabase.table("users").select(_CAMPOS_BUSQUEDA).gt("id", ultimo_id)): yield from chunk
+
+@st.cache_resource(show_spinner=False)
+def _usuarios_busqueda():
+    return user_search.IndiceUsuarios(_usuarios_para_indice, _usuarios_desde)
+
+def start_user_search():
+    """Arranca el armado del índice de búsqueda en segundo plano (al abrir el panel de admin)."""
+    try: _usuarios_busqueda().iniciar()
+    except Exception as e: print(f"Error iniciando búsqueda de usuarios: {e}")
+
+def search_users(texto, limite=50):
+    """
+    [OPTIMIZADO] Usuarios que coinciden con 'texto' (nick, zona, provincia o id), ya rankeados.
+    Los ids salen del índice en memoria; la base sólo devuelve las columnas de esas 'limite' filas.
+    None mientras el índice se está armando.
+    """
+    try:
+        ids = _usuarios_busqueda().buscar(texto, limite)
+        if not ids: return []
+        rows = supabase.table("users").select("id, nick, province, zone, reputation, is_premium, daily_contacts_count, last_contact_date").in_("id", ids).execute().data
+        por_id = {r['id']: r for r in rows}
+        return [por_id[i] for i in ids if i in por_id]
+    except user_search.IndiceNoListo: return None
+    except Exception as e:
+        print(f"Error buscando usuarios: {e}")
+        return []
+
+def _indice_usuarios(metodo, *args):
+    try: getattr(_usuarios_busqueda(), metodo)(*args)
+    except Exception as e: print(f"Error actualizando búsqueda de usuarios: {e}")
+
 def _find_premium_matches_internal(uploaded_repes_ids, uploader_id):
     if not uploaded_repes_ids: return {}
+    # [OPTIMIZADO] Lookup en el índice en memoria; la consulta de abajo queda de respaldo
+    try: return _premium_index().matches(uploaded_repes_ids, uploader_id)
+    except Exception as e: print(f"Error en índice premium (se consulta la base): {e}")
     try:
         response = supabase.table("inventory")\
             .select("user_id, sticker_num, users!inner(is_premium, telegram_chat_id)")\
@@ -595,41 +888,300 @@ def _find_premium_matches_internal(uploaded_repes_ids, uploader_id):
         print(f"Error buscando matches premium: {e}")
         return {}
 
+# --- OUTBOX DE ALERTAS (sql/005_notification_outbox.sql, sql/008_outbox_failures.sql, notifications.py) ---
+def save_outbox_alerts(uploader_id, uploader_nick, matches_dict, dia=None):
+    """
+    Anota las alertas {chat_id: [figuritas]} en el outbox, una fila por chat y figurita.
+    La clave de idempotencia (chat, uploader, figurita, día) evita re-alertar: devuelve sólo las nuevas.
+    """
+    dia = dia or date.today().isoformat()
+    rows = [{"idem_key": f"{chat_id}:{uploader_id}:{num}:{dia}", "chat_id": str(chat_id), "uploader_id": uploader_id,
+             "uploader_nick": uploader_nick, "sticker_num": int(num), "dia": dia}
+            for chat_id, figus in matches_dict.items() for num in sorted(set(figus))]
+    nuevas = []
+    for lote in _en_lotes(rows):
+        nuevas.extend(supabase.table("notification_outbox").upsert(lote, on_conflict="idem_key", ignore_duplicates=True).execute().data)
+    return nuevas
+
+def get_pending_outbox(dias=None):
+    """
+    Alertas sin enviar de los últimos 'dias' (las más viejas ya no sirven), en orden de llegada.
+    Las que Telegram rechazó para siempre (failed_at) no se vuelven a mandar.
+    """
+    desde = (date.today() - timedelta(days=dias if dias is not None else config.OUTBOX_MAX_DIAS)).isoformat()
+    try:
+        rows = []
+        for chunk in iter_paginas(lambda: supabase.table("notification_outbox").select("*").is_("sent_at", "null")
+                                  .is_("failed_at", "null").gte("dia", desde)):
+            rows.extend(chunk)
+        return rows
+    except Exception as e:
+        print(f"Error leyendo outbox: {e}")
+        return []
+
+def mark_outbox_sent(ids):
+    ahora = datetime.now(timezone.utc).isoformat()
+    for lote in _en_lotes([int(i) for i in ids]):
+        supabase.table("notification_outbox").update({"sent_at": ahora}).in_("id", lote).execute()
+
+def mark_outbox_failed(ids, motivo):
+    """Rechazo definitivo de Telegram (bot bloqueado, chat inexistente, texto inválido): no se reintenta."""
+    ahora = datetime.now(timezone.utc).isoformat()
+    for lote in _en_lotes([int(i) for i in ids]):
+        supabase.table("notification_outbox").update({"failed_at": ahora, "error": str(motivo)[:500]}).in_("id", lote).execute()
+
+def replay_outbox(desde, hasta=None):
+    """Vuelve a dejar pendientes las alertas de esos días, también las fallidas (para re-enviarlas). Devuelve cuántas."""
+    q = supabase.table("notification_outbox").update({"sent_at": None, "failed_at": None, "error": None}).gte("dia", desde)
+    if hasta: q = q.lte("dia", hasta)
+    return len(q.execute().data)
+
+def backfill_outbox(desde):
+    """
+    Anota las alertas de las repetidas cargadas desde 'desde' que no están en el outbox
+    (ej: cargas de antes de que existiera). Las que ya estaban se ignoran por idem_key.
+    """
+    return _anotar_alertas_de(lambda: supabase.table("inventory").select("id, user_id, sticker_num, created_at")
+                              .in_("status", list(album_bits.ALIAS_REPETIDA)).gte("created_at", desde))[0]
+
+def recover_outbox_alerts():
+    """
+    [DRENADOR] bulk_smart_update escribe el inventario y después el outbox: si el proceso se cae
+    (o falla) entre los dos, la alerta no queda anotada. En cada ronda se anotan las de las
+    repetidas nuevas desde el watermark (outbox_state, sql/009_outbox_watermark.sql); las que la
+    carga ya había anotado se ignoran por idem_key. La primera vez sólo fija el watermark
+    (la historia vieja es 'notifications.py backfill'). Devuelve cuántas alertas anotó.
+    """
+    estado = supabase.table("outbox_state").select("last_inventory_id").eq("id", 1).execute().data
+    if not estado:
+        ultima = supabase.table("inventory").select("id").order("id", desc=True).limit(1).execute().data
+        supabase.table("outbox_state").upsert({"id": 1, "last_inventory_id": ultima[0]['id'] if ultima else 0}, on_conflict="id").execute()
+        return 0
+    desde = estado[0]['last_inventory_id']
+    nuevas, hasta = _anotar_alertas_de(lambda: supabase.table("inventory").select("id, user_id, sticker_num, created_at")
+                                       .in_("status", list(album_bits.ALIAS_REPETIDA)).gt("id", desde))
+    if hasta > desde:
+        # Con varios procesos el watermark sólo avanza
+        supabase.table("outbox_state").update({"last_inventory_id": hasta, "updated_at": datetime.now(timezone.utc).isoformat()})\
+            .eq("id", 1).lt("last_inventory_id", hasta).execute()
+    return nuevas
+
+def _anotar_alertas_de(armar):
+    """Alertas de las repetidas de esa consulta, por (quien cargó, día). Devuelve (anotadas, último id)."""
+    nuevas, hasta = 0, 0
+    cargas = {}
+    for chunk in iter_paginas(armar):
+        for row in chunk:
+            dia = str(row.get('created_at') or date.today().isoformat())[:10]
+            cargas.setdefault((row['user_id'], dia), []).append(int(row['sticker_num']))
+            hasta = max(hasta, row['id'])
+    for (uploader_id, dia), stickers in cargas.items():
+        matches_dict = _find_premium_matches_internal(stickers, uploader_id)
+        if matches_dict:
+            nick = (get_user_by_id(uploader_id) or {}).get('nick', 'Alguien')
+            nuevas += len(save_outbox_alerts(uploader_id, nick, matches_dict, dia))
+    return nuevas, hasta
+
+@st.cache_resource(show_spinner=False)
+def _outbox_worker():
+    return notifications.iniciar_drenaje(get_pending_outbox, mark_outbox_sent, marcar_fallidas=mark_outbox_failed,
+                                         recuperar=recover_outbox_alerts)
+
+def start_outbox_worker():
+    """Un drenador por proceso: al arrancar (ej: después de un deploy) retoma las alertas pendientes."""
+    try: _outbox_worker()
+    except Exception as e: print(f"Error iniciando el outbox: {e}")
+
+# --- SERIES DE ACTIVIDAD (rollups.py, sql/006_activity_rollups.sql) ---
+def _provincias_de(user_ids):
+    provincias = {}
+    for lote in _en_lotes(sorted({u for u in user_ids if u is not None})):
+        for r in supabase.table("users").select("id, province").in_("id", lote).execute().data:
+            provincias[r['id']] = r.get('province')
+    return provincias
+
+def _estados_solicitudes(ids):
+    estados = {}
+    for lote in _en_lotes(ids):
+        for r in supabase.table("transaction_requests").select("id, status").in_("id", lote).execute().data:
+            estados[r['id']] = r.get('status') or 'pending'
+    return estados
+
+def _plegar_fuente(fuente, estado, avance=None):
+    """Pliega de a ROLLUP_LOTE filas desde el watermark. Devuelve cuántas filas nuevas plegó."""
+    columnas, columna_usuario = rollups.FUENTES[fuente]
+    version, ultimo = estado.get('version', 0), estado.get('last_id', 0)
+    pendientes = list(estado.get('pending') or [])
+    revisar = fuente == "transaction_requests" and bool(pendientes)
+    plegadas = 0
+    while True:
+        rows = supabase.table(fuente).select(columnas).gt("id", ultimo).order("id").limit(config.ROLLUP_LOTE).execute().data
+        plegado = rollups.Plegado(config.ROLLUP_UTC_OFFSET)
+        if revisar:
+            pendientes = rollups.resolver(pendientes, _estados_solicitudes([rid for rid, _ in pendientes]), plegado)
+            revisar = False
+        if not rows and not plegado.sumas: return plegadas
+        pendientes += rollups.plegar(fuente, rows, _provincias_de(r.get(columna_usuario) for r in rows), plegado)
+        nuevo = rows[-1]['id'] if rows else ultimo
+        res = supabase.rpc("fold_rollups", {"p_source": fuente, "p_version": version, "p_last_id": nuevo,
+                                            "p_pending": pendientes, "p_rows": plegado.filas()}).execute().data or {}
+        if not res.get('ok'): return plegadas  # Otro proceso ya está plegando esta fuente
+        version, ultimo = version + 1, nuevo
+        plegadas += len(rows)
+        if avance is not None: avance(fuente, len(rows))
+
+def run_rollups(avance=None):
+    """
+    Pliega lo nuevo de cada fuente y poda las cubetas horarias viejas. Devuelve {fuente: filas plegadas}.
+    avance(fuente, filas) se llama después de cada lote (progreso del Plegador).
+    """
+    estados = {r['source']: r for r in supabase.table("rollup_state").select("source, last_id, pending, version").execute().data}
+    hechas = {fuente: _plegar_fuente(fuente, estados.get(fuente, {}), avance) for fuente in rollups.FUENTES}
+    corte = rollups.cubetas(datetime.now(timezone.utc) - timedelta(days=config.ROLLUP_HORAS_DIAS), config.ROLLUP_UTC_OFFSET)[0]
+    supabase.table("activity_rollups").delete().eq("granularity", "h").lt("bucket", corte).execute()
+    return hechas
+
+def get_activity_rollups(granularity="d", dias=56, dimension="total", key=None, metrics=None):
+    """
+    Filas de activity_rollups de los últimos 'dias' (bucket, key, metric, value).
+    Sólo lee las cubetas ya plegadas: no recorre contact_logs, transaction_requests ni votes.
+    """
+    try:
+        desde = rollups.cubetas(datetime.now(timezone.utc) - timedelta(days=dias), config.ROLLUP_UTC_OFFSET)[0 if granularity == "h" else 1]
+        def armar():
+            q = supabase.table("activity_rollups").select("id, bucket, key, metric, value")\
+                .eq("granularity", granularity).eq("dimension", dimension).gte("bucket", desde)
+            if key is not None: q = q.eq("key", key)
+            return q.in_("metric", list(metrics)) if metrics else q
+        return [r for chunk in iter_paginas(armar) for r in chunk]
+    except Exception as e:
+        print(f"Error leyendo rollups: {e}")
+        return []
+
+def get_rollup_state():
+    try: return supabase.table("rollup_state").select("source, last_id, version, updated_at, pending").execute().data
+    except: return []
+
+@st.cache_resource(show_spinner=False)
+def _rollup_worker():
+    return rollups.Plegador(run_rollups, config.ROLLUP_INTERVALO)
+
+def start_rollup_worker():
+    """Un plegador por proceso (si hay varios, fold_rollups evita que sumen dos veces)."""
+    try: _rollup_worker()
+    except Exception as e: print(f"Error iniciando los rollups: {e}")
+
+def wake_rollups():
+    """Botón del admin: adelanta la ronda del plegador (corre en su hilo, no en el de Streamlit)."""
+    _rollup_worker().ahora()
+
+def get_rollup_progress():
+    return _rollup_worker().estado()
+
+# --- MANTENIMIENTO POR LOTES (maintenance.py) ---
+def _hasta_plegado(fuente):
+    """
+    Pliega los rollups y devuelve los params del borrado: su watermark (hasta_id) y las solicitudes
+    que seguían pendientes al plegar (sin_plegar). Ninguna de las dos se borra: si una se acepta
+    mientras corre el trabajo, rollups.resolver la contaría como rechazada al no encontrarla.
+    Si el plegado falla, el trabajo queda en 'error' (maintenance.py) en vez de borrar sin tope.
+    """
+    try:
+        run_rollups()
+        estado = supabase.table("rollup_state").select("last_id, pending").eq("source", fuente).execute().data
+    except Exception as e:
+        raise RuntimeError(f"No se pudieron plegar los rollups de {fuente}; no se borra nada: {e}") from e
+    if not estado: return {"hasta_id": 0, "sin_plegar": []}
+    return {"hasta_id": estado[0]['last_id'], "sin_plegar": sorted(rid for rid, _ in estado[0].get('pending') or [])}
+
+def _solicitudes_cerradas(params, columnas="*", count=None):
+    q = supabase.table("transaction_requests").select(columnas, count=count).neq("status", "pending")
+    return q.lte("id", params.get('hasta_id') or 0)  # Sin watermark no se borra nada
+
+def _contactos_viejos(params, columnas="*", count=None):
+    q = supabase.table("contact_logs").select(columnas, count=count).lt("created_at", params['corte'])
+    return q.lte("id", params.get('hasta_id') or 0)  # Sin watermark no se borra nada
+
+def _leer_lote(armar):
+    """Lote siguiente sin las solicitudes pendientes al plegar (si un lote entero eran ésas, sigue)."""
+    def leer(desde, n, params):
+        saltar = set(params.get('sin_plegar') or ())
+        while True:
+            rows = armar(params).gt("id", desde).order("id").limit(n).execute().data
+            quedan = [r for r in rows if r['id'] not in saltar]
+            if quedan or len(rows) < n: return quedan
+            desde = rows[-1]['id']
+    return leer
+
+def _borrar_lote(tabla, ids, params, filtro=lambda q: q):
+    saltar = set(params.get('sin_plegar') or ())
+    ids = [i for i in ids if i not in saltar]
+    if ids: filtro(supabase.table(tabla).delete().in_("id", ids)).execute()
+
+def _trabajos_mantenimiento():
+    contar = lambda armar: lambda p: armar(p, "id", "exact").limit(1).execute().count
+    return [
+        maintenance.Trabajo(
+            "solicitudes", "🗑️ Limpiar solicitudes cerradas",
+            leer=_leer_lote(_solicitudes_cerradas), contar=contar(_solicitudes_cerradas), archivar="transaction_requests",
+            preparar=lambda: _hasta_plegado("transaction_requests"),
+            aplicar=lambda ids, p: _borrar_lote("transaction_requests", ids, p, lambda q: q.neq("status", "pending"))),
+        maintenance.Trabajo(
+            "contactos", f"📇 Archivar desbloqueos de más de {config.MANTENIMIENTO_CONTACTOS_DIAS} días",
+            leer=_leer_lote(_contactos_viejos), contar=contar(_contactos_viejos), archivar="contact_logs",
+            preparar=lambda: {**_hasta_plegado("contact_logs"),
+                              "corte": (datetime.now(timezone.utc) - timedelta(days=config.MANTENIMIENTO_CONTACTOS_DIAS)).isoformat()},
+            aplicar=lambda ids, p: _borrar_lote("contact_logs", ids, p)),
+    ]
+
+@st.cache_resource(show_spinner=False)
+def _mantenimiento():
+    return maintenance.Ejecutor(_trabajos_mantenimiento(), config.MANTENIMIENTO_DIR,
+                                lote=config.MANTENIMIENTO_LOTE, pausa=config.MANTENIMIENTO_PAUSA)
+
+def start_maintenance():
+    """Al arrancar el proceso retoma el trabajo de mantenimiento que quedó a medias."""
+    try: _mantenimiento().reanudar()
+    except Exception as e: print(f"Error retomando mantenimiento: {e}")
+
+def run_maintenance(nombre):
+    try: return _mantenimiento().lanzar(nombre)
+    except Exception as e: return False, str(e)
+
+def resume_maintenance(nombre):
+    try: return _mantenimiento().continuar(nombre)
+    except Exception as e: return False, str(e)
+
+def cancel_maintenance():
+    _mantenimiento().cancelar()
+
+def get_maintenance_status():
+    return _mantenimiento().estado()
+
 def bulk_smart_update(user_id, page_start, page_end, ids_tengo, ids_repe, ids_wish):
     try:
-        page_range = list(range(page_start, page_end + 1))
-        supabase.table("inventory").delete().eq("user_id", user_id).in_("sticker_num", page_range).execute()
-        rows_to_insert = []
-        set_tengo = set(ids_tengo)
-        set_repe = set(ids_repe)
-        set_wish = set(ids_wish)
-        final_tengo = set_tengo.union(set_repe)
-        final_wish = set_wish - final_tengo
-        for num in final_tengo:
-            rows_to_insert.append({"user_id": user_id, "sticker_num": num, "status": "tengo", "price": 0, "quantity": 1})
-        for num in set_repe:
-            rows_to_insert.append({"user_id": user_id, "sticker_num": num, "status": "repetida", "price": 0, "quantity": 1})
-        for num in final_wish:
-            rows_to_insert.append({"user_id": user_id, "sticker_num": num, "status": "wishlist", "price": 0, "quantity": 1})
-            
-        if rows_to_insert:
-            supabase.table("inventory").insert(rows_to_insert).execute()
-            fetch_market.clear() 
-            if ids_repe:
-                uploader_nick = get_user_by_id(user_id).get('nick', 'Alguien')
-                matches_dict = _find_premium_matches_internal(ids_repe, user_id)
-                if matches_dict:
-                    utils.disparar_notificaciones_thread(matches_dict, uploader_nick)
-
-        return True, f"¡Listo! Se actualizaron {len(rows_to_insert)} figuritas."
+        rows_deseadas = inventory_diff.filas_carga_rapida(user_id, ids_tengo, ids_repe, ids_wish)
+        cambios = _aplicar_diff_pagina(user_id, page_start, page_end, rows_deseadas)
+        # El inventario ya cambió: los caches se actualizan aunque fallen las alertas
+        if cambios: _inventario_modificado(user_id, list(range(page_start, page_end + 1)))
     except Exception as e:
         return False, f"Error DB: {str(e)}"
 
+    if rows_deseadas and ids_repe:
+        try:
+            uploader_nick = get_user_by_id(user_id).get('nick', 'Alguien')
+            matches_dict = _find_premium_matches_internal(ids_repe, user_id)
+            if matches_dict:
+                # Primero al outbox (durable, sin duplicados) y después al despachador
+                nuevas = save_outbox_alerts(user_id, uploader_nick, matches_dict)
+                notifications.despachar(nuevas, mark_outbox_sent, mark_outbox_failed)
+        except Exception as e:
+            # La carga ya quedó guardada: un error en las alertas no la da por fallida y el
+            # drenador las anota igual en su próxima ronda (recover_outbox_alerts)
+            print(f"Error notificando matches: {e}")
+    return True, f"¡Listo! Se actualizaron {cambios} figuritas."
+
 def get_completion_stats(user_id):
-    try:
-        data = supabase.table("inventory").select("sticker_num").eq("user_id", user_id).in_("status", ["tengo", "repetida", "repe"]).execute()
-        unique_stickers = {row['sticker_num'] for row in data.data}
-        return len(unique_stickers)
-    except Exception as e:
-        print(f"Error stats: {e}")
-        return 0
\ No newline at end of file
+    inv = get_inventory_bits(user_id)
+    if inv is None: return 0
+    return album_bits.contar(inv.poseidas)
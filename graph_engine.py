@@ -0,0 +1,359 @@
+import heapq
+import threading
+import time
+from itertools import islice
+import numpy as np
+import pandas as pd
+import album_bits
+from matching import aplanar_usuarios
+
+# --- MOTOR DE GRAFOS PARA TRIANGULACIÓN (EN PROCESO) ---
+# Reemplaza al RPC 'find_triangulations' (que no está versionado en el repo).
+# Se arma una vez por versión del snapshot del mercado:
+# - Usuarios ordenados por (provincia, zona): cada zona y cada provincia es un rango
+#   contiguo de índices, así la poda por provincia/zona es un searchsorted y no un filtro.
+# - Listas de adyacencia estilo CSR (punteros + índices, arrays NumPy):
+#   figurita -> usuarios que la ofrecen repetida, figurita -> usuarios que la buscan.
+# - Máscaras de bits por usuario (album_bits) para "qué le puede dar B a C".
+# Un ciclo es A -> B -> C -> A: A le da a B una repe que B busca, B le da a C una que
+# C busca y C le da a A la figurita objetivo. Misma definición que el RPC de referencia.
+
+ALCANCES = ('zona', 'provincia')
+PESO_FUERA_DE_ZONA = 1 << 40  # En el ranking, salir de la zona pesa más que cualquier reputación
+MAX_MEMO = 200_000  # Entradas de vecinos memorizados por grafo (se vacía al llenarse)
+MAX_SUFIJOS = 16    # Sufijos guardados por nodo de encuentro en la búsqueda bidireccional
+
+def _rangos(codigos):
+    """Array de códigos ordenado -> {código: (inicio, fin)} de cada tramo contiguo."""
+    rangos = {}
+    if len(codigos):
+        cortes = np.flatnonzero(np.diff(codigos)) + 1
+        for ini, fin in zip(np.r_[0, cortes], np.r_[cortes, len(codigos)]):
+            rangos[int(codigos[ini])] = (int(ini), int(fin))
+    return rangos
+
+def _csr(stickers, usuarios, n_stickers):
+    """(figurita, índice de usuario) -> (punteros, usuarios ordenados por figurita y luego por índice)."""
+    orden = np.lexsort((usuarios, stickers))
+    ptr = np.zeros(n_stickers + 2, dtype=np.int64)
+    np.add.at(ptr, stickers + 1, 1)
+    return np.cumsum(ptr), usuarios[orden].astype(np.int32)
+
+def _mascaras(usuarios, stickers, n_usuarios, n_stickers):
+    """Una máscara de bits (entero, como album_bits) por usuario, armada con una matriz booleana."""
+    bits = np.zeros((n_usuarios, n_stickers + 1), dtype=bool)
+    bits[usuarios, stickers] = True
+    empaquetado = np.packbits(bits, axis=1, bitorder='little')
+    return [int.from_bytes(fila.tobytes(), 'little') for fila in empaquetado]
+
+class GrafoMercado:
+    def __init__(self, market_df, version=None):
+        self.version = version
+        if market_df.empty:
+            market_df = pd.DataFrame({'user_id': [], 'sticker_num': [], 'status': [], 'users': []})
+        primeras = market_df.drop_duplicates('user_id')
+        por_usuario = aplanar_usuarios(primeras)
+        por_usuario['user_id'] = primeras['user_id'].values
+
+        # Usuarios ordenados por (provincia, zona, user_id): zonas y provincias quedan en rangos contiguos
+        provincias = por_usuario['province'].fillna('').astype(str)
+        claves_zona = list(zip(provincias, por_usuario['zone'].fillna('').astype(str)))
+        cod_zona, _ = pd.factorize(pd.Series(claves_zona, dtype=object), sort=True)
+        cod_prov, _ = pd.factorize(provincias, sort=True)
+        orden = np.lexsort((por_usuario['user_id'].values, cod_zona))
+        self.uids = por_usuario['user_id'].values[orden].astype(np.int64)
+        self.zona = cod_zona[orden]
+        self.provincia = cod_prov[orden]
+        self.idx = {int(u): i for i, u in enumerate(self.uids)}
+        info = por_usuario.iloc[orden]
+        self.nick = info['nick'].tolist()
+        self.phone = info['phone_encrypted'].tolist()
+        self.zona_nombre = info['zone'].tolist()
+        self.reputacion = [int(r or 0) for r in info['reputation'].tolist()]
+        self._rango_zona = _rangos(self.zona)
+        self._rango_provincia = _rangos(self.provincia)
+
+        # Sólo figuritas del álbum (1..ALBUM_SIZE): un número fuera de rango en la base no puede
+        # agrandar las matrices (n_usuarios x n_stickers) del armado
+        n_stickers = album_bits.ALBUM_SIZE
+        if len(market_df):
+            usr = pd.Index(self.uids).get_indexer(market_df['user_id'].values.astype(np.int64))
+            stk = market_df['sticker_num'].values.astype(np.int64)
+            status = market_df['status'].values
+            validas = (stk >= 1) & (stk <= n_stickers)
+            if not validas.all(): usr, stk, status = usr[validas], stk[validas], status[validas]
+        else:
+            usr = stk = np.array([], dtype=np.int64)
+            status = np.array([], dtype=object)
+        self.n_stickers = n_stickers
+        es_repe = np.isin(status, album_bits.ALIAS_REPETIDA)
+        es_wish = status == 'wishlist'
+        es_tengo = status == 'tengo'
+
+        # Máscaras por usuario (índice del grafo -> entero de bits)
+        self.repetidas = _mascaras(usr[es_repe], stk[es_repe], self.usuarios, n_stickers)
+        self.wishlist = _mascaras(usr[es_wish], stk[es_wish], self.usuarios, n_stickers)
+        self.poseidas = [t | r for t, r in zip(_mascaras(usr[es_tengo], stk[es_tengo], self.usuarios, n_stickers), self.repetidas)]
+
+        # CSR figurita -> usuarios
+        self.ofrecen_ptr, self.ofrecen = _csr(stk[es_repe], usr[es_repe], n_stickers)
+        self.buscan_ptr, self.buscan = _csr(stk[es_wish], usr[es_wish], n_stickers)
+        self._memo = {}  # Vecinos por (usuario, rango): válido para esta versión del grafo
+
+    @property
+    def usuarios(self):
+        return len(self.uids)
+
+    def _en_zona(self, ptr, lista, sticker, ini, fin):
+        """Usuarios de la lista CSR de 'sticker' cuyo índice cae en [ini, fin) (la zona)."""
+        if sticker < 0 or sticker > self.n_stickers: return lista[:0]
+        tramo = lista[ptr[sticker]:ptr[sticker + 1]]
+        return tramo[np.searchsorted(tramo, ini):np.searchsorted(tramo, fin)]
+
+    def _cadena(self, b, c, s1, s2, s3):
+        # Misma forma que arma triangulation.buscar_triangulacion para la UI
+        return {
+            "tipo": "triangulacion",
+            "target_id": int(self.uids[c]), "target_nick": self.nick[c] or 'Usuario',
+            "target_phone_enc": self.phone[c] or '', "target_tiene": s3, "target_zone": self.zona_nombre[c],
+            "bridge_id": int(self.uids[b]), "bridge_nick": self.nick[b] or 'Puente',
+            "bridge_phone_enc": self.phone[b] or '', "bridge_tiene": s2, "bridge_quiere": s1, "bridge_zone": self.zona_nombre[b],
+            "largo": 3, "intermedios": [],
+        }
+
+    def _cadena_ciclo(self, personas, stickers):
+        """
+        Ciclo A -> P1 -> ... -> Pm -> A. personas = [P1..Pm], stickers[i] = lo que recibe personas[i]
+        (stickers[0] lo entrega A) y stickers[-1] = lo que recibe A. Extiende la forma de _cadena:
+        P1 es el puente, Pm el objetivo y los del medio van en 'intermedios'.
+        """
+        cadena = self._cadena(personas[0], personas[-1], stickers[0], stickers[1], stickers[-1])
+        cadena["largo"] = len(personas) + 1
+        if len(personas) > 2:
+            cadena["tipo"] = "ciclo"
+            cadena["intermedios"] = [
+                {"id": int(self.uids[p]), "nick": self.nick[p] or 'Usuario', "phone_enc": self.phone[p] or '',
+                 "zone": self.zona_nombre[p], "recibe": stickers[i + 1], "entrega": stickers[i + 2]}
+                for i, p in enumerate(personas[1:-1])
+            ]
+        return cadena
+
+    def _rango(self, a, alcance):
+        if alcance == 'provincia': return self._rango_provincia[int(self.provincia[a])]
+        return self._rango_zona[int(self.zona[a])]
+
+    def _frontera(self, a, alcance):
+        """
+        Lo que no depende de la figurita objetivo: el rango de vecinos según el alcance,
+        el costo de cada vecino y los puentes B (vecinos que buscan alguna repe de A y no
+        la tienen, con s1 = la de menor número), ordenados por costo.
+        """
+        ini, fin = self._rango(a, alcance)
+        mi_zona = self.zona[a]
+
+        def costo(i):
+            return PESO_FUERA_DE_ZONA * int(self.zona[i] != mi_zona) - self.reputacion[i]
+
+        puentes = {}
+        for s in album_bits.ids(self.repetidas[a]):
+            for b in self._en_zona(self.buscan_ptr, self.buscan, s, ini, fin).tolist():
+                if b != a and b not in puentes and not (self.poseidas[b] >> s) & 1:
+                    puentes[b] = s
+        bs = sorted((costo(b), b, s1) for b, s1 in puentes.items())
+        return ini, fin, costo, bs
+
+    def _cadenas_hacia(self, a, t, frontera, memo_s2=None):
+        """Ciclos que le dan a A la figurita t, en orden de costo. memo_s2: {(B, C): s2} compartido."""
+        if not (self.wishlist[a] >> t) & 1 or (self.poseidas[a] >> t) & 1: return
+        ini, fin, costo, bs = frontera
+        if not bs: return
+
+        # C: vecinos que tienen la objetivo repetida
+        cs = sorted((costo(c), c) for c in self._en_zona(self.ofrecen_ptr, self.ofrecen, t, ini, fin).tolist() if c != a)
+        if not cs: return
+
+        # Pares (B, C) en orden de costo total: k-menores de dos listas ordenadas con un heap
+        heap = [(bs[i][0] + cs[0][0], i, 0) for i in range(len(bs))]
+        heapq.heapify(heap)
+        while heap:
+            _, i, j = heapq.heappop(heap)
+            if j + 1 < len(cs): heapq.heappush(heap, (bs[i][0] + cs[j + 1][0], i, j + 1))
+            _, b, s1 = bs[i]
+            c = cs[j][1]
+            if c == b: continue
+            if memo_s2 is None or (b, c) not in memo_s2:
+                s2 = album_bits.menor(self.repetidas[b] & self.wishlist[c] & ~self.poseidas[c])
+                if memo_s2 is not None: memo_s2[(b, c)] = s2
+            else: s2 = memo_s2[(b, c)]
+            if s2 is not None:
+                yield self._cadena(b, c, s1, s2, t)
+
+    def iter_triangulaciones(self, user_id, figu_objetivo, alcance='zona'):
+        """
+        Ciclos A -> B -> C -> A (A = user_id) que terminan dándole a A la figu_objetivo,
+        generados ya ordenados: primero los que no salen de la zona de A y después por
+        reputación (puente + objetivo) descendente. alcance: 'zona' o 'provincia'.
+        Es un generador: pedir los primeros k cuesta O(k log n), no enumerar todo.
+        """
+        a = self.idx.get(int(user_id))
+        if a is None: return iter(())
+        return self._cadenas_hacia(a, int(figu_objetivo), self._frontera(a, alcance))
+
+    def triangulaciones(self, user_id, figu_objetivo, alcance='zona', limite=None):
+        """Los primeros 'limite' ciclos de iter_triangulaciones (None = todos)."""
+        return list(islice(self.iter_triangulaciones(user_id, figu_objetivo, alcance), limite))
+
+    def mejores_por_figurita(self, user_id, objetivos=None, alcance='zona'):
+        """
+        La mejor cadena para cada figurita de 'objetivos' (None = toda la wishlist de A),
+        en un solo recorrido: la frontera de puentes se arma una vez y "qué le da B a C"
+        se calcula una vez por par aunque C tenga varias de las buscadas.
+        Devuelve {figurita: cadena}, sólo con las que tienen solución, por número.
+        """
+        a = self.idx.get(int(user_id))
+        if a is None: return {}
+        if objetivos is None: objetivos = album_bits.ids(self.wishlist[a])
+        frontera = self._frontera(a, alcance)
+        memo_s2 = {}
+        res = {}
+        for t in sorted({int(x) for x in objetivos}):
+            mejor = next(self._cadenas_hacia(a, t, frontera, memo_s2), None)
+            if mejor is not None: res[t] = mejor
+        return res
+
+    # --- CICLOS DE K PARTES (4 Y 5) ---
+    # En mercados chicos muchas figuritas sólo se consiguen con cadenas más largas.
+    # Búsqueda bidireccional: hacia adelante desde A (a quién le puede dar cada uno) y hacia
+    # atrás desde los que tienen la objetivo (quién le puede dar a cada uno); los dos frentes
+    # se encuentran en el medio, así cada lado explora la mitad de la profundidad.
+    # Los vecinos de cada usuario dentro de un rango de zona/provincia se memorizan en el
+    # grafo (vale mientras no cambie la versión del mercado). Todo corre con presupuesto
+    # de tiempo y de nodos: si se agota, se devuelve lo encontrado hasta ahí.
+
+    def _sucesores(self, x, ini, fin):
+        """{y: s} vecinos a los que x les puede dar algo que buscan (s = la de menor número)."""
+        clave = ('suc', x, ini, fin)
+        res = self._memo.get(clave)
+        if res is None:
+            res = {}
+            for s in album_bits.ids(self.repetidas[x]):
+                for y in self._en_zona(self.buscan_ptr, self.buscan, s, ini, fin).tolist():
+                    if y != x and y not in res and not (self.poseidas[y] >> s) & 1: res[y] = s
+            self._recordar(clave, res)
+        return res
+
+    def _predecesores(self, y, ini, fin):
+        """{x: s} vecinos que le pueden dar a y algo que busca (s = la de menor número)."""
+        clave = ('pred', y, ini, fin)
+        res = self._memo.get(clave)
+        if res is None:
+            res = {}
+            for s in album_bits.ids(self.wishlist[y] & ~self.poseidas[y]):
+                for x in self._en_zona(self.ofrecen_ptr, self.ofrecen, s, ini, fin).tolist():
+                    if x != y and x not in res: res[x] = s
+            self._recordar(clave, res)
+        return res
+
+    def _recordar(self, clave, valor):
+        if len(self._memo) >= MAX_MEMO: self._memo.clear()
+        self._memo[clave] = valor
+
+    def ciclos(self, user_id, figu_objetivo, k_max=5, alcance='zona', limite=20, presupuesto=None):
+        """
+        Ciclos de 3 hasta k_max partes (A incluido) que terminan dándole a A la figu_objetivo.
+        Ordenados por largo y, dentro de cada largo, como iter_triangulaciones.
+        presupuesto: Presupuesto (tiempo y nodos) para la parte de 4-5; al volver indica si se cortó.
+        Los triángulos cuestan lo mismo que en iter_triangulaciones y no consumen presupuesto.
+        """
+        presupuesto = presupuesto or Presupuesto()
+        a = self.idx.get(int(user_id))
+        t = int(figu_objetivo)
+        if a is None or not (self.wishlist[a] >> t) & 1 or (self.poseidas[a] >> t) & 1: return []
+        frontera = self._frontera(a, alcance)
+        ini, fin, costo, _ = frontera
+
+        res = list(islice(self._cadenas_hacia(a, t, frontera), limite))
+        ultimos = {c: t for c in self._en_zona(self.ofrecen_ptr, self.ofrecen, t, ini, fin).tolist() if c != a}
+        primeros = self._sucesores(a, ini, fin)
+        for k in range(4, k_max + 1):
+            # Las más cortas van primero: si ya se llenó el límite, las largas no se mostrarían
+            faltan = limite - len(res)
+            if faltan <= 0 or not ultimos or not primeros or presupuesto.agotado(): break
+            encontrados = []
+            for personas, stickers in self._caminos(a, primeros, ultimos, k - 1, ini, fin, costo, presupuesto, faltan * 10):
+                encontrados.append((sum(costo(p) for p in personas), personas, stickers))
+            encontrados.sort(key=lambda e: (e[0], e[1]))
+            res += [self._cadena_ciclo(personas, stickers) for _, personas, stickers in encontrados[:faltan]]
+        return res
+
+    def _caminos(self, a, primeros, ultimos, m, ini, fin, costo, presupuesto, tope):
+        """
+        Caminos P1 -> ... -> Pm sin repetir personas, con P1 en 'primeros' ({P1: lo que le da A})
+        y Pm en 'ultimos' ({Pm: lo que le da a A}). Genera (personas, stickers).
+        """
+        atras = m // 2          # pasos que se recorren desde Pm hacia atrás
+        adelante = m - 1 - atras  # pasos desde P1 hacia adelante
+
+        # Frente de atrás: nodo de encuentro -> sufijos (personas, stickers recibidos) hasta Pm
+        nivel = {pm: [([pm], [])] for pm in ultimos}
+        for _ in range(atras):
+            siguiente = {}
+            for y, caminos in nivel.items():
+                if not presupuesto.gastar(): break
+                for x, s in self._predecesores(y, ini, fin).items():
+                    if x == a: continue
+                    for personas, recibe in caminos:
+                        if x in personas: continue
+                        destino = siguiente.setdefault(x, [])
+                        if len(destino) < MAX_SUFIJOS: destino.append(([x] + personas, [s] + recibe))
+            nivel = siguiente
+        sufijos = nivel
+
+        # Frente de adelante: DFS desde cada P1 hasta la profundidad del encuentro (los más baratos primero)
+        encontrados = 0
+        pila = [([p1], [s1]) for p1, s1 in sorted(primeros.items(), key=lambda e: costo(e[0]), reverse=True)]
+        while pila:
+            if encontrados >= tope or not presupuesto.gastar(): return
+            personas, recibe = pila.pop()
+            x = personas[-1]
+            if len(personas) - 1 == adelante:
+                for sufijo, recibe_suf in sufijos.get(x, ()):
+                    if any(p in personas for p in sufijo[1:]): continue
+                    completo = personas + sufijo[1:]
+                    yield completo, recibe + recibe_suf + [ultimos[completo[-1]]]
+                    encontrados += 1
+                continue
+            for y, s in sorted(self._sucesores(x, ini, fin).items(), key=lambda e: costo(e[0]), reverse=True):
+                if y != a and y not in personas: pila.append((personas + [y], recibe + [s]))
+
+class Presupuesto:
+    """Límite de tiempo (ms) y de nodos expandidos para una búsqueda de ciclos."""
+    def __init__(self, ms=300, nodos=50000):
+        self.ms, self.nodos = ms, nodos
+        self.usados = 0
+        self.cortado = False
+        self._inicio = time.perf_counter()
+
+    def gastar(self, n=1):
+        self.usados += n
+        if self.usados > self.nodos or (time.perf_counter() - self._inicio) * 1000 > self.ms: self.cortado = True
+        return not self.cortado
+
+    def agotado(self):
+        return self.cortado
+
+class GrafoCache:
+    """Un grafo por versión del snapshot: se rearma sólo cuando el mercado cambió."""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._grafo = None
+        self._snapshot = None
+        self.builds = 0
+
+    def para(self, snapshot):
+        with self._lock:
+            if self._grafo is None or self._snapshot is not snapshot:
+                self._grafo = GrafoMercado(snapshot.df, version=snapshot.version)
+                self._snapshot = snapshot
+                self.builds += 1
+            return self._grafo
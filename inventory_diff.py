@@ -0,0 +1,67 @@
+import pandas as pd
+
+# --- GUARDADO POR DIFERENCIAS ---
+# Antes: DELETE de toda la página + INSERT de todo lo que hay en pantalla.
+# Ahora: se compara el estado nuevo con lo que hay en la base y se mandan
+# sólo las filas que cambiaron. El resultado final en la base es el mismo.
+
+CAMPOS = ("price", "quantity")
+
+def clave(row):
+    return (int(row['sticker_num']), str(row['status']))
+
+def filas_pagina(user_id, ui_owned_list, ui_wishlist_list, ui_repe_df):
+    """Mismas filas que insertaba save_inventory_positive a partir del estado de la UI."""
+    new_rows = []
+    for num in ui_owned_list:
+        new_rows.append({"user_id": user_id, "sticker_num": num, "status": "tengo", "price": 0, "quantity": 1})
+    for num in ui_wishlist_list:
+        if num not in ui_owned_list:
+            new_rows.append({"user_id": user_id, "sticker_num": num, "status": "wishlist", "price": 0, "quantity": 1})
+    if ui_repe_df is not None and not ui_repe_df.empty:
+        for _, row in ui_repe_df.iterrows():
+            es_venta = "Venta" in str(row['Modo'])
+            qty = int(row.get('Cantidad', 1))
+            new_rows.append({"user_id": user_id, "sticker_num": row['Figurita'], "status": "repetida", "price": int(row['Precio']) if es_venta else 0, "quantity": qty})
+    return new_rows
+
+def filas_carga_rapida(user_id, ids_tengo, ids_repe, ids_wish):
+    """Mismas filas que insertaba bulk_smart_update (una repe implica 'tengo')."""
+    set_repe = set(ids_repe)
+    final_tengo = set(ids_tengo).union(set_repe)
+    final_wish = set(ids_wish) - final_tengo
+    rows = [{"user_id": user_id, "sticker_num": num, "status": "tengo", "price": 0, "quantity": 1} for num in final_tengo]
+    rows += [{"user_id": user_id, "sticker_num": num, "status": "repetida", "price": 0, "quantity": 1} for num in set_repe]
+    rows += [{"user_id": user_id, "sticker_num": num, "status": "wishlist", "price": 0, "quantity": 1} for num in final_wish]
+    return rows
+
+def _normalizar(valor, default):
+    if valor is None or (isinstance(valor, float) and pd.isna(valor)): return default
+    return int(valor)
+
+def calcular_diff(actuales, deseadas):
+    """
+    actuales: filas de la base para la página (con 'id').
+    deseadas: filas que tienen que quedar (sin 'id').
+    Devuelve (upserts, ids_a_borrar): upserts son filas nuevas o con precio/cantidad distintos.
+    """
+    deseadas_por_clave = {}
+    for row in deseadas:
+        r = dict(row, sticker_num=int(row['sticker_num']))
+        deseadas_por_clave[clave(r)] = r  # Si la UI repite una clave, gana la última (igual que el INSERT)
+
+    ids_a_borrar = []
+    vistas = {}
+    for row in actuales:
+        k = clave(row)
+        if k not in deseadas_por_clave or k in vistas:
+            ids_a_borrar.append(row['id'])  # Sobra, o es un duplicado viejo de la misma clave
+            continue
+        vistas[k] = row
+
+    upserts = []
+    for k, row in deseadas_por_clave.items():
+        actual = vistas.get(k)
+        if actual is None or any(_normalizar(actual.get(c), 0 if c == 'price' else 1) != _normalizar(row.get(c), 0 if c == 'price' else 1) for c in CAMPOS):
+            upserts.append(row)
+    return upserts, ids_a_borrar
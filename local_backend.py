@@ -0,0 +1,451 @@
+import bisect
+import operator
+import re
+import threading
+from datetime import datetime, timezone
+from itertools import compress, islice
+import settlement
+import rollups
+import daily_credits
+import album_bits
+
+# --- BACKEND LOCAL (SIN SUPABASE) ---
+# Implementa en memoria el subconjunto del cliente de Supabase que usa database.py:
+#   table().select("*, users(nick, ...)", count="exact").eq().neq().in_().ilike()...
+#   .insert() / .update() / .upsert(on_conflict=...) / .delete() / .execute()
+#   rpc(nombre, params).execute()
+# Sirve para correr la app, benchmarks y profiling contra mercados sintéticos sin red.
+# Se activa con FIGUS_BACKEND=local (ver database.py).
+
+# Tabla embebida -> columna FK por defecto (ej: inventory.user_id -> users.id)
+FK_POR_DEFECTO = {'users': 'user_id'}
+
+# Valores por defecto de columnas (lo que en Postgres haría el DEFAULT de la tabla)
+DEFAULTS = {
+    'users': {'is_premium': False, 'is_admin': False, 'reputation': 0, 'daily_contacts_count': 0, 'telegram_chat_id': None},
+    'inventory': {'price': 0, 'quantity': 1},
+    'transaction_requests': {'status': 'pending'},
+}
+
+class Respuesta:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+def _igual(a, b):
+    if a == b: return True
+    if a is None or b is None: return False
+    return str(a) == str(b)
+
+def _clave(v):
+    """Clave normalizada para índices e in_ (1 y "1" son el mismo valor, como en PostgREST)."""
+    return None if v is None else str(v)
+
+def _comparable(v):
+    try: return float(v)
+    except (TypeError, ValueError): return str(v)
+
+def _ilike(valor, patron):
+    regex = '^' + re.escape(str(patron)).replace('%', '.*').replace('_', '.') + '$'
+    return valor is not None and re.match(regex, str(valor), re.IGNORECASE) is not None
+
+def _partir_select(columns):
+    """'*, users!inner(a, b)' -> ['*', 'users!inner(a, b)'] (respeta paréntesis)."""
+    partes, nivel, actual = [], 0, ''
+    for ch in columns:
+        if ch == ',' and nivel == 0:
+            partes.append(actual.strip()); actual = ''
+            continue
+        nivel += (ch == '(') - (ch == ')')
+        actual += ch
+    if actual.strip(): partes.append(actual.strip())
+    return partes
+
+class Query:
+    def __init__(self, cliente, tabla):
+        self._cliente = cliente
+        self._tabla = tabla
+        self._op = 'select'
+        self._columnas = '*'
+        self._count = None
+        self._payload = None
+        self._on_conflict = None
+        self._ignorar_duplicados = False
+        self._filtros = []
+        self._candidatos = []  # (columna, valores) de eq/in_: el cliente los resuelve con índices
+        self._id_desde = None  # (valor, incluido) de gt/gte sobre 'id': paginación por keyset
+        self._orden = []
+        self._limite = None
+        self._offset = 0
+
+    # --- Operaciones ---
+    def select(self, columns="*", count=None):
+        self._columnas, self._count = columns, count
+        return self
+
+    def insert(self, data):
+        self._op, self._payload = 'insert', data
+        return self
+
+    def update(self, data):
+        self._op, self._payload = 'update', data
+        return self
+
+    def upsert(self, data, on_conflict=None, ignore_duplicates=False):
+        self._op, self._payload, self._on_conflict = 'upsert', data, on_conflict
+        self._ignorar_duplicados = ignore_duplicates
+        return self
+
+    def delete(self):
+        self._op = 'delete'
+        return self
+
+    # --- Filtros ---
+    def _filtro(self, fn):
+        self._filtros.append(fn)
+        return self
+
+    def eq(self, col, v):
+        self._candidatos.append((col, [v]))
+        return self._filtro(lambda r: _igual(r.get(col), v))
+    def neq(self, col, v): return self._filtro(lambda r: not _igual(r.get(col), v))
+    def in_(self, col, vs):
+        vs = list(vs)
+        claves = {_clave(v) for v in vs}
+        self._candidatos.append((col, vs))
+        return self._filtro(lambda r: _clave(r.get(col)) in claves)
+    def gt(self, col, v):
+        if col == 'id': self._id_desde = (v, False)
+        return self._filtro(lambda r: r.get(col) is not None and _comparable(r.get(col)) > _comparable(v))
+    def gte(self, col, v):
+        if col == 'id': self._id_desde = (v, True)
+        return self._filtro(lambda r: r.get(col) is not None and _comparable(r.get(col)) >= _comparable(v))
+    def lt(self, col, v): return self._filtro(lambda r: r.get(col) is not None and _comparable(r.get(col)) < _comparable(v))
+    def lte(self, col, v): return self._filtro(lambda r: r.get(col) is not None and _comparable(r.get(col)) <= _comparable(v))
+    def ilike(self, col, patron): return self._filtro(lambda r: _ilike(r.get(col), patron))
+    def is_(self, col, v): return self._filtro(lambda r: r.get(col) is None if v in (None, 'null') else _igual(r.get(col), v))
+
+    def order(self, col, desc=False):
+        self._orden.append((col, desc))
+        return self
+
+    def limit(self, n):
+        self._limite = n
+        return self
+
+    def range(self, start, end):
+        self._offset, self._limite = start, end - start + 1
+        return self
+
+    def execute(self):
+        return self._cliente._ejecutar(self)
+
+    # --- Evaluación (la llama el cliente con el lock tomado) ---
+    def _filas(self, rows):
+        return [r for r in rows if all(f(r) for f in self._filtros)]
+
+    def _proyectar(self, rows):
+        partes = _partir_select(self._columnas)
+        simples = [p for p in partes if '(' not in p]
+        embebidas = [p for p in partes if '(' in p]
+        res = []
+        for r in rows:
+            if '*' in simples: fila = dict(r)
+            else: fila = {c: r.get(c) for c in simples}
+            descartar = False
+            for emb in embebidas:
+                nombre, cols = emb.split('(', 1)
+                cols = [c.strip() for c in cols.rstrip(')').split(',') if c.strip()]
+                tabla, _, pista = nombre.strip().partition('!')
+                inner = pista == 'inner'
+                fk = pista if pista and pista not in ('inner', 'left') else FK_POR_DEFECTO.get(tabla, f"{tabla.rstrip('s')}_id")
+                rel = self._cliente._por_id(tabla, r.get(fk))
+                if rel is None and inner:
+                    descartar = True
+                    break
+                fila[tabla] = None if rel is None else ({c: rel.get(c) for c in cols} if cols != ['*'] else dict(rel))
+            if not descartar: res.append(fila)
+        return res
+
+    def _ordenar_y_cortar(self, rows):
+        for col, desc in reversed(self._orden):
+            rows = sorted(rows, key=lambda r: (r.get(col) is None, _comparable(r.get(col)) if r.get(col) is not None else 0), reverse=desc)
+        if self._offset: rows = rows[self._offset:]
+        if self._limite is not None: rows = rows[:self._limite]
+        return rows
+
+class _LlamadaRPC:
+    def __init__(self, cliente, nombre, params):
+        self._cliente, self._nombre, self._params = cliente, nombre, params or {}
+
+    def execute(self):
+        return self._cliente._ejecutar_rpc(self._nombre, self._params)
+
+# --- PROCEDIMIENTOS DE LECTURA (REFERENCIA) ---
+# Versiones locales de los RPC de consulta que viven en Supabase (no están en el repo).
+# Hacen lo mismo que se espera del SQL, sin optimizar: sirven de línea de base.
+
+def find_triangulations(tablas, start_user_id, p_target=None, p_scope='zona', p_limit=20):
+    """
+    Ciclos A -> B -> C -> A con A = start_user_id, B y C en la misma provincia que A
+    (y en la misma zona si p_scope='zona'). A le da a B una repe que B busca, B le da a C
+    una que C busca y C le da a A una que A busca (p_target, si se indica).
+    Una fila por (puente, objetivo, figurita que recibe A), con la repe de menor número en
+    cada paso, ordenadas como sql/003_find_triangulations.sql y cortadas en p_limit.
+    """
+    users = {u['id']: u for u in tablas.get('users', [])}
+    yo = users.get(start_user_id)
+    if yo is None: return []
+    filas_por_usuario = {}
+    for r in tablas.get('inventory', []):
+        filas_por_usuario.setdefault(r['user_id'], []).append(r)
+    inv = {uid: album_bits.desde_filas(rows) for uid, rows in filas_por_usuario.items()}
+    mio = inv.get(start_user_id, album_bits.InventarioBits())
+    vecinos = [uid for uid, u in users.items() if uid != start_user_id and uid in inv
+               and u.get('province') == yo.get('province') and (p_scope == 'provincia' or u.get('zone') == yo.get('zone'))]
+    fuera = {uid: int(users[uid].get('zone') != yo.get('zone')) for uid in vecinos}
+    res = []
+    for b in vecinos:
+        s1 = album_bits.menor(album_bits.puede_dar(mio, inv[b], solo_wishlist=True))
+        if s1 is None: continue
+        for c in vecinos:
+            if c == b: continue
+            s2 = album_bits.menor(album_bits.puede_dar(inv[b], inv[c], solo_wishlist=True))
+            if s2 is None: continue
+            for s3 in album_bits.ids(album_bits.puede_dar(inv[c], mio, solo_wishlist=True)):
+                if p_target is not None and s3 != int(p_target): continue
+                res.append({
+                    'step1_user_id': b, 'step1_user': users[b].get('nick'), 'step1_phone': users[b].get('phone_encrypted'),
+                    'step1_zone': users[b].get('zone'), 'step1_sticker': s1,
+                    'step2_user_id': c, 'step2_user': users[c].get('nick'), 'step2_phone': users[c].get('phone_encrypted'),
+                    'step2_zone': users[c].get('zone'), 'step2_sticker': s2,
+                    'step3_sticker': s3,
+                })
+    res.sort(key=lambda r: (fuera[r['step1_user_id']] + fuera[r['step2_user_id']],
+                            -(int(users[r['step1_user_id']].get('reputation') or 0) + int(users[r['step2_user_id']].get('reputation') or 0)),
+                            r['step1_user_id'], r['step2_user_id']))
+    return res[:p_limit] if p_limit is not None else res
+
+LECTURA = {'find_triangulations': find_triangulations}
+TABLAS_LECTURA = {'find_triangulations': ('users', 'inventory')}
+
+# Columnas con índice hash (además de 'id'): las que usa database.py en eq/in_
+INDICES = {
+    'inventory': ('user_id', 'sticker_num'),
+    'users': ('phone_hash',),
+    'transaction_requests': ('receiver_id', 'sender_id'),
+    'contact_logs': ('user_id',),
+    'trade_proposals': ('user_id',),
+    'notification_outbox': ('idem_key',),
+}
+
+class LocalClient:
+    def __init__(self, tablas=None):
+        self._datos = {}    # tabla -> {id: fila} (orden de inserción)
+        self._indices = {}  # tabla -> columna -> {clave: {id: fila}}
+        self._ids = {}
+        self._ids_ordenados = {}  # tabla -> lista ordenada de ids (se descarta en cada escritura)
+        self.procedimientos = dict(settlement.PROCEDIMIENTOS, **LECTURA, **rollups.PROCEDIMIENTOS, **daily_credits.PROCEDIMIENTOS)
+        self.tablas_rpc = dict(settlement.TABLAS, **TABLAS_LECTURA, **rollups.TABLAS, **daily_credits.TABLAS)
+        self.event_hooks = {'request': []}  # Mismo formato que httpx: se llaman en cada round-trip
+        self._lock = threading.RLock()
+        if tablas: self.cargar(tablas)
+
+    # --- Interfaz del cliente de Supabase ---
+    def table(self, nombre):
+        return Query(self, nombre)
+
+    def rpc(self, nombre, params=None):
+        return _LlamadaRPC(self, nombre, params)
+
+    # --- Carga de datos ---
+    @property
+    def tablas(self):
+        """Copia de las tablas como listas de filas ({nombre: [filas]})."""
+        with self._lock:
+            return {n: list(d.values()) for n, d in self._datos.items()}
+
+    def cargar(self, tablas):
+        """Reemplaza el contenido de las tablas indicadas ({nombre: [filas]})."""
+        with self._lock:
+            for nombre, rows in tablas.items():
+                self._datos[nombre] = {}
+                self._indices[nombre] = {col: {} for col in INDICES.get(nombre, ())}
+                self._ids[nombre] = max((r.get('id') or 0 for r in rows), default=0)
+                for r in rows:
+                    self._agregar(nombre, r if r.get('id') is not None else dict(r, id=self._nuevo_id(nombre)))
+
+    def registrar_rpc(self, nombre, fn, tablas=None):
+        """
+        fn(tablas, **params) -> datos de respuesta. 'tablas' es {nombre: [filas]}.
+        tablas: nombres de las que lee o escribe (None = todas, lo más lento).
+        """
+        self.procedimientos[nombre] = fn
+        if tablas is None: self.tablas_rpc.pop(nombre, None)
+        else: self.tablas_rpc[nombre] = tuple(tablas)
+
+    # --- Internos ---
+    def _notificar(self, destino):
+        for hook in self.event_hooks['request']:
+            hook(destino)
+
+    def _tabla(self, nombre):
+        if nombre not in self._datos:
+            self._datos[nombre] = {}
+            self._indices[nombre] = {col: {} for col in INDICES.get(nombre, ())}
+        return self._datos[nombre]
+
+    def _agregar(self, nombre, row):
+        self._ids_ordenados.pop(nombre, None)
+        self._tabla(nombre)[row['id']] = row
+        for col, idx in self._indices[nombre].items():
+            idx.setdefault(_clave(row.get(col)), {})[row['id']] = row
+
+    def _quitar(self, nombre, row):
+        self._ids_ordenados.pop(nombre, None)
+        self._datos[nombre].pop(row['id'], None)
+        for col, idx in self._indices[nombre].items():
+            bucket = idx.get(_clave(row.get(col)))
+            if bucket is not None: bucket.pop(row['id'], None)
+
+    def _por_id(self, nombre, id_):
+        if id_ is None: return None
+        datos = self._tabla(nombre)
+        row = datos.get(id_)
+        if row is None and isinstance(id_, str) and id_.lstrip('-').isdigit(): row = datos.get(int(id_))
+        return row
+
+    def _candidatas(self, q, en_orden=False):
+        """
+        Filas a evaluar: el bucket más chico de algún índice que aplique, o toda la tabla.
+        en_orden: la tabla entera sale en orden de id (el dict queda en orden de escritura:
+        un update mueve la fila al final).
+        """
+        datos = self._tabla(q._tabla)
+        mejor = None
+        for col, valores in q._candidatos:
+            if col == 'id':
+                rows = [r for r in (self._por_id(q._tabla, v) for v in valores) if r is not None]
+            elif col in self._indices[q._tabla]:
+                idx = self._indices[q._tabla][col]
+                rows = [r for v in {_clave(v) for v in valores} for r in idx.get(v, {}).values()]
+            else:
+                continue
+            if mejor is None or len(rows) < len(mejor): mejor = rows
+        if mejor is not None: return sorted(mejor, key=lambda r: r['id'])
+        if q._id_desde is not None: return self._desde_id(q._tabla, *q._id_desde)
+        if en_orden: return (datos[i] for i in self._ids_en_orden(q._tabla))
+        return list(datos.values())
+
+    def _ids_en_orden(self, nombre):
+        ids = self._ids_ordenados.get(nombre)
+        if ids is None: ids = self._ids_ordenados[nombre] = sorted(self._datos[nombre])
+        return ids
+
+    def _desde_id(self, nombre, valor, incluido):
+        """Filas con id > valor (>= si incluido), en orden de id, sin recorrer las anteriores."""
+        ids = self._ids_en_orden(nombre)
+        datos = self._datos[nombre]
+        inicio = (bisect.bisect_left if incluido else bisect.bisect_right)(ids, _comparable(valor))
+        return (datos[ids[k]] for k in range(inicio, len(ids)))
+
+    def _seleccionar(self, q):
+        """Filas que cumplen los filtros. Con ORDER BY id + LIMIT corta apenas junta las necesarias."""
+        if q._orden == [('id', False)] and q._limite is not None and not q._count:
+            candidatas = self._candidatas(q, en_orden=True)
+            return list(islice((r for r in candidatas if all(f(r) for f in q._filtros)), q._offset + q._limite))
+        return q._filas(self._candidatas(q))
+
+    def _nuevo_id(self, nombre):
+        self._ids[nombre] = self._ids.get(nombre, 0) + 1
+        return self._ids[nombre]
+
+    def _completar(self, nombre, row):
+        nueva = dict(DEFAULTS.get(nombre, {}))
+        nueva.update(row)
+        if nueva.get('id') is None: nueva['id'] = self._nuevo_id(nombre)
+        else: self._ids[nombre] = max(self._ids.get(nombre, 0), nueva['id'])
+        nueva.setdefault('created_at', datetime.now(timezone.utc).isoformat())
+        return nueva
+
+    def _ejecutar(self, q):
+        self._notificar(f"{q._op} {q._tabla}")
+        with self._lock:
+            self._tabla(q._tabla)
+            payload = q._payload if isinstance(q._payload, list) else ([q._payload] if q._payload is not None else [])
+
+            if q._op == 'select':
+                filtradas = self._seleccionar(q)
+                count = len(filtradas) if q._count else None
+                return Respuesta(q._proyectar(q._ordenar_y_cortar(filtradas)), count)
+
+            if q._op == 'insert':
+                nuevas = [self._completar(q._tabla, r) for r in payload]
+                for r in nuevas: self._agregar(q._tabla, r)
+                return Respuesta([dict(r) for r in nuevas])
+
+            if q._op == 'update':
+                afectadas = q._filas(self._candidatas(q))
+                for r in afectadas:
+                    self._quitar(q._tabla, r)
+                    r.update(q._payload)
+                    self._agregar(q._tabla, r)
+                return Respuesta([dict(r) for r in afectadas])
+
+            if q._op == 'upsert':
+                claves = [c.strip() for c in (q._on_conflict or 'id').split(',')]
+                res = []
+                for nueva in payload:
+                    busqueda = Query(self, q._tabla)
+                    for c in claves: busqueda.eq(c, nueva.get(c))
+                    existente = next(iter(busqueda._filas(self._candidatas(busqueda))), None)
+                    if existente is not None and q._ignorar_duplicados:
+                        continue  # ON CONFLICT DO NOTHING: sólo se devuelven las insertadas
+                    if existente is not None:
+                        self._quitar(q._tabla, existente)
+                        existente.update(nueva)
+                    else:
+                        existente = self._completar(q._tabla, nueva)
+                    self._agregar(q._tabla, existente)
+                    res.append(dict(existente))
+                return Respuesta(res)
+
+            if q._op == 'delete':
+                borradas = q._filas(self._candidatas(q))
+                for r in borradas: self._quitar(q._tabla, r)
+                return Respuesta([dict(r) for r in borradas])
+
+            raise ValueError(f"Operación no soportada: {q._op}")
+
+    def _ejecutar_rpc(self, nombre, params):
+        self._notificar(f"rpc {nombre}")
+        fn = self.procedimientos.get(nombre)
+        if fn is None: raise Exception(f"RPC '{nombre}' no implementado en el backend local")
+        with self._lock:
+            # Los procedimientos trabajan sobre listas (y pueden reemplazarlas: todo o nada).
+            # Sólo se arman las tablas que declara el procedimiento (ver tablas_rpc)
+            nombres = self.tablas_rpc.get(nombre) or tuple(self._datos)
+            tablas = {n: list(self._tabla(n).values()) for n in nombres}
+            res = fn(tablas, **params)
+            for n, rows in tablas.items(): self._publicar(n, rows)
+            return Respuesta(res)
+
+    def _publicar(self, nombre, rows):
+        """
+        Aplica el resultado de un RPC: sólo se reindexan las filas que cambiaron.
+        Las filas sin tocar son los mismos objetos, así que se comparan por identidad (en C).
+        """
+        datos = self._tabla(nombre)
+        antes = list(datos.values())
+        if len(rows) == len(antes) and all(map(operator.is_, rows, antes)): return  # Sin cambios
+        ids_antes, ids_despues = set(map(id, antes)), set(map(id, rows))
+        salen, entran = ids_antes - ids_despues, ids_despues - ids_antes
+        for row in compress(antes, map(salen.__contains__, map(id, antes))):
+            self._quitar(nombre, row)
+        for row in compress(rows, map(entran.__contains__, map(id, rows))):
+            row = row if row.get('id') is not None else self._completar(nombre, row)
+            self._ids[nombre] = max(self._ids.get(nombre, 0), row['id'])
+            self._agregar(nombre, row)
+
+def crear_cliente(tablas=None):
+    return LocalClient(tablas)
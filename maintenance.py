@@ -0,0 +1,185 @@
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+# --- TRABAJOS DE MANTENIMIENTO POR LOTES (REANUDABLES) ---
+# Antes los botones del admin corrían UN delete/update sin límite desde el hilo de Streamlit:
+# en una tabla grande podía cortarse por timeout a mitad de camino y bloquear filas de todos.
+# Ahora cada operación es un Trabajo que se procesa en un hilo aparte, de a 'lote' filas
+# (keyset sobre id) con una pausa entre lotes, y deja un checkpoint en disco después de cada paso:
+# 1. Se leen las próximas filas (id > checkpoint).
+# 2. Si el trabajo archiva, se agregan al .jsonl.gz del trabajo (un miembro gzip por lote, con fsync).
+# 3. Se anotan sus ids como lote pendiente en el checkpoint.
+# 4. Se borran / actualizan esas filas y se avanza el checkpoint.
+# Si el proceso se cae, al arrancar se retoma el trabajo: un lote archivado y no aplicado se
+# aplica sin volver a archivarse, y lo que se escribió en el archivo después del último
+# checkpoint se trunca (ninguna fila se pierde ni queda dos veces).
+# Un solo trabajo a la vez por proceso. El archivo se lee con gzip.open (todos los miembros).
+
+ESTADOS_ACTIVOS = ('corriendo',)
+
+class Trabajo:
+    def __init__(self, nombre, titulo, leer, aplicar, preparar=None, contar=None, archivar=None):
+        """
+        leer(desde_id, limite, params): próximas filas (con 'id', ordenadas por id) a procesar.
+        aplicar(ids, params): borra / actualiza esas filas.
+        preparar(): params fijos del trabajo (ej: fecha de corte), se guardan en el checkpoint.
+        contar(params): total estimado, para la barra de progreso.
+        archivar: prefijo del archivo (ej: la tabla) o None si no se archiva.
+        """
+        self.nombre = nombre
+        self.titulo = titulo
+        self.leer = leer
+        self.aplicar = aplicar
+        self.preparar = preparar or (lambda: {})
+        self.contar = contar
+        self.archivar = archivar
+
+class Ejecutor:
+    def __init__(self, trabajos, directorio, lote=500, pausa=0.2):
+        self._trabajos = {t.nombre: t for t in trabajos}
+        self._dir = directorio
+        self._lote = lote
+        self._pausa = pausa
+        self._ruta = os.path.join(directorio, "mantenimiento.json")
+        self._lock = threading.Lock()
+        self._cancelar = threading.Event()
+        self._hilo = None
+        os.makedirs(directorio, exist_ok=True)
+        self._estado = self._cargar()  # nombre -> checkpoint
+
+    # --- API (panel de admin) ---
+    def lanzar(self, nombre):
+        """Arranca un trabajo en segundo plano. Devuelve (ok, mensaje)."""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive(): return False, "Ya hay un trabajo corriendo."
+            trabajo = self._trabajos[nombre]
+            inicio = datetime.now(timezone.utc)
+            self._estado[nombre] = {
+                "estado": "corriendo", "desde_id": 0, "lote_pendiente": [], "procesadas": 0, "total": None,
+                "params": None, "inicio": inicio.isoformat(), "fin": None, "error": None, "archivo_bytes": 0,
+                "archivo": os.path.join(self._dir, f"{trabajo.archivar}-{inicio:%Y%m%d-%H%M%S}.jsonl.gz") if trabajo.archivar else None}
+            self._guardar()
+            self._arrancar(nombre)
+        return True, f"{trabajo.titulo}: en marcha."
+
+    def reanudar(self):
+        """Retoma el trabajo que quedó corriendo (el proceso se cayó o se redeployó). Devuelve su nombre."""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive(): return None
+            for nombre, cp in self._estado.items():
+                if cp.get("estado") in ESTADOS_ACTIVOS and nombre in self._trabajos:
+                    self._arrancar(nombre)
+                    return nombre
+        return None
+
+    def continuar(self, nombre):
+        """Retoma un trabajo cancelado o con error desde su checkpoint."""
+        with self._lock:
+            if self._hilo is not None and self._hilo.is_alive(): return False, "Ya hay un trabajo corriendo."
+            cp = self._estado.get(nombre)
+            if not cp or cp.get("estado") not in ("cancelado", "error"): return False, "No hay nada para retomar."
+            cp.update(estado="corriendo", error=None, fin=None)
+            self._guardar()
+            self._arrancar(nombre)
+        return True, f"{self._trabajos[nombre].titulo}: retomado."
+
+    def cancelar(self):
+        """Frena después del lote en curso (el checkpoint queda listo para reanudar)."""
+        self._cancelar.set()
+
+    def estado(self):
+        with self._lock:
+            res = {}
+            for nombre, trabajo in self._trabajos.items():
+                cp = dict(self._estado.get(nombre) or {})
+                cp["titulo"] = trabajo.titulo
+                res[nombre] = cp
+            return res
+
+    # --- HILO ---
+    def _arrancar(self, nombre):
+        self._cancelar.clear()
+        self._hilo = threading.Thread(target=self._correr, args=(nombre,), name=f"mantenimiento-{nombre}", daemon=True)
+        self._hilo.start()
+
+    def _correr(self, nombre):
+        trabajo, cp = self._trabajos[nombre], self._estado[nombre]
+        try:
+            if cp["params"] is None:  # Fuera del hilo de Streamlit: preparar puede tardar
+                params = trabajo.preparar()
+                try: total = trabajo.contar(params) if trabajo.contar else None
+                except Exception: total = None
+                with self._lock:
+                    cp.update(params=params, total=total)
+                    self._guardar()
+            if cp["archivo"] and os.path.exists(cp["archivo"]) and os.path.getsize(cp["archivo"]) > cp["archivo_bytes"]:
+                with open(cp["archivo"], "r+b") as f: f.truncate(cp["archivo_bytes"])  # Lote archivado sin checkpoint
+            while True:
+                if cp["lote_pendiente"]: self._aplicar(trabajo, cp)
+                if self._cancelar.is_set():
+                    self._terminar(cp, "cancelado")
+                    return
+                rows = trabajo.leer(cp["desde_id"], self._lote, cp["params"])
+                if not rows:
+                    self._terminar(cp, "terminado")
+                    return
+                tamano = _archivar(cp["archivo"], rows) if cp["archivo"] else 0
+                with self._lock:
+                    cp["lote_pendiente"] = [r["id"] for r in rows]
+                    cp["archivo_bytes"] = tamano
+                    self._guardar()
+                self._aplicar(trabajo, cp)
+                time.sleep(self._pausa)  # Deja pasar las consultas de los usuarios entre lotes
+        except Exception as e:
+            # El checkpoint queda como estaba: 'Reanudar' sigue desde el último lote aplicado
+            with self._lock:
+                cp["error"] = str(e)
+                cp["estado"] = "error"
+                self._guardar()
+
+    def _aplicar(self, trabajo, cp):
+        ids = cp["lote_pendiente"]
+        trabajo.aplicar(ids, cp["params"])
+        with self._lock:
+            cp["procesadas"] += len(ids)
+            cp["desde_id"] = max(cp["desde_id"], max(ids))
+            cp["lote_pendiente"] = []
+            self._guardar()
+
+    def _terminar(self, cp, estado):
+        with self._lock:
+            cp["estado"] = estado
+            cp["fin"] = datetime.now(timezone.utc).isoformat()
+            self._guardar()
+
+    # --- CHECKPOINT EN DISCO ---
+    def _cargar(self):
+        try:
+            with open(self._ruta, encoding="utf-8") as f: return json.load(f)
+        except (OSError, ValueError): return {}
+
+    def _guardar(self):
+        # Escritura atómica: un corte a mitad de camino deja el checkpoint anterior
+        tmp = self._ruta + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._estado, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._ruta)
+
+def _archivar(ruta, rows):
+    datos = "".join(json.dumps(r, ensure_ascii=False, default=str) + "\n" for r in rows).encode("utf-8")
+    with open(ruta, "ab") as crudo:
+        with gzip.GzipFile(fileobj=crudo, mode="wb") as gz: gz.write(datos)
+        crudo.flush()
+        os.fsync(crudo.fileno())
+        return crudo.tell()
+
+def leer_archivo(ruta):
+    """Filas de un archivo de mantenimiento (.jsonl.gz)."""
+    with gzip.open(ruta, "rt", encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
@@ -0,0 +1,115 @@
+import threading
+import time
+from dataclasses import dataclass, field
+import numpy as np
+import pandas as pd
+
+# --- SNAPSHOT COMPARTIDO DEL MERCADO ---
+# Antes cada usuario tenía su propia copia cacheada del mercado (st.cache_data por user_id).
+# Ahora hay UN snapshot inmutable por proceso; cada usuario lo consulta excluyendo
+# sus propias filas en el momento de la consulta, sin copiarlo.
+
+@dataclass(frozen=True)
+class MarketSnapshot:
+    df: pd.DataFrame
+    version: int = 1
+    creado: float = field(default_factory=time.time)
+
+    @property
+    def filas(self):
+        return len(self.df)
+
+def normalizar_market_df(rows):
+    """Filas crudas de inventory (+ users anidado) -> DataFrame con tipos limpios."""
+    df = pd.DataFrame(rows)
+    if not df.empty:
+        df['sticker_num'] = pd.to_numeric(df['sticker_num'], errors='coerce').fillna(0).astype(int)
+        df['price'] = pd.to_numeric(df['price'], errors='coerce').fillna(0).astype(int)
+    return df
+
+def crear_snapshot(rows, version=1):
+    return MarketSnapshot(df=normalizar_market_df(rows), version=version)
+
+# --- CACHE VERSIONADO (INVALIDACIÓN FINA) ---
+# En vez de tirar el mercado entero cuando alguien guarda (fetch_market.clear()),
+# se reemplazan sólo las filas (user_id, sticker_num) que tocó esa escritura.
+# Las demás sesiones siguen usando el snapshot en memoria: no hay refetch completo.
+# Los patches se juntan hasta la próxima lectura y se aplican sobre el DataFrame anterior
+# (filtro vectorizado + concat de las filas nuevas): no se rearma el mercado desde los dicts.
+
+def _claves(df):
+    """(user_id, sticker_num) de cada fila empaquetado en un int64, para filtrar con np.isin."""
+    if df.empty: return np.zeros(0, dtype=np.int64)
+    return (df['user_id'].to_numpy(dtype=np.int64) << 32) | df['sticker_num'].to_numpy(dtype=np.int64)
+
+class MarketCache:
+    def __init__(self, cargar_todo, cargar_filas, ttl=60):
+        """
+        cargar_todo(): filas de todo el mercado (una consulta completa).
+        cargar_filas(user_id, stickers): filas actuales de ese usuario (stickers=None -> todas).
+        ttl: cada cuánto se fuerza una recarga completa (por escrituras de otros procesos).
+        """
+        self._cargar_todo = cargar_todo
+        self._cargar_filas = cargar_filas
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._pendientes = {}  # user_id -> {'todo': bool, 'filas': {sticker_num: [filas]}}
+        self._snapshot = None
+        self._claves = None    # alineado con self._snapshot.df
+        self._cargado_en = 0.0
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.patches = 0
+
+    def snapshot(self):
+        with self._lock:
+            if self._snapshot is None or time.time() - self._cargado_en > self._ttl:
+                self.misses += 1
+                self._pendientes = {}
+                self._version += 1
+                self._snapshot = crear_snapshot(list(self._cargar_todo()), version=self._version)
+                self._claves = _claves(self._snapshot.df)
+                self._cargado_en = time.time()
+            else:
+                self.hits += 1
+                if self._pendientes: self._aplicar_pendientes()
+            return self._snapshot
+
+    def patch_usuario(self, user_id, stickers=None):
+        """Refresca sólo las filas de user_id (opcionalmente, sólo esos stickers)."""
+        filas = self._cargar_filas(user_id, stickers)
+        with self._lock:
+            if self._snapshot is None: return  # Nada cacheado todavía: la próxima lectura carga todo
+            pend = self._pendientes.setdefault(user_id, {'todo': False, 'filas': {}})
+            if stickers is None: pend.update(todo=True, filas={})
+            else:
+                for num in stickers: pend['filas'][int(num)] = []
+            for row in filas:
+                pend['filas'].setdefault(int(row.get('sticker_num') or 0), []).append(row)
+            self.patches += 1
+
+    def invalidar(self):
+        with self._lock:
+            self._snapshot = None
+
+    def stats(self):
+        return {"version": self._version, "hits": self.hits, "misses": self.misses, "patches": self.patches,
+                "filas": self._snapshot.filas if self._snapshot is not None else 0}
+
+    def _aplicar_pendientes(self):
+        # Se arma un DataFrame nuevo por versión (el anterior sigue intacto para quien lo tenga en mano)
+        df = self._snapshot.df
+        usuarios = [uid for uid, p in self._pendientes.items() if p['todo']]
+        quitar = [(int(uid) << 32) | num for uid, p in self._pendientes.items() if not p['todo'] for num in p['filas']]
+        sale = np.zeros(len(df), dtype=bool)
+        if usuarios and not df.empty: sale |= np.isin(df['user_id'].to_numpy(dtype=np.int64), np.array(usuarios, dtype=np.int64))
+        if quitar: sale |= np.isin(self._claves, np.array(quitar, dtype=np.int64))
+        rows = [r for p in self._pendientes.values() for filas in p['filas'].values() for r in filas]
+        nuevos = normalizar_market_df(rows)
+        partes = [x for x in (df[~sale], nuevos) if not x.empty]
+        df = pd.concat(partes, ignore_index=True) if partes else df.iloc[0:0]
+        self._version += 1
+        self._snapshot = MarketSnapshot(df=df, version=self._version)
+        self._claves = np.concatenate([self._claves[~sale], _claves(nuevos)])
+        self._pendientes = {}
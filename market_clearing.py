@@ -0,0 +1,177 @@
+import argparse
+import sys
+import time
+from datetime import datetime, timezone
+import pandas as pd
+import album_bits
+import graph_engine
+
+# --- COMPENSACIÓN GLOBAL DEL MERCADO (JOB PERIÓDICO) ---
+# find_matches y la triangulación calculan por usuario y a pedido: nadie ve el mejor conjunto
+# de cambios simultáneos y la misma repe se le "promete" a varios. Este job lee el inventario
+# entero una vez y arma un conjunto de cambios SIN conflictos:
+#   1. Canjes directos 1 a 1 (A le da a B y B le da a A).
+#   2. Triángulos A -> B -> C -> A con lo que sobró.
+# Cada repe se usa como mucho 'quantity' veces y cada figurita buscada se recibe una sola vez.
+# Es un empaquetado greedy (las figuritas más escasas primero), no un óptimo exacto: el
+# problema general es NP-difícil y esto corre en minutos sobre 1M de filas.
+# Sólo entran repetidas para canje (precio 0): las que están a la venta no se comprometen.
+# Uso: python market_clearing.py [--dry-run]
+
+MAX_INTENTOS_TRIANGULO = 4000  # Pares (B, C) probados por usuario en la fase de triángulos
+
+class Compensacion:
+    def __init__(self, market_df):
+        self.filas = len(market_df)
+        df = market_df
+        if not df.empty:
+            # Las repes a la venta cuentan como "tengo": no se ofrecen, pero tampoco se buscan
+            en_venta = df['status'].isin(album_bits.ALIAS_REPETIDA) & (pd.to_numeric(df['price'], errors='coerce').fillna(0) > 0)
+            if en_venta.any():
+                df = df.copy()
+                df.loc[en_venta, 'status'] = 'tengo'
+        self.grafo = graph_engine.GrafoMercado(df)
+        g = self.grafo
+        self.oferta = list(g.repetidas)
+        self.demanda = [w & ~p for w, p in zip(g.wishlist, g.poseidas)]
+        self.cantidad = {}
+        if not df.empty:
+            repes = df[df['status'].isin(album_bits.ALIAS_REPETIDA)]
+            qty = pd.to_numeric(repes['quantity'], errors='coerce').fillna(1).clip(lower=1).astype(int)
+            for uid, num, q in zip(repes['user_id'].tolist(), repes['sticker_num'].astype(int).tolist(), qty.tolist()):
+                clave = (g.idx[int(uid)], num)
+                self.cantidad[clave] = self.cantidad.get(clave, 0) + q
+        # Escasez: cuántos la ofrecen (se reparten primero las más difíciles)
+        self._ofertas_por_figu = {s: int(g.ofrecen_ptr[s + 1] - g.ofrecen_ptr[s]) for s in range(g.n_stickers + 1)}
+        self.grupos = []  # [(tipo, [(da_idx, recibe_idx, sticker), ...])]
+
+    def _elegir(self, mascara):
+        """La figurita más escasa de la máscara (empate: la de menor número)."""
+        return min(album_bits.ids(mascara), key=lambda s: (self._ofertas_por_figu.get(s, 0), s))
+
+    def _mover(self, de, a, s):
+        clave = (de, s)
+        self.cantidad[clave] = self.cantidad.get(clave, 1) - 1
+        if self.cantidad[clave] <= 0: self.oferta[de] &= ~(1 << s)
+        self.demanda[a] &= ~(1 << s)
+
+    def _canjes_directos(self, ini, fin):
+        g = self.grafo
+        for u in range(ini, fin):
+            if not self.oferta[u] or not self.demanda[u]: continue
+            candidatos = []
+            vistos = set()
+            for s in album_bits.ids(self.oferta[u]):
+                for v in g._en_zona(g.buscan_ptr, g.buscan, s, ini, fin).tolist():
+                    if v != u and v not in vistos:
+                        vistos.add(v)
+                        candidatos.append(v)
+            for v in candidatos:
+                while True:
+                    da = self.oferta[u] & self.demanda[v]
+                    recibe = self.oferta[v] & self.demanda[u]
+                    if not da or not recibe: break
+                    s, r = self._elegir(da), self._elegir(recibe)
+                    self._mover(u, v, s)
+                    self._mover(v, u, r)
+                    self.grupos.append(('canje', [(u, v, s), (v, u, r)]))
+                if not self.oferta[u] or not self.demanda[u]: break
+
+    def _triangulos(self, ini, fin):
+        g = self.grafo
+        for a in range(ini, fin):
+            while self.oferta[a] and self.demanda[a]:
+                hecho = False
+                intentos = 0
+                cs = {c for t in album_bits.ids(self.demanda[a]) for c in g._en_zona(g.ofrecen_ptr, g.ofrecen, t, ini, fin).tolist() if c != a}
+                bs = {b for s in album_bits.ids(self.oferta[a]) for b in g._en_zona(g.buscan_ptr, g.buscan, s, ini, fin).tolist() if b != a}
+                for c in cs:
+                    recibe = self.oferta[c] & self.demanda[a]
+                    if not recibe: continue
+                    for b in bs:
+                        intentos += 1
+                        if b == c: continue
+                        s1 = self.oferta[a] & self.demanda[b]
+                        s2 = self.oferta[b] & self.demanda[c]
+                        if s1 and s2:
+                            s1, s2, s3 = self._elegir(s1), self._elegir(s2), self._elegir(recibe)
+                            self._mover(a, b, s1)
+                            self._mover(b, c, s2)
+                            self._mover(c, a, s3)
+                            self.grupos.append(('triangulo', [(a, b, s1), (b, c, s2), (c, a, s3)]))
+                            hecho = True
+                            break
+                        if intentos >= MAX_INTENTOS_TRIANGULO: break
+                    if hecho or intentos >= MAX_INTENTOS_TRIANGULO: break
+                if not hecho: break
+
+    def resolver(self):
+        """Corre las dos fases zona por zona. Devuelve las métricas de la corrida."""
+        t0 = time.perf_counter()
+        rangos = list(self.grafo._rango_zona.values())
+        for ini, fin in rangos: self._canjes_directos(ini, fin)
+        t1 = time.perf_counter()
+        for ini, fin in rangos: self._triangulos(ini, fin)
+        t2 = time.perf_counter()
+        canjes = sum(1 for tipo, _ in self.grupos if tipo == 'canje')
+        movidas = sum(len(pasos) for _, pasos in self.grupos)
+        return {"filas": self.filas, "usuarios": self.grafo.usuarios, "zonas": len(rangos),
+                "canjes": canjes, "triangulos": len(self.grupos) - canjes, "figuritas_movidas": movidas,
+                "seg_canjes": round(t1 - t0, 3), "seg_triangulos": round(t2 - t1, 3)}
+
+    def propuestas(self, batch_id):
+        """Una fila por participante y grupo, lista para la tabla trade_proposals."""
+        g = self.grafo
+        creado = datetime.now(timezone.utc).isoformat()
+        rows = []
+        for n, (tipo, pasos) in enumerate(self.grupos, 1):
+            recibe_de = {a: (de, s) for de, a, s in pasos}
+            for de, a, s in pasos:
+                origen, recibe = recibe_de[de]
+                rows.append({
+                    "batch_id": batch_id, "group_id": n, "kind": tipo, "user_id": int(g.uids[de]),
+                    "give_sticker": s, "give_to": int(g.uids[a]), "give_to_nick": g.nick[a],
+                    "receive_sticker": recibe, "receive_from": int(g.uids[origen]), "receive_from_nick": g.nick[origen],
+                    "created_at": creado,
+                })
+        return rows
+
+def correr(market_df, batch_id=None):
+    """Compensa el mercado y devuelve (propuestas, métricas con throughput)."""
+    batch_id = batch_id or int(time.time())
+    t0 = time.perf_counter()
+    comp = Compensacion(market_df)
+    t_armado = time.perf_counter() - t0
+    metricas = comp.resolver()
+    rows = comp.propuestas(batch_id)
+    total = time.perf_counter() - t0
+    metricas.update({"batch_id": batch_id, "propuestas": len(rows), "seg_armado": round(t_armado, 3),
+                     "seg_total": round(total, 3), "filas_por_seg": int(metricas["filas"] / total) if total else None})
+    return rows, metricas
+
+def main():
+    import database as db
+    parser = argparse.ArgumentParser(description="Compensación global del mercado (propuestas de canje sin conflictos).")
+    parser.add_argument("--dry-run", action="store_true", help="Calcula y reporta, sin escribir la tabla.")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    market_df = db.fetch_market(None)
+    t_lectura = time.perf_counter() - t0
+    # fetch_market devuelve un DataFrame vacío si falla la lectura: compensar "nada" dejaría a
+    # todos sin propuestas, así que se corta acá y queda publicada la tanda anterior
+    if market_df.empty:
+        print("No se pudo leer el mercado (o está vacío): no se publica nada.")
+        sys.exit(1)
+    rows, metricas = correr(market_df)
+    metricas["seg_lectura"] = round(t_lectura, 3)
+    if not args.dry_run:
+        t0 = time.perf_counter()
+        ok, msg = db.save_trade_proposals(metricas["batch_id"], rows)
+        metricas["seg_escritura"] = round(time.perf_counter() - t0, 3)
+        print(msg)
+    for k, v in metricas.items(): print(f"{k:>20}: {v}")
+    if not args.dry_run and not ok: sys.exit(1)
+
+if __name__ == "__main__":
+    main()
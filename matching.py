@@ -0,0 +1,75 @@
+import pandas as pd
+import album_bits
+
+# --- MOTOR DE MATCHING VECTORIZADO ---
+# Reemplaza el loop fila por fila de database.find_matches.
+# No toca la base de datos: recibe el mercado ya descargado y el inventario en bits del usuario.
+
+COLUMNAS_MATCH = ['nick', 'province', 'zone', 'phone_encrypted', 'figu', 'price', 'reputation', 'target_id', 'is_wishlist']
+
+def aplanar_usuarios(market_df):
+    """
+    Desarma la columna anidada 'users' en una sola pasada
+    (antes eran seis .apply(lambda) sobre todo el DataFrame).
+    """
+    users = [u or {} for u in market_df['users'].tolist()] if 'users' in market_df.columns else [{}] * len(market_df)
+    return pd.DataFrame({
+        'nick': [u.get('nick') for u in users],
+        'province': [u.get('province', 'Mendoza') for u in users],
+        'zone': [u.get('zone') for u in users],
+        'phone_encrypted': [u.get('phone_encrypted', '') for u in users],
+        'reputation': [u.get('reputation', 0) for u in users],
+    }, index=market_df.index)
+
+def mascaras_por_usuario(market_df, status):
+    """Un groupby por estado: {user_id: máscara de bits con sus figuritas}."""
+    sub = market_df[market_df['status'] == status]
+    if sub.empty: return {}
+    return sub.groupby('user_id')['sticker_num'].agg(album_bits.mascara).to_dict()
+
+def calcular_matches(market_df, mi_inv, excluir_user_id=None):
+    """
+    Devuelve (directos, ventas) con la misma forma que el loop original.
+    - ventas: repetidas con precio > 0 que no tengo.
+    - directos: repetidas a precio 0 que no tengo, si el otro no tiene alguna de mis repes.
+    mi_inv es el album_bits.InventarioBits del usuario.
+    excluir_user_id descarta las filas propias al consultar el snapshot compartido.
+    """
+    if market_df.empty: return [], []
+
+    es_oferta = market_df['status'] == 'repetida'
+    if excluir_user_id is not None: es_oferta &= market_df['user_id'] != excluir_user_id
+    ofertas = market_df[es_oferta]
+    if ofertas.empty: return [], []
+    figus = ofertas['sticker_num'].astype(int)
+    ofertas = ofertas[~album_bits.contiene(mi_inv.tengo, figus.values)]
+    if ofertas.empty: return [], []
+
+    datos = aplanar_usuarios(ofertas)
+    datos['figu'] = ofertas['sticker_num'].astype(int)
+    datos['price'] = ofertas['price']
+    datos['target_id'] = ofertas['user_id']
+    datos['is_wishlist'] = album_bits.contiene(mi_inv.wishlist, datos['figu'].values)
+    datos = datos[COLUMNAS_MATCH]
+
+    es_venta = datos['price'] > 0
+    ventas = datos[es_venta].to_dict('records')
+
+    # Canjes: "qué le sirve al otro" es un AND-NOT por usuario, no un filtro por fila
+    canjes = datos[~es_venta]
+    if not canjes.empty:
+        tengo_por_usuario = mascaras_por_usuario(market_df, 'tengo')
+        te_pide_por_usuario = {}
+        for uid in canjes['target_id'].unique().tolist():
+            # La repe de menor número que el otro no tiene
+            te_pide_por_usuario[uid] = album_bits.menor(mi_inv.repetidas & ~tengo_por_usuario.get(uid, 0))
+        canjes = canjes.assign(te_pide=canjes['target_id'].map(te_pide_por_usuario))
+        canjes = canjes[canjes['te_pide'].notna()]
+        canjes = canjes.assign(te_pide=canjes['te_pide'].astype(int))
+        directos = canjes.to_dict('records')
+    else:
+        directos = []
+
+    directos.sort(key=lambda x: (not x['is_wishlist'], -x['reputation']))
+    ventas.sort(key=lambda x: (not x['is_wishlist'], x['price'], -x['reputation']))
+    return directos, ventas
@@ -0,0 +1,469 @@
+import argparse
+import atexit
+import heapq
+import itertools
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import date
+import requests
+from requests.adapters import HTTPAdapter
+import config
+
+# --- DESPACHADOR DE NOTIFICACIONES (TELEGRAM) ---
+# Antes: un threading.Thread nuevo por cada carga y un requests.post suelto por mensaje
+# (sin sesión, sin timeout, sin reintentos). Una ráfaga de cargas abría decenas de hilos
+# y Telegram respondía 429.
+# Ahora hay UN despachador por proceso:
+# - Pool fijo de workers y una cola en memoria acotada (si se llena, se descarta y se cuenta).
+# - Una requests.Session con pool de conexiones (keep-alive) y timeout.
+# - Token buckets: uno global (Telegram: ~30 msg/s por bot) y uno por chat (~1 msg/s).
+#   Un mensaje que todavía no puede salir se re-agenda, no bloquea al worker.
+# - 429: se respeta retry_after. Errores de red / 5xx: backoff exponencial con jitter.
+# - Al cerrar el proceso se vacía la cola (con tope de tiempo).
+# - Métricas: profundidad de la cola, latencia de envío, enviados/fallidos/reintentos.
+# La URL base es configurable (FIGUS_TELEGRAM_API) para probarlo contra un Telegram falso.
+# Uso (outbox): python notifications.py drain | replay --desde YYYY-MM-DD [--hasta ...] | backfill --desde YYYY-MM-DD
+
+class TokenBucket:
+    """'tasa' tokens por segundo, hasta 'capacidad' acumulados."""
+    def __init__(self, tasa, capacidad=None):
+        self.tasa = float(tasa)
+        self.capacidad = float(capacidad if capacidad is not None else max(1.0, tasa))
+        self.tokens = self.capacidad
+        self.actualizado = time.monotonic()
+
+    def espera(self, ahora=None):
+        """Toma un token si hay (devuelve 0) o devuelve cuántos segundos faltan para el próximo."""
+        ahora = time.monotonic() if ahora is None else ahora
+        self.tokens = min(self.capacidad, self.tokens + (ahora - self.actualizado) * self.tasa)
+        self.actualizado = ahora
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.tasa
+
+    def pausar(self, segundos, ahora=None):
+        """Sin tokens durante 'segundos' (ej: retry_after de un 429)."""
+        ahora = time.monotonic() if ahora is None else ahora
+        self.tokens = min(self.tokens, 0.0) - segundos * self.tasa
+        self.actualizado = ahora
+
+class Mensaje:
+    __slots__ = ('chat_id', 'texto', 'encolado', 'intentos', 'al_terminar')
+
+    def __init__(self, chat_id, texto, al_terminar=None):
+        self.chat_id = chat_id
+        self.texto = texto
+        self.encolado = time.monotonic()
+        self.intentos = 0
+        self.al_terminar = al_terminar  # al_terminar(entregado: bool, rechazo: str | None), desde el worker
+
+class Notificador:
+    def __init__(self, token, base_url="https://api.telegram.org", workers=4, max_cola=10000,
+                 tasa_global=25, tasa_chat=1, max_reintentos=5, backoff=0.5, timeout=10):
+        self.url = f"{base_url.rstrip('/')}/bot{token}/sendMessage"
+        self.workers = workers
+        self.max_cola = max_cola
+        self.max_reintentos = max_reintentos
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._global = TokenBucket(tasa_global, max(1, tasa_global // 5))  # Ráfaga chica: picos por debajo del corte de Telegram
+        self._tasa_chat = tasa_chat
+        self._por_chat = {}
+        self._agenda = []  # heap de (listo_en, seq, Mensaje)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._en_vuelo = 0
+        self._activo = True
+        self._hilos = []
+        self._latencias = deque(maxlen=1000)  # ms por POST
+        self._demoras = deque(maxlen=1000)    # ms desde encolado hasta entregado
+        self.enviados = 0
+        self.fallidos = 0
+        self.descartados = 0
+        self.reintentos = 0
+
+    # --- API ---
+    def encolar(self, chat_id, texto, al_terminar=None):
+        """Agrega un mensaje a la cola. False si el despachador está cerrado o la cola llena."""
+        with self._cond:
+            if not self._activo or len(self._agenda) >= self.max_cola:
+                self.descartados += 1
+                return False
+            self._agendar(Mensaje(chat_id, texto, al_terminar), time.monotonic())
+            self._iniciar()
+        return True
+
+    def cerrar(self, timeout=10):
+        """Deja de aceptar mensajes y espera (hasta 'timeout' s) a que se vacíe la cola."""
+        limite = time.monotonic() + timeout
+        with self._cond:
+            self._activo = False
+            while (self._agenda or self._en_vuelo) and time.monotonic() < limite:
+                self._cond.wait(timeout=min(0.1, max(0.0, limite - time.monotonic())))
+            pendientes = len(self._agenda)
+            self._agenda.clear()
+            self._cond.notify_all()
+        for hilo in self._hilos: hilo.join(timeout=1)
+        self.session.close()
+        return pendientes
+
+    def metricas(self):
+        lat, dem = sorted(self._latencias), sorted(self._demoras)
+        return {"en_cola": len(self._agenda), "en_vuelo": self._en_vuelo, "enviados": self.enviados,
+                "fallidos": self.fallidos, "descartados": self.descartados, "reintentos": self.reintentos,
+                "latencia_p50_ms": _percentil(lat, 50), "latencia_p95_ms": _percentil(lat, 95),
+                "demora_p95_ms": _percentil(dem, 95)}
+
+    # --- INTERNO ---
+    def _agendar(self, msg, listo_en):
+        heapq.heappush(self._agenda, (listo_en, next(self._seq), msg))
+        self._cond.notify()
+
+    def _iniciar(self):
+        if not self._hilos:
+            for n in range(self.workers):
+                hilo = threading.Thread(target=self._trabajar, name=f"notificaciones-{n}", daemon=True)
+                hilo.start()
+                self._hilos.append(hilo)
+
+    def _siguiente(self):
+        """El próximo mensaje que ya puede salir (respetando los buckets), o None al cerrar."""
+        with self._cond:
+            while True:
+                if not self._agenda:
+                    if not self._activo: return None
+                    self._cond.wait()
+                    continue
+                ahora = time.monotonic()
+                listo_en, _, msg = self._agenda[0]
+                if listo_en > ahora:
+                    self._cond.wait(timeout=listo_en - ahora)
+                    continue
+                heapq.heappop(self._agenda)
+                bucket = self._por_chat.get(msg.chat_id)
+                if bucket is None: bucket = self._por_chat[msg.chat_id] = TokenBucket(self._tasa_chat, 1)
+                espera = bucket.espera(ahora)
+                if not espera:
+                    espera = self._global.espera(ahora)
+                    if espera: bucket.tokens += 1  # Se devuelve el token del chat: no salió
+                if espera:
+                    self._agendar(msg, ahora + espera)
+                    continue
+                self._en_vuelo += 1
+                return msg
+
+    def _trabajar(self):
+        while True:
+            msg = self._siguiente()
+            if msg is None: return
+            try: self._enviar(msg)
+            finally:
+                with self._cond:
+                    self._en_vuelo -= 1
+                    self._cond.notify_all()
+
+    def _enviar(self, msg):
+        msg.intentos += 1
+        reintentar_en = None
+        t0 = time.monotonic()
+        try:
+            r = self.session.post(self.url, data={"chat_id": msg.chat_id, "text": msg.texto, "parse_mode": "Markdown"},
+                                  timeout=self.timeout)
+            self._latencias.append((time.monotonic() - t0) * 1000)
+            if r.status_code == 429:
+                try: reintentar_en = float(r.json().get('parameters', {}).get('retry_after', 1))
+                except Exception: reintentar_en = 1.0
+                with self._cond: self._por_chat[msg.chat_id].pausar(reintentar_en)
+            elif r.status_code >= 500:
+                reintentar_en = self._backoff(msg)
+            elif r.status_code >= 400:
+                # 400/403 (chat inexistente, bot bloqueado, Markdown inválido): reintentar no sirve
+                print(f"Notificación rechazada ({r.status_code}) para {msg.chat_id}: {r.text[:200]}")
+                with self._cond: self.fallidos += 1
+                self._terminar(msg, False, f"{r.status_code}: {r.text[:200]}")
+                return
+        except requests.RequestException as e:
+            print(f"Error enviando notificación: {e}")
+            reintentar_en = self._backoff(msg)
+
+        with self._cond:
+            if reintentar_en is None:
+                self.enviados += 1
+                self._demoras.append((time.monotonic() - msg.encolado) * 1000)
+            elif msg.intentos > self.max_reintentos:
+                self.fallidos += 1
+            else:
+                self.reintentos += 1
+                self._agendar(msg, time.monotonic() + reintentar_en)
+                return
+        self._terminar(msg, reintentar_en is None)
+
+    def _terminar(self, msg, entregado, rechazo=None):
+        if msg.al_terminar is None: return
+        try: msg.al_terminar(entregado, rechazo)
+        except Exception as e: print(f"Error al cerrar la notificación: {e}")
+
+    def _backoff(self, msg):
+        return self.backoff * (2 ** (msg.intentos - 1)) * random.uniform(0.5, 1.5)
+
+def _percentil(valores, p):
+    if not valores: return None
+    return round(valores[min(len(valores) - 1, int(len(valores) * p / 100))], 1)
+
+# --- INSTANCIA DEL PROCESO ---
+_notificador = None
+_lock = threading.Lock()
+
+def get_notificador():
+    """El despachador compartido (None si no hay token de Telegram configurado)."""
+    global _notificador
+    token = getattr(config, 'TELEGRAM_BOT_TOKEN', None)
+    if not token or token == "TOKEN_NO_CONFIGURADO": return None
+    with _lock:
+        if _notificador is None:
+            _notificador = Notificador(token, base_url=config.TELEGRAM_API_URL, workers=config.NOTIF_WORKERS,
+                                       max_cola=config.NOTIF_MAX_COLA, tasa_global=config.NOTIF_TASA_GLOBAL,
+                                       tasa_chat=config.NOTIF_TASA_CHAT, max_reintentos=config.NOTIF_MAX_REINTENTOS)
+            atexit.register(_notificador.cerrar)
+        return _notificador
+
+# Los textos van con parse_mode=Markdown (el de Telegram, no MarkdownV2): un nick como
+# "x_figus" abría una itálica sin cerrar y Telegram rechazaba el mensaje con 400.
+LIMITE_MENSAJE = 4096   # caracteres por mensaje de Telegram
+NICKS_POR_FIGU = 5      # en el resumen, cuántos nicks se nombran por figurita ("y N más")
+
+def escapar(texto):
+    """Texto libre (nicks) seguro para Markdown: fuera de una entidad se escapan _ * ` [."""
+    return re.sub(r"([_*`\[])", r"\\\1", str(texto))
+
+def texto_alerta(uploader_nick, figus_encontradas):
+    figus_str = ", ".join(map(str, figus_encontradas))
+    return (
+        f"🔔 **¡Alerta de Mercado!**\n\n"
+        f"El usuario {escapar(uploader_nick)} acaba de publicar figuritas que buscabas:\n"
+        f"🔥 **#{figus_str}**\n\n"
+        f"Entrá ya a la app para ofertar."
+    )
+
+# --- OUTBOX DURABLE (sql/005_notification_outbox.sql) ---
+# Las alertas se anotan en la base junto con la carga (database.save_outbox_alerts) y recién
+# después se encolan acá. Una fila se marca enviada cuando Telegram la aceptó: si el proceso
+# muere antes, sigue pendiente y la retoma el drenador (entrega "al menos una vez").
+# Si muere entre el inventario y el outbox, el drenador anota la alerta desde su watermark
+# (database.recover_outbox_alerts, sql/009_outbox_watermark.sql).
+# Si Telegram la rechaza para siempre (400/403: bot bloqueado, texto inválido) se marca fallida
+# (sql/008_outbox_failures.sql) y el drenador no la vuelve a encolar.
+_en_curso = set()  # ids del outbox ya encolados en este proceso (el drenador no los repite)
+
+def despachar(filas, marcar_enviadas, marcar_fallidas=None):
+    """
+    Encola filas del outbox: un mensaje por (chat, quien cargó) con todas sus figuritas.
+    Con resumen (config.NOTIF_DIGEST_SEG > 0) se juntan por chat y salen en un solo mensaje al cerrar la ventana.
+    marcar_enviadas(ids) se llama cuando Telegram aceptó el mensaje; marcar_fallidas(ids, motivo)
+    cuando lo rechazó sin vuelta atrás. Devuelve cuántos mensajes encoló.
+    """
+    notificador = get_notificador()
+    if notificador is None or not filas: return 0
+    nuevas = []
+    with _lock:
+        for f in filas:
+            if f['id'] in _en_curso: continue
+            _en_curso.add(f['id'])
+            nuevas.append(f)
+    if config.NOTIF_DIGEST_SEG > 0:
+        _juntar(nuevas, marcar_enviadas, marcar_fallidas)
+        return 0
+    grupos = {}
+    for f in nuevas: grupos.setdefault((f['chat_id'], f.get('uploader_nick') or 'Alguien'), []).append(f)
+    return sum(_encolar(notificador, chat_id, grupo, marcar_enviadas, marcar_fallidas) for (chat_id, _), grupo in grupos.items())
+
+def _encolar(notificador, chat_id, filas, marcar_enviadas, marcar_fallidas=None):
+    """Encola el resumen de esas filas; si no entra en un mensaje, uno por parte. Devuelve cuántos."""
+    partes = partes_resumen(filas)
+    for parte in partes: _encolar_parte(notificador, chat_id, parte, marcar_enviadas, marcar_fallidas)
+    return len(partes)
+
+def _encolar_parte(notificador, chat_id, filas, marcar_enviadas, marcar_fallidas):
+    # Cada parte marca solo sus filas: si Telegram rechaza una, las otras no quedan colgadas
+    ids = [f['id'] for f in filas]
+
+    def al_terminar(entregado, rechazo=None):
+        try:
+            if entregado: marcar_enviadas(ids)
+            elif rechazo and marcar_fallidas is not None: marcar_fallidas(ids, rechazo)
+        finally:
+            with _lock: _en_curso.difference_update(ids)
+
+    if not notificador.encolar(chat_id, texto_resumen(filas), al_terminar):
+        with _lock: _en_curso.difference_update(ids)  # Cola llena: queda pendiente para el drenador
+
+def _por_figu(filas):
+    por_figu = {}
+    for f in filas: por_figu.setdefault(int(f['sticker_num']), set()).add(f.get('uploader_nick') or 'Alguien')
+    return por_figu
+
+def _linea_resumen(num, quienes):
+    nombres = [escapar(n) for n in sorted(quienes)[:NICKS_POR_FIGU]]
+    if len(quienes) > NICKS_POR_FIGU: nombres[-1] += f" y {len(quienes) - NICKS_POR_FIGU} más"
+    return f"🔥 **#{num}** ({', '.join(nombres)})"
+
+def partes_resumen(filas, limite=LIMITE_MENSAJE):
+    """
+    Parte las alertas de un chat por figurita de modo que el resumen de cada parte entre en un
+    mensaje (un premium con la wishlist llena y muchas cargas superaba los 4096 caracteres).
+    """
+    partes, actual, largo = [], [], 0
+    por_num = {}
+    for f in filas: por_num.setdefault(int(f['sticker_num']), []).append(f)
+    por_figu = _por_figu(filas)
+    # Cada línea ya incluye los nicks, así que el encabezado (con o sin nick) entra en el margen
+    disponible = limite - len(texto_resumen([])) - 50
+    for num in sorted(por_num):
+        extra = len(_linea_resumen(num, por_figu[num])) + 1
+        if actual and largo + extra > disponible:
+            partes.append(actual)
+            actual, largo = [], 0
+        actual.extend(por_num[num])
+        largo += extra
+    if actual: partes.append(actual)
+    return partes
+
+def texto_resumen(filas):
+    """Un mensaje para varias alertas de un chat: qué figuritas aparecieron y quién las cargó."""
+    por_figu = _por_figu(filas)
+    nicks = set().union(*por_figu.values())
+    if len(nicks) == 1: return texto_alerta(nicks.pop(), sorted(por_figu))
+    lineas = "\n".join(_linea_resumen(num, quienes) for num, quienes in sorted(por_figu.items()))
+    return (
+        f"🔔 **¡Resumen de Mercado!**\n\n"
+        f"Se publicaron {len(por_figu)} figuritas que buscabas:\n"
+        f"{lineas}\n\n"
+        f"Entrá ya a la app para ofertar."
+    )
+
+# --- RESUMEN POR CHAT (DIGEST) ---
+# Un usuario que carga diez páginas seguidas generaba hasta diez mensajes para cada premium.
+# Con NOTIF_DIGEST_SEG > 0 las alertas de cada chat se acumulan desde la primera y, cuando pasa
+# la ventana, sale UN mensaje con todas las figuritas y quiénes las cargaron. Mientras esperan
+# siguen pendientes en el outbox: si el proceso se cae, el drenador las vuelve a juntar.
+_digest = {}  # chat_id -> [vence_en, marcar_enviadas, marcar_fallidas, [filas]]
+_vaciador = None
+_despertar = threading.Event()
+digest_stats = {"mensajes": 0, "alertas": 0}
+
+def _juntar(filas, marcar_enviadas, marcar_fallidas=None):
+    global _vaciador
+    ahora = time.monotonic()
+    with _lock:
+        for f in filas:
+            buffer = _digest.setdefault(f['chat_id'], [ahora + config.NOTIF_DIGEST_SEG, marcar_enviadas, marcar_fallidas, []])
+            buffer[3].append(f)
+        if _vaciador is None:
+            _vaciador = threading.Thread(target=_vaciar_periodicamente, name="notificaciones-resumen", daemon=True)
+            _vaciador.start()
+            atexit.register(vaciar_resumenes, True)  # Corre antes que Notificador.cerrar (atexit es LIFO)
+    _despertar.set()
+
+def vaciar_resumenes(todos=False):
+    """Encola los resúmenes con la ventana cumplida (todos=True: todos, ej. al cerrar). Devuelve cuántos."""
+    notificador = get_notificador()
+    if notificador is None: return 0
+    ahora = time.monotonic()
+    with _lock:
+        listos = [c for c, (vence, _, _, _) in _digest.items() if todos or vence <= ahora]
+        salen = [(c, _digest.pop(c)) for c in listos]
+        for _, (_, _, _, filas) in salen:
+            digest_stats["mensajes"] += 1
+            digest_stats["alertas"] += len(filas)
+    return sum(_encolar(notificador, chat_id, filas, marcar, fallidas) for chat_id, (_, marcar, fallidas, filas) in salen)
+
+def _vaciar_periodicamente():
+    while True:
+        with _lock: proximo = min((v[0] for v in _digest.values()), default=None)
+        espera = None if proximo is None else max(0.0, proximo - time.monotonic())
+        _despertar.wait(espera)
+        _despertar.clear()
+        try: vaciar_resumenes()
+        except Exception as e: print(f"Error mandando resúmenes: {e}")
+
+class Drenador:
+    """
+    Hilo que cada 'intervalo' segundos encola las pendientes del outbox (las que no están en curso).
+    Antes de leerlas corre recuperar() (database.recover_outbox_alerts): anota las alertas de las
+    cargas que no llegaron a escribirlas (el proceso se cayó entre el inventario y el outbox).
+    """
+    def __init__(self, leer_pendientes, marcar_enviadas, intervalo=30, marcar_fallidas=None, recuperar=None):
+        self._leer = leer_pendientes
+        self._marcar = marcar_enviadas
+        self._marcar_fallidas = marcar_fallidas
+        self._recuperar = recuperar
+        self.recuperadas = 0
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self.rondas = 0
+        self.encolados = 0
+        self._hilo = threading.Thread(target=self._trabajar, name="outbox-drenador", daemon=True)
+        self._hilo.start()
+
+    def _trabajar(self):
+        while not self._parar.is_set():
+            try:
+                if self._recuperar is not None: self.recuperadas += self._recuperar()
+                self.encolados += despachar(self._leer(), self._marcar, self._marcar_fallidas)
+                self.rondas += 1
+            except Exception as e: print(f"Error drenando el outbox: {e}")
+            self._parar.wait(self.intervalo)
+
+    def parar(self):
+        self._parar.set()
+
+def iniciar_drenaje(leer_pendientes, marcar_enviadas, intervalo=None, marcar_fallidas=None, recuperar=None):
+    """Arranca el drenador del outbox (None si no hay token de Telegram)."""
+    if get_notificador() is None: return None
+    return Drenador(leer_pendientes, marcar_enviadas, intervalo or config.OUTBOX_INTERVALO, marcar_fallidas, recuperar)
+
+def get_metricas():
+    if _notificador is None: return None
+    metricas = _notificador.metricas()
+    with _lock:
+        metricas.update({"resumenes": digest_stats["mensajes"], "alertas_resumidas": digest_stats["alertas"],
+                         "en_resumen": sum(len(v[3]) for v in _digest.values())})
+    return metricas
+
+def main():
+    import database as db
+    parser = argparse.ArgumentParser(description="Outbox de alertas de Telegram: drenar, re-enviar o completar.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("drain", help="Manda las pendientes y termina.")
+    replay = sub.add_parser("replay", help="Vuelve a mandar las alertas de un rango de días (YYYY-MM-DD).")
+    replay.add_argument("--desde", required=True)
+    replay.add_argument("--hasta")
+    backfill = sub.add_parser("backfill", help="Anota y manda alertas de repetidas cargadas desde una fecha.")
+    backfill.add_argument("--desde", required=True)
+    args = parser.parse_args()
+
+    if get_notificador() is None:
+        print("TELEGRAM_BOT_TOKEN no configurado: no se puede enviar.")
+        return
+    dias = None
+    if args.comando == "replay":
+        print(f"{db.replay_outbox(args.desde, args.hasta)} alertas vuelven a quedar pendientes.")
+        dias = (date.today() - date.fromisoformat(args.desde)).days
+    elif args.comando == "backfill":
+        print(f"{db.backfill_outbox(args.desde)} alertas nuevas en el outbox.")
+        dias = (date.today() - date.fromisoformat(args.desde)).days
+    print(f"{despachar(db.get_pending_outbox(dias), db.mark_outbox_sent, db.mark_outbox_failed) + vaciar_resumenes(True)} mensajes encolados.")
+    pendientes = _notificador.cerrar(timeout=600)
+    for k, v in _notificador.metricas().items(): print(f"{k:>16}: {v}")
+    if pendientes: print(f"Quedaron {pendientes} sin mandar (siguen pendientes en el outbox).")
+
+if __name__ == "__main__":
+    main()
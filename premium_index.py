@@ -0,0 +1,139 @@
+import threading
+import time
+
+# --- ÍNDICE INVERTIDO DE WISHLISTS PREMIUM (ALERTAS) ---
+# Antes cada carga con repetidas hacía un join (inventory x users) sobre todas las wishlists
+# de esas figuritas, filtraba premium con chat y recién después respondía la UI.
+# Ahora hay UN índice por proceso: figurita -> {user_id premium con Telegram que la busca}.
+# Armar el dict de alertas es un lookup en memoria por figurita cargada.
+# Se mantiene desde las escrituras:
+# - wishlist: database._inventario_modificado (sólo consulta si el usuario está en el índice)
+# - premium / chat: verificar_pago_mp, set_premium (botón del admin), link_telegram_id
+# Cada 'ttl' segundos se rearma entero (cambios hechos por otros procesos) en un hilo aparte:
+# mientras tanto se sigue sirviendo el índice anterior y sólo corre un rearmado a la vez.
+# Hasta que termina el primero, matches() levanta IndiceNoListo y database consulta la base.
+# Los usuarios que cambian durante un rearmado se anotan y se vuelven a leer al terminar
+# (el rearmado pudo haberlos leído antes del cambio).
+
+class IndiceNoListo(RuntimeError):
+    pass
+
+class IndicePremium:
+    def __init__(self, cargar_premium, cargar_wishlists, cargar_usuario, ttl=600):
+        """
+        cargar_premium(): [(user_id, chat_id)] de los premium con Telegram vinculado.
+        cargar_wishlists(user_ids, stickers=None): [(user_id, sticker_num)] de sus wishlists.
+        cargar_usuario(user_id): (is_premium, chat_id) actuales de ese usuario.
+        """
+        self._cargar_premium = cargar_premium
+        self._cargar_wishlists = cargar_wishlists
+        self._cargar_usuario = cargar_usuario
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._chat = {}      # user_id -> chat_id
+        self._wishlist = {}  # user_id -> {figuritas}
+        self._por_figu = {}  # figurita -> {user_id}
+        self._cargado_en = None
+        self._rearmando = False
+        self._tocados = None  # user_ids modificados durante el rearmado en curso
+        self.recargas = 0
+
+    # --- LECTURA ---
+    def matches(self, stickers, excluir_user_id=None):
+        """{chat_id: [figuritas]} de los premium que buscan alguna de 'stickers' (misma forma que antes)."""
+        self._asegurar()
+        res = {}
+        with self._lock:
+            if self._cargado_en is None: raise IndiceNoListo("el índice premium todavía se está armando")
+            for num in sorted({int(n) for n in stickers}):
+                for uid in self._por_figu.get(num, ()):
+                    if uid != excluir_user_id: res.setdefault(self._chat[uid], []).append(num)
+        return res
+
+    def stats(self):
+        return {"premium": len(self._chat), "figuritas": len(self._por_figu),
+                "entradas": sum(len(w) for w in self._wishlist.values()), "recargas": self.recargas,
+                "rearmando": self._rearmando}
+
+    # --- MANTENIMIENTO ---
+    def iniciar(self):
+        """Arranca el primer armado en segundo plano (al levantar el proceso)."""
+        self._asegurar()
+
+    def _asegurar(self):
+        with self._lock:
+            vencido = self._cargado_en is None or time.time() - self._cargado_en > self._ttl
+            if not vencido or self._rearmando: return
+            self._rearmando, self._tocados = True, set()
+        threading.Thread(target=self._rearmar, name="indice-premium", daemon=True).start()
+
+    def _rearmar(self):
+        try: self.recargar()
+        except Exception as e: print(f"Error rearmando el índice premium: {e}")
+        finally:
+            with self._lock: self._rearmando, self._tocados = False, None
+
+    def recargar(self):
+        """Rearma todo el índice (2 consultas + lotes de wishlists) y repasa a los que cambiaron mientras tanto."""
+        with self._lock:
+            if self._tocados is None: self._tocados = set()
+        chats = dict(self._cargar_premium())
+        wishlists = {uid: set() for uid in chats}
+        if chats:
+            for uid, num in self._cargar_wishlists(list(chats)): wishlists[uid].add(int(num))
+        por_figu = {}
+        for uid, figus in wishlists.items():
+            for num in figus: por_figu.setdefault(num, set()).add(uid)
+        with self._lock:
+            self._chat, self._wishlist, self._por_figu = chats, wishlists, por_figu
+            self._cargado_en = time.time()
+            self.recargas += 1
+            tocados, self._tocados = self._tocados, None
+        for uid in tocados:
+            self.usuario_modificado(uid)
+            self.wishlist_modificada(uid)
+
+    def wishlist_modificada(self, user_id, stickers=None):
+        """Después de una escritura de inventario: refresca su wishlist (sólo si es premium con chat)."""
+        with self._lock:
+            if self._tocados is not None: self._tocados.add(user_id)
+        if self._cargado_en is None or user_id not in self._chat: return
+        filas = self._cargar_wishlists([user_id], stickers)
+        with self._lock:
+            if user_id not in self._chat: return
+            actuales = self._wishlist[user_id]
+            viejas = set(actuales) if stickers is None else actuales & {int(s) for s in stickers}
+            nuevas = {int(num) for _, num in filas}
+            for num in viejas - nuevas: self._sacar(user_id, num)
+            for num in nuevas - viejas: self._poner(user_id, num)
+
+    def usuario_modificado(self, user_id):
+        """Después de un cambio de premium o de chat: entra, sale o cambia de chat."""
+        with self._lock:
+            if self._tocados is not None: self._tocados.add(user_id)
+        if self._cargado_en is None: return
+        es_premium, chat_id = self._cargar_usuario(user_id)
+        if es_premium and chat_id:
+            with self._lock: ya_estaba = user_id in self._chat
+            filas = [] if ya_estaba else self._cargar_wishlists([user_id])
+            with self._lock:
+                self._chat[user_id] = chat_id
+                if not ya_estaba:
+                    self._wishlist[user_id] = set()
+                    for _, num in filas: self._poner(user_id, int(num))
+        else:
+            with self._lock:
+                for num in list(self._wishlist.get(user_id, ())): self._sacar(user_id, num)
+                self._wishlist.pop(user_id, None)
+                self._chat.pop(user_id, None)
+
+    def _poner(self, user_id, num):
+        self._wishlist[user_id].add(num)
+        self._por_figu.setdefault(num, set()).add(user_id)
+
+    def _sacar(self, user_id, num):
+        self._wishlist[user_id].discard(num)
+        usuarios = self._por_figu.get(num)
+        if usuarios is not None:
+            usuarios.discard(user_id)
+            if not usuarios: del self._por_figu[num]
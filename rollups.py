@@ -0,0 +1,193 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# --- SERIES DE ACTIVIDAD (ROLLUPS) PARA LA ANALÍTICA DEL ADMIN ---
+# Antes no había historia: contact_logs, transaction_requests y votes sólo se leían crudas.
+# Ahora un job pliega las filas NUEVAS de cada fuente (id > watermark) en cubetas:
+# - horarias: total y por provincia (se podan después de unos días)
+# - diarias: total, por provincia y por figurita
+# Métricas: desbloqueos (contact_logs), canjes y compras (transaction_requests, por tipo),
+# aceptadas y rechazadas (resolución de solicitudes) y votos.
+# Las solicitudes cambian después de insertarse (pending -> accepted, o se borran al rechazarse):
+# las pendientes quedan en el estado de la fuente y se revisan en cada pasada.
+# Cada tramo se suma y avanza el watermark en una sola llamada (fold_rollups, sql/006): con
+# varios procesos, el que llega tarde no suma nada.
+# Las cubetas son en hora argentina (offset fijo, sin horario de verano).
+# La provincia es la actual del usuario (quien desbloquea, quien propone, quien recibe el voto).
+
+METRICAS = ('desbloqueos', 'canjes', 'compras', 'aceptadas', 'rechazadas', 'votos')
+
+# Fuente -> (columnas, columna del usuario que define la provincia)
+FUENTES = {
+    'contact_logs': ("id, user_id, created_at", 'user_id'),
+    'transaction_requests': ("id, sender_id, fig_sent, fig_received, type, status, created_at", 'sender_id'),
+    'votes': ("id, target_id, created_at", 'target_id'),
+}
+
+TIPOS = {'exchange': 'canjes', 'purchase': 'compras'}
+
+def _instante(valor):
+    if not valor: return datetime.now(timezone.utc)
+    if isinstance(valor, datetime): return valor if valor.tzinfo else valor.replace(tzinfo=timezone.utc)
+    ts = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
+
+def cubetas(valor, offset_horas=-3):
+    """(hora, día) de un instante: inicios de cubeta en ISO con el offset local."""
+    local = _instante(valor).astimezone(timezone(timedelta(hours=offset_horas)))
+    hora = local.replace(minute=0, second=0, microsecond=0)
+    return hora.isoformat(), hora.replace(hour=0).isoformat()
+
+class Plegado:
+    """Incrementos de un tramo, ya agregados: (granularidad, cubeta, dimensión, clave, métrica) -> n."""
+    def __init__(self, offset_horas=-3):
+        self._offset = offset_horas
+        self._memo = {}  # 'AAAA-MM-DDTHH' (UTC) -> cubetas
+        self.sumas = {}
+
+    def _cubetas(self, instante):
+        # PostgREST devuelve timestamptz en UTC (+00:00): todas las filas de una misma hora
+        # caen en las mismas cubetas, se calculan una vez
+        if isinstance(instante, str) and instante.endswith('+00:00'):
+            res = self._memo.get(instante[:13])
+            if res is None: res = self._memo[instante[:13]] = cubetas(instante, self._offset)
+            return res
+        return cubetas(instante, self._offset)
+
+    def sumar(self, instante, metrica, provincia=None, figus=()):
+        hora, dia = self._cubetas(instante)
+        claves = [('h', hora, 'total', ''), ('d', dia, 'total', '')]
+        if provincia:
+            claves += [('h', hora, 'provincia', provincia), ('d', dia, 'provincia', provincia)]
+        claves += [('d', dia, 'figurita', str(int(f))) for f in figus if f]
+        for clave in claves:
+            clave += (metrica,)
+            self.sumas[clave] = self.sumas.get(clave, 0) + 1
+
+    def filas(self):
+        return [{"granularity": g, "bucket": b, "dimension": d, "key": k, "metric": m, "value": n}
+                for (g, b, d, k, m), n in self.sumas.items()]
+
+def plegar(fuente, rows, provincias, plegado):
+    """
+    Suma las filas nuevas de una fuente. provincias: {user_id: provincia}.
+    Devuelve las solicitudes que quedaron pendientes: [[id, provincia]].
+    """
+    columna = FUENTES[fuente][1]
+    pendientes = []
+    for r in rows:
+        prov = provincias.get(r.get(columna))
+        if fuente == 'contact_logs':
+            plegado.sumar(r.get('created_at'), 'desbloqueos', prov)
+        elif fuente == 'votes':
+            plegado.sumar(r.get('created_at'), 'votos', prov)
+        else:
+            metrica = TIPOS.get(r.get('type'))
+            if metrica is None: continue
+            figus = (r.get('fig_sent'), r.get('fig_received')) if metrica == 'canjes' else (r.get('fig_received'),)
+            plegado.sumar(r.get('created_at'), metrica, prov, figus)
+            # Las que ya llegan resueltas (primera pasada sobre historia) van a su día de creación
+            if r.get('status') == 'accepted': plegado.sumar(r.get('created_at'), 'aceptadas', prov)
+            elif (r.get('status') or 'pending') == 'pending': pendientes.append([r['id'], prov])
+    return pendientes
+
+def resolver(pendientes, estados, plegado, ahora=None):
+    """
+    Revisa las solicitudes pendientes. estados: {id: status} de las que todavía existen.
+    Aceptada -> 'aceptadas'; ya no existe (rechazada = borrada) -> 'rechazadas'; en la cubeta de 'ahora'.
+    Devuelve las que siguen pendientes.
+    """
+    siguen = []
+    for rid, prov in pendientes:
+        estado = estados.get(rid)
+        if estado is None: plegado.sumar(ahora, 'rechazadas', prov)
+        elif estado == 'accepted': plegado.sumar(ahora, 'aceptadas', prov)
+        elif estado == 'pending': siguen.append([rid, prov])
+    return siguen
+
+def tasa_aceptacion(aceptadas, rechazadas):
+    resueltas = (aceptadas or 0) + (rechazadas or 0)
+    return round(100 * aceptadas / resueltas, 1) if resueltas else None
+
+# --- VERSIÓN LOCAL DE fold_rollups (sql/006_activity_rollups.sql) ---
+def fold_rollups(tablas, p_source, p_version, p_last_id, p_pending, p_rows):
+    estados = tablas.setdefault('rollup_state', [])
+    estado = next((e for e in estados if e['source'] == p_source), None)
+    if estado is None:
+        estado = {'id': max((e['id'] for e in estados), default=0) + 1, 'source': p_source, 'last_id': 0, 'pending': [], 'version': 0}
+        estados.append(estado)
+    if estado['version'] != p_version: return {'ok': False, 'error': 'Otro proceso ya plegó este tramo.'}
+    estado.update(last_id=p_last_id, pending=p_pending, version=p_version + 1,
+                  updated_at=datetime.now(timezone.utc).isoformat())
+
+    series = tablas.setdefault('activity_rollups', [])
+    por_clave = {(s['granularity'], s['bucket'], s['dimension'], s['key'], s['metric']): s for s in series}
+    siguiente = max((s['id'] for s in series), default=0) + 1
+    for r in p_rows:
+        clave = (r['granularity'], r['bucket'], r['dimension'], r.get('key') or '', r['metric'])
+        if clave in por_clave: por_clave[clave]['value'] += int(r['value'])
+        else:
+            fila = dict(zip(('granularity', 'bucket', 'dimension', 'key', 'metric'), clave), id=siguiente, value=int(r['value']))
+            series.append(fila)
+            por_clave[clave] = fila
+            siguiente += 1
+    return {'ok': True, 'error': None}
+
+PROCEDIMIENTOS = {'fold_rollups': fold_rollups}
+TABLAS = {'fold_rollups': ('rollup_state', 'activity_rollups')}
+
+# --- JOB EN SEGUNDO PLANO ---
+class Plegador:
+    """
+    Hilo que cada 'intervalo' segundos corre el job de rollups (correr(avance) -> {fuente: filas}).
+    ahora() lo despierta antes de tiempo (botón del admin): el plegado nunca corre en el hilo
+    de Streamlit, que con mucha historia sin plegar quedaba bloqueado. avance(fuente, filas) lo
+    llama el job después de cada lote, para mostrar el progreso.
+    """
+    def __init__(self, correr, intervalo=300):
+        self._correr = correr
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._despertar = threading.Event()
+        self._lock = threading.Lock()
+        self.rondas = 0
+        self.plegadas = 0
+        self._en_curso = None   # {fuente: filas} de la ronda que está corriendo
+        self._ultima = None     # {"fin", "plegadas", "error"} de la última ronda
+        self._hilo = threading.Thread(target=self._trabajar, name="rollups", daemon=True)
+        self._hilo.start()
+
+    def _trabajar(self):
+        while not self._parar.is_set():
+            self._despertar.clear()
+            with self._lock: self._en_curso = {}
+            hechas, error = {}, None
+            try:
+                hechas = self._correr(self._avance)
+                self.plegadas += sum(hechas.values())
+                self.rondas += 1
+            except Exception as e:
+                print(f"Error plegando rollups: {e}")
+                error = str(e)
+            with self._lock:
+                self._en_curso = None
+                self._ultima = {"fin": time.time(), "plegadas": hechas, "error": error}
+            self._despertar.wait(self.intervalo)
+
+    def _avance(self, fuente, filas):
+        with self._lock:
+            if self._en_curso is not None: self._en_curso[fuente] = self._en_curso.get(fuente, 0) + filas
+
+    def ahora(self):
+        """Adelanta la próxima ronda (si hay una corriendo, se encadena otra al terminar)."""
+        self._despertar.set()
+
+    def estado(self):
+        with self._lock:
+            return {"corriendo": self._en_curso is not None, "en_curso": dict(self._en_curso or {}),
+                    "ultima": dict(self._ultima) if self._ultima else None, "rondas": self.rondas}
+
+    def parar(self):
+        self._parar.set()
+        self._despertar.set()
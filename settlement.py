@@ -0,0 +1,88 @@
+# --- LIQUIDACIÓN DE CANJES (VERSIÓN LOCAL) ---
+# Réplica en Python de las funciones de sql/002_settle_trades.sql, con la misma
+# semántica todo-o-nada. La usa el backend local (sin Supabase) para pruebas y benchmarks.
+# 'tablas' es un dict {nombre_tabla: [filas]}; los parámetros se llaman igual que en SQL.
+
+def _transaccion(tablas, nombres, fn):
+    """
+    Corre fn sobre copias de las listas y sólo las publica si terminó con ok (todo o nada).
+    Las filas no se modifican en el lugar: se reemplazan (las que no cambian son las mismas).
+    """
+    copia = {n: list(tablas.get(n, [])) for n in nombres}
+    res = fn(copia)
+    if res.get('ok'): tablas.update(copia)
+    return res
+
+def _siguiente_id(rows):
+    return max((r.get('id') or 0 for r in rows), default=0) + 1
+
+def _ok():
+    return {'ok': True, 'error': None}
+
+def _error(msg):
+    return {'ok': False, 'error': msg}
+
+def _consume_duplicate(t, user_id, sticker):
+    inv = t['inventory']
+    repes = sorted((r for r in inv if r['user_id'] == user_id and int(r['sticker_num']) == sticker and r['status'] == 'repetida'), key=lambda r: r.get('id') or 0)
+    if not repes: return False
+    row = repes[0]
+    qty = int(row.get('quantity') or 1)
+    if qty > 1: inv[inv.index(row)] = dict(row, quantity=qty - 1)
+    else: inv.remove(row)
+    return True
+
+def _receive_sticker(t, user_id, sticker):
+    inv = t['inventory']
+    inv[:] = [r for r in inv if not (r['user_id'] == user_id and int(r['sticker_num']) == sticker and r['status'] == 'wishlist')]
+    if not any(r['user_id'] == user_id and int(r['sticker_num']) == sticker and r['status'] == 'tengo' for r in inv):
+        inv.append({'id': _siguiente_id(inv), 'user_id': user_id, 'sticker_num': sticker, 'status': 'tengo', 'price': 0, 'quantity': 1})
+
+def _registrar_solicitud(t, user_id, target_id, fig_sent, fig_received, tipo):
+    reqs = t['transaction_requests']
+    reqs.append({'id': _siguiente_id(reqs), 'sender_id': user_id, 'receiver_id': target_id, 'fig_sent': fig_sent,
+                 'fig_received': fig_received, 'type': tipo, 'status': 'pending'})
+    t['contact_logs'][:] = [c for c in t['contact_logs'] if not (c['user_id'] == user_id and c['target_id'] == target_id)]
+
+def confirm_transaction(tablas, p_request_id, p_receiver_id):
+    def fn(t):
+        req = next((r for r in t['transaction_requests'] if r['id'] == p_request_id and r['receiver_id'] == p_receiver_id), None)
+        if req is None: return _error('La solicitud no existe.')
+        if req.get('status', 'pending') != 'pending': return _error('La solicitud ya fue procesada.')
+        if req.get('fig_received'):
+            _consume_duplicate(t, p_receiver_id, int(req['fig_received']))
+        if req['type'] == 'exchange' and req.get('fig_sent'):
+            _receive_sticker(t, p_receiver_id, int(req['fig_sent']))
+        reqs = t['transaction_requests']
+        reqs[reqs.index(req)] = dict(req, status='accepted')
+        t['contact_logs'][:] = [c for c in t['contact_logs'] if not (c['user_id'] == p_receiver_id and c['target_id'] == req['sender_id'])]
+        return _ok()
+    return _transaccion(tablas, ('inventory', 'transaction_requests', 'contact_logs'), fn)
+
+def settle_exchange(tablas, p_user_id, p_given, p_received, p_target_id=None):
+    def fn(t):
+        if not _consume_duplicate(t, p_user_id, int(p_given)):
+            return _error(f"No tenés la #{p_given} repetida.")
+        _receive_sticker(t, p_user_id, int(p_received))
+        if p_target_id is not None:
+            _registrar_solicitud(t, p_user_id, p_target_id, int(p_given), int(p_received), 'exchange')
+        return _ok()
+    return _transaccion(tablas, ('inventory', 'transaction_requests', 'contact_logs'), fn)
+
+def settle_purchase(tablas, p_user_id, p_received, p_target_id=None):
+    def fn(t):
+        _receive_sticker(t, p_user_id, int(p_received))
+        if p_target_id is not None:
+            _registrar_solicitud(t, p_user_id, p_target_id, None, int(p_received), 'purchase')
+        return _ok()
+    return _transaccion(tablas, ('inventory', 'transaction_requests', 'contact_logs'), fn)
+
+# Nombre del RPC -> implementación local
+PROCEDIMIENTOS = {
+    'confirm_transaction': confirm_transaction,
+    'settle_exchange': settle_exchange,
+    'settle_purchase': settle_purchase,
+}
+
+# Nombre del RPC -> tablas que lee o escribe (el backend local sólo copia y compara esas)
+TABLAS = {nombre: ('inventory', 'transaction_requests', 'contact_logs') for nombre in PROCEDIMIENTOS}
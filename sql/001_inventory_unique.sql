@@ -0,0 +1,14 @@
+-- Índice único para el guardado por diferencias (database._aplicar_diff_pagina).
+-- El upsert usa ON CONFLICT (user_id, sticker_num, status).
+
+-- 1. Limpiar duplicados viejos de la misma clave (queda el de id más chico).
+delete from inventory a
+using inventory b
+where a.user_id = b.user_id
+  and a.sticker_num = b.sticker_num
+  and a.status = b.status
+  and a.id > b.id;
+
+-- 2. Índice único.
+create unique index if not exists inventory_user_sticker_status_key
+  on inventory (user_id, sticker_num, status);
@@ -0,0 +1,86 @@
+-- Liquidación atómica de canjes y compras: una sola llamada RPC por operación.
+-- Cada función corre en una única transacción: o se aplica todo o no se aplica nada.
+-- La versión local (mismo comportamiento, para pruebas sin Supabase) está en settlement.py.
+-- Todas devuelven json: {"ok": bool, "error": texto | null}
+
+-- Descuenta una repetida (o borra la fila si era la última). Devuelve false si no la tenía.
+create or replace function _consume_duplicate(p_user_id bigint, p_sticker int)
+returns boolean language plpgsql as $$
+declare
+  r inventory%rowtype;
+begin
+  select * into r from inventory
+   where user_id = p_user_id and sticker_num = p_sticker and status = 'repetida'
+   order by id limit 1
+   for update;
+  if not found then return false; end if;
+  if coalesce(r.quantity, 1) > 1 then
+    update inventory set quantity = coalesce(r.quantity, 1) - 1 where id = r.id;
+  else
+    delete from inventory where id = r.id;
+  end if;
+  return true;
+end $$;
+
+-- Pasa una figurita de la wishlist a 'tengo' (si no la tenía ya).
+create or replace function _receive_sticker(p_user_id bigint, p_sticker int)
+returns void language plpgsql as $$
+begin
+  delete from inventory where user_id = p_user_id and sticker_num = p_sticker and status = 'wishlist';
+  if not exists (select 1 from inventory where user_id = p_user_id and sticker_num = p_sticker and status = 'tengo') then
+    insert into inventory (user_id, sticker_num, status, price, quantity) values (p_user_id, p_sticker, 'tengo', 0, 1);
+  end if;
+end $$;
+
+-- El receptor confirma una solicitud pendiente (canje o compra).
+create or replace function confirm_transaction(p_request_id bigint, p_receiver_id bigint)
+returns json language plpgsql as $$
+declare
+  req transaction_requests%rowtype;
+begin
+  select * into req from transaction_requests
+   where id = p_request_id and receiver_id = p_receiver_id
+   for update;
+  if not found then return json_build_object('ok', false, 'error', 'La solicitud no existe.'); end if;
+  if req.status <> 'pending' then return json_build_object('ok', false, 'error', 'La solicitud ya fue procesada.'); end if;
+
+  if req.fig_received is not null then
+    perform _consume_duplicate(p_receiver_id, req.fig_received::int);
+  end if;
+  if req.type = 'exchange' and req.fig_sent is not null then
+    perform _receive_sticker(p_receiver_id, req.fig_sent::int);
+  end if;
+
+  update transaction_requests set status = 'accepted' where id = p_request_id;
+  delete from contact_logs where user_id = p_receiver_id and target_id = req.sender_id;
+  return json_build_object('ok', true, 'error', null);
+end $$;
+
+-- El usuario cierra un canje: entrega una repe y recibe una figurita.
+create or replace function settle_exchange(p_user_id bigint, p_given int, p_received int, p_target_id bigint default null)
+returns json language plpgsql as $$
+begin
+  if not _consume_duplicate(p_user_id, p_given) then
+    return json_build_object('ok', false, 'error', format('No tenés la #%s repetida.', p_given));
+  end if;
+  perform _receive_sticker(p_user_id, p_received);
+  if p_target_id is not null then
+    insert into transaction_requests (sender_id, receiver_id, fig_sent, fig_received, type)
+    values (p_user_id, p_target_id, p_given, p_received, 'exchange');
+    delete from contact_logs where user_id = p_user_id and target_id = p_target_id;
+  end if;
+  return json_build_object('ok', true, 'error', null);
+end $$;
+
+-- El usuario cierra una compra: recibe una figurita.
+create or replace function settle_purchase(p_user_id bigint, p_received int, p_target_id bigint default null)
+returns json language plpgsql as $$
+begin
+  perform _receive_sticker(p_user_id, p_received);
+  if p_target_id is not null then
+    insert into transaction_requests (sender_id, receiver_id, fig_sent, fig_received, type)
+    values (p_user_id, p_target_id, null, p_received, 'purchase');
+    delete from contact_logs where user_id = p_user_id and target_id = p_target_id;
+  end if;
+  return json_build_object('ok', true, 'error', null);
+end $$;
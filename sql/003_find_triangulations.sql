@@ -0,0 +1,73 @@
+-- Triangulación con objetivo, alcance y límite dentro de la consulta.
+-- Antes: find_triangulations(start_user_id) devolvía TODOS los ciclos del usuario y
+-- triangulation.py descartaba en Python los que no terminaban en la figurita buscada.
+-- Ahora el servidor filtra por p_target, poda por zona/provincia y corta en p_limit,
+-- ya ordenado: primero los que no salen de la zona, después por reputación.
+-- Misma definición y orden que graph_engine.GrafoMercado.iter_triangulaciones
+-- (y que la versión de referencia en local_backend.find_triangulations).
+
+create index if not exists inventory_status_sticker_idx on inventory (status, sticker_num, user_id);
+
+drop function if exists find_triangulations(bigint);
+
+create or replace function find_triangulations(
+  start_user_id bigint,
+  p_target int default null,
+  p_scope text default 'zona',      -- 'zona' | 'provincia'
+  p_limit int default 20
+)
+returns table (
+  step1_user_id bigint, step1_user text, step1_phone text, step1_zone text, step1_sticker int,
+  step2_user_id bigint, step2_user text, step2_phone text, step2_zone text, step2_sticker int,
+  step3_sticker int
+)
+language sql stable as $$
+  with yo as (
+    select id, province, zone from users where id = start_user_id
+  ),
+  vecinos as (
+    select u.id, u.nick, u.phone_encrypted, u.zone, coalesce(u.reputation, 0) as reputation,
+           (u.zone is distinct from yo.zone)::int as fuera
+      from users u, yo
+     where u.id <> yo.id
+       and u.province = yo.province
+       and (p_scope = 'provincia' or u.zone is not distinct from yo.zone)
+  ),
+  poseidas as (
+    select user_id, sticker_num from inventory where status in ('tengo', 'repetida')
+  ),
+  -- A recibe: C tiene la objetivo repetida, A la busca y no la tiene
+  objetivos as (
+    select c.*, i.sticker_num::int as sticker
+      from vecinos c
+      join inventory i on i.user_id = c.id and i.status = 'repetida'
+     where (p_target is null or i.sticker_num = p_target)
+       and exists (select 1 from inventory w where w.user_id = start_user_id and w.status = 'wishlist' and w.sticker_num = i.sticker_num)
+       and not exists (select 1 from poseidas p where p.user_id = start_user_id and p.sticker_num = i.sticker_num)
+  ),
+  -- A -> B: la repe de A de menor número que B busca y no tiene
+  puentes as (
+    select b.*, min(r.sticker_num)::int as sticker
+      from vecinos b
+      join inventory w on w.user_id = b.id and w.status = 'wishlist'
+      join inventory r on r.user_id = start_user_id and r.status = 'repetida' and r.sticker_num = w.sticker_num
+     where not exists (select 1 from poseidas p where p.user_id = b.id and p.sticker_num = w.sticker_num)
+     group by b.id, b.nick, b.phone_encrypted, b.zone, b.reputation, b.fuera
+  )
+  select b.id, b.nick, b.phone_encrypted, b.zone, b.sticker,
+         c.id, c.nick, c.phone_encrypted, c.zone, s2.sticker,
+         c.sticker
+    from puentes b
+    join objetivos c on c.id <> b.id
+    -- B -> C: la repe de B de menor número que C busca y no tiene
+    cross join lateral (
+      select min(r.sticker_num)::int as sticker
+        from inventory r
+        join inventory w on w.user_id = c.id and w.status = 'wishlist' and w.sticker_num = r.sticker_num
+       where r.user_id = b.id and r.status = 'repetida'
+         and not exists (select 1 from poseidas p where p.user_id = c.id and p.sticker_num = r.sticker_num)
+    ) s2
+   where s2.sticker is not null
+   order by b.fuera + c.fuera, b.reputation + c.reputation desc, b.id, c.id
+   limit p_limit;
+$$;
@@ -0,0 +1,22 @@
+-- Propuestas precalculadas por el job de compensación global (market_clearing.py).
+-- Una fila por participante y grupo (canje directo o triángulo): qué da, a quién, qué recibe y de quién.
+-- El mercado las lee por user_id (índice): O(1) por usuario, sin recorrer el inventario.
+-- Cada corrida escribe un batch_id nuevo y después borra los anteriores.
+
+create table if not exists trade_proposals (
+  id bigint generated by default as identity primary key,
+  batch_id bigint not null,
+  group_id int not null,
+  kind text not null,                 -- 'canje' | 'triangulo'
+  user_id bigint not null references users(id) on delete cascade,
+  give_sticker int not null,
+  give_to bigint not null references users(id) on delete cascade,
+  give_to_nick text,
+  receive_sticker int not null,
+  receive_from bigint not null references users(id) on delete cascade,
+  receive_from_nick text,
+  created_at timestamptz not null default now()
+);
+
+create index if not exists trade_proposals_user_idx on trade_proposals (user_id, batch_id desc);
+create index if not exists trade_proposals_batch_idx on trade_proposals (batch_id);
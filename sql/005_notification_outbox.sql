@@ -0,0 +1,20 @@
+-- Outbox durable de alertas de Telegram (notifications.py).
+-- bulk_smart_update anota una fila por (chat, quien cargó, figurita, día) junto con la carga;
+-- un drenador en segundo plano las manda y les pone sent_at. Si el proceso se cae o se
+-- redeploya a mitad de envío, las pendientes (sent_at null) se retoman al arrancar.
+-- idem_key es única: volver a guardar la misma página el mismo día no re-alerta a nadie
+-- (el insert usa on conflict do nothing y devuelve sólo las filas nuevas).
+
+create table if not exists notification_outbox (
+  id bigint generated by default as identity primary key,
+  idem_key text not null unique,      -- chat_id:uploader_id:sticker_num:dia
+  chat_id text not null,
+  uploader_id bigint references users(id) on delete cascade,
+  uploader_nick text,
+  sticker_num int not null,
+  dia date not null,
+  created_at timestamptz not null default now(),
+  sent_at timestamptz
+);
+
+create index if not exists notification_outbox_pendientes_idx on notification_outbox (dia, id) where sent_at is null;
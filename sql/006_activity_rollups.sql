@@ -0,0 +1,51 @@
+-- Series de actividad para la analítica del admin (rollups.py).
+-- Un job pliega las filas nuevas de contact_logs, transaction_requests y votes en cubetas
+-- horarias y diarias (total, por provincia y, las diarias, por figurita). El panel grafica
+-- semanas de historia leyendo sólo estas filas, sin recorrer las tablas crudas.
+-- rollup_state guarda por fuente el último id plegado (watermark) y, para las solicitudes,
+-- las que siguen pendientes: se revisan en cada pasada (aceptada -> 'aceptadas',
+-- borrada -> 'rechazadas'). La versión local de fold_rollups está en rollups.py.
+
+create table if not exists activity_rollups (
+  id bigint generated by default as identity unique,  -- para leer paginado (database.iter_paginas)
+  granularity char(1) not null,   -- 'h' (hora) | 'd' (día)
+  bucket timestamptz not null,    -- inicio de la cubeta en hora argentina
+  dimension text not null,        -- 'total' | 'provincia' | 'figurita'
+  key text not null default '',
+  metric text not null,           -- desbloqueos | canjes | compras | aceptadas | rechazadas | votos
+  value bigint not null default 0,
+  primary key (granularity, bucket, dimension, key, metric)
+);
+
+create index if not exists activity_rollups_serie_idx on activity_rollups (granularity, dimension, bucket);
+
+create table if not exists rollup_state (
+  source text primary key,
+  last_id bigint not null default 0,
+  pending jsonb not null default '[]',   -- [[request_id, provincia]] de solicitudes abiertas
+  version bigint not null default 0,
+  updated_at timestamptz
+);
+
+-- Suma un tramo y avanza el watermark en la misma transacción.
+-- p_version es la versión leída: si otro proceso ya plegó ese tramo no se suma nada (ok = false).
+create or replace function fold_rollups(p_source text, p_version bigint, p_last_id bigint, p_pending jsonb, p_rows jsonb)
+returns json language plpgsql as $$
+begin
+  insert into rollup_state (source) values (p_source) on conflict do nothing;
+  update rollup_state
+     set last_id = p_last_id, pending = p_pending, version = version + 1, updated_at = now()
+   where source = p_source and version = p_version;
+  if not found then
+    return json_build_object('ok', false, 'error', 'Otro proceso ya plegó este tramo.');
+  end if;
+
+  insert into activity_rollups (granularity, bucket, dimension, key, metric, value)
+  select r->>'granularity', (r->>'bucket')::timestamptz, r->>'dimension', coalesce(r->>'key', ''),
+         r->>'metric', (r->>'value')::bigint
+    from jsonb_array_elements(p_rows) r
+  on conflict (granularity, bucket, dimension, key, metric)
+  do update set value = activity_rollups.value + excluded.value;
+
+  return json_build_object('ok', true, 'error', null);
+end $$;
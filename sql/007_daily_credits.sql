@@ -0,0 +1,30 @@
+-- Créditos diarios sin escritura al leer (daily_credits.py).
+-- Antes: verify_daily_reset hacía un UPDATE en cada rerun cuando cambiaba el día, el admin
+-- tenía un reset GLOBAL que reescribía todos los usuarios, y consume_credit escribía
+-- count + 1 calculado sobre la copia de la sesión (dos pestañas podían usar el mismo crédito).
+-- Ahora (last_contact_date, daily_contacts_count) se interpreta al leer: si la fecha no es
+-- hoy, lleva 0 usados. Consumir es UN update condicional: suma sólo si quedan créditos, y
+-- si la fecha guardada es de otro día arranca en 1. No hace falta ningún reset.
+-- La versión local está en daily_credits.py.
+
+create or replace function consume_daily_credit(p_user_id bigint, p_today date, p_limit int)
+returns json language plpgsql as $$
+declare
+  usados int;
+begin
+  if exists (select 1 from users where id = p_user_id and is_premium) then
+    return json_build_object('ok', true, 'usados', 0, 'error', null);
+  end if;
+
+  update users
+     set daily_contacts_count = case when last_contact_date = p_today then coalesce(daily_contacts_count, 0) + 1 else 1 end,
+         last_contact_date = p_today
+   where id = p_user_id
+     and (last_contact_date is distinct from p_today or coalesce(daily_contacts_count, 0) < p_limit)
+  returning daily_contacts_count into usados;
+
+  if not found then
+    return json_build_object('ok', false, 'usados', p_limit, 'error', 'Te quedaste sin créditos por hoy.');
+  end if;
+  return json_build_object('ok', true, 'usados', usados, 'error', null);
+end $$;
@@ -0,0 +1,13 @@
+-- Rechazos definitivos del outbox de alertas (notifications.py, sql/005_notification_outbox.sql).
+-- Antes un 403 (el usuario bloqueó al bot) o un 400 (Markdown inválido, texto demasiado largo)
+-- dejaba la fila con sent_at null: el drenador la volvía a encolar cada OUTBOX_INTERVALO durante
+-- OUTBOX_MAX_DIAS días, gastando el cupo global de mensajes en chats que nunca la iban a recibir.
+-- Ahora se marca failed_at (con el motivo) y las pendientes son sent_at null y failed_at null.
+-- 'notifications.py replay' las vuelve a dejar pendientes.
+
+alter table notification_outbox add column if not exists failed_at timestamptz;
+alter table notification_outbox add column if not exists error text;
+
+drop index if exists notification_outbox_pendientes_idx;
+create index if not exists notification_outbox_pendientes_idx on notification_outbox (dia, id)
+  where sent_at is null and failed_at is null;
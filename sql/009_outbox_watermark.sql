@@ -0,0 +1,14 @@
+-- Watermark del outbox de alertas (database.recover_outbox_alerts, notifications.Drenador).
+-- bulk_smart_update escribe el inventario y recién después anota las alertas: si el proceso se
+-- cae entre los dos pasos, la alerta se perdía y sólo la recuperaba un 'notifications.py backfill'
+-- a mano. Ahora el drenador, en cada ronda, anota las alertas de las repetidas con id mayor al
+-- watermark (idem_key evita duplicar las que la carga ya anotó) y lo avanza.
+-- Una sola fila (id = 1); el watermark sólo avanza (update ... where last_inventory_id < nuevo).
+
+create table if not exists outbox_state (
+  id int primary key default 1 check (id = 1),
+  last_inventory_id bigint not null default 0,
+  updated_at timestamptz not null default now()
+);
+
+create index if not exists inventory_repetidas_id_idx on inventory (id) where status in ('repetida', 'repe');
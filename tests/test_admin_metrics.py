@@ -0,0 +1,33 @@
+import threading
+import admin_metrics
+
+# --- RECÁLCULO EN SEGUNDO PLANO ---
+
+def _base():
+    return {"usuarios": 10, "premium": 2, "activos": 3, "por_provincia": {"CABA": 10},
+            "inventario": {"tengo": 100}, "top": []}
+
+def test_escrituras_durante_el_recalculo_no_se_pierden():
+    leyendo, soltar = threading.Event(), threading.Event()
+    def recalcular():
+        leyendo.set()
+        soltar.wait(5)
+        return _base()
+    metricas = admin_metrics.MetricasAdmin(recalcular, recalculo=0)
+    metricas._m, metricas.recalculado_en = _base(), 0  # vencidas: el próximo leer() recalcula
+    m = metricas.leer()
+    assert m['recalculando'] and m['usuarios'] == 10  # no bloquea: sirve las anteriores
+    leyendo.wait(5)
+    metricas.usuario_nuevo("CABA")
+    metricas.inventario([], [{"status": "tengo"}])
+    assert metricas.leer()['usuarios'] == 11
+    soltar.set()
+    metricas._recalculo = 3600  # que el leer() de abajo no dispare otro
+    metricas.recalcular()
+    m = metricas.leer()
+    assert m['usuarios'] == 11 and m['por_provincia'] == {"CABA": 11} and m['inventario'] == {"tengo": 101}
+
+def test_primera_lectura_espera_el_recalculo():
+    metricas = admin_metrics.MetricasAdmin(_base)
+    m = metricas.leer()
+    assert m['usuarios'] == 10 and not m['recalculando']
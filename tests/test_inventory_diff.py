@@ -0,0 +1,81 @@
+import os
+import random
+import pandas as pd
+import pytest
+
+os.environ.setdefault("FIGUS_BACKEND", "local")
+
+import database as db
+import inventory_diff
+import local_backend
+
+# --- GUARDADO POR DIFERENCIAS == DELETE + INSERT ---
+# Páginas al azar: el estado final de la base tiene que ser el mismo que dejaba el
+# save_inventory_positive original (DELETE de la página + INSERT de lo que hay en pantalla).
+
+USER_ID = 1
+OTRO_ID = 2
+PAGINAS = [(1, 20), (21, 40), (41, 60)]
+
+def _guardar_legacy(cliente, user_id, start, end, nuevas):
+    """Lo que hacía save_inventory_positive antes del diff."""
+    cliente.table("inventory").delete().eq("user_id", user_id).in_("sticker_num", list(range(start, end + 1))).execute()
+    if nuevas: cliente.table("inventory").insert(nuevas).execute()
+
+def _inventario_inicial(rng):
+    rows = []
+    for uid in (USER_ID, OTRO_ID):
+        for num in range(1, 61):
+            r = rng.random()
+            if r < 0.4: continue
+            rows.append({"user_id": uid, "sticker_num": num, "status": "tengo", "price": 0, "quantity": 1})
+            if r > 0.8:
+                rows.append({"user_id": uid, "sticker_num": num, "status": "repetida", "price": rng.choice([0, 500]), "quantity": rng.randint(1, 3)})
+            if r > 0.95:  # Duplicado viejo (anterior al índice único de sql/001)
+                rows.append({"user_id": uid, "sticker_num": num, "status": "tengo", "price": 0, "quantity": 1})
+        for num in rng.sample(range(1, 61), 10):
+            rows.append({"user_id": uid, "sticker_num": num, "status": "wishlist", "price": 0, "quantity": 1})
+    return [dict(r, id=i) for i, r in enumerate(rows, start=1)]
+
+def _estado_ui(rng, start, end):
+    nums = list(range(start, end + 1))
+    owned = sorted(rng.sample(nums, rng.randint(0, len(nums))))
+    wishlist = sorted(rng.sample(nums, rng.randint(0, 8)))
+    repes = rng.sample(owned, min(len(owned), rng.randint(0, 5)))
+    repe_df = pd.DataFrame([{"Figurita": n, "Modo": rng.choice(["Canje", "Venta"]), "Precio": rng.choice([0, 300, 1000]),
+                             "Cantidad": rng.randint(1, 4)} for n in repes])
+    return owned, wishlist, repe_df
+
+def _contenido(cliente):
+    return sorted((r["user_id"], int(r["sticker_num"]), r["status"], int(r.get("price") or 0), int(r.get("quantity") or 1))
+                  for r in cliente.tablas["inventory"])
+
+@pytest.mark.parametrize("seed", range(40))
+def test_diff_deja_lo_mismo_que_delete_insert(seed, monkeypatch):
+    rng = random.Random(seed)
+    inicial = _inventario_inicial(rng)
+    legacy = local_backend.crear_cliente({"users": [{"id": USER_ID}, {"id": OTRO_ID}], "inventory": [dict(r) for r in inicial]})
+    nuevo = local_backend.crear_cliente({"users": [{"id": USER_ID}, {"id": OTRO_ID}], "inventory": [dict(r) for r in inicial]})
+    monkeypatch.setattr(db, "supabase", nuevo)
+
+    for _ in range(3):  # Varios guardados seguidos sobre páginas al azar
+        start, end = rng.choice(PAGINAS)
+        owned, wishlist, repe_df = _estado_ui(rng, start, end)
+        filas = inventory_diff.filas_pagina(USER_ID, owned, wishlist, repe_df)
+        _guardar_legacy(legacy, USER_ID, start, end, [dict(r) for r in filas])
+        db._invalidar_inventario(USER_ID)
+        db._aplicar_diff_pagina(USER_ID, start, end, [dict(r) for r in filas])
+        assert _contenido(nuevo) == _contenido(legacy)
+
+def test_sin_cambios_no_escribe():
+    inicial = _inventario_inicial(random.Random(3))
+    actuales = [r for r in inicial if r["user_id"] == USER_ID and 1 <= r["sticker_num"] <= 20]
+    # Lo que ya hay (sin los duplicados viejos) no genera ni upserts ni deletes
+    deseadas, vistas = [], set()
+    for r in actuales:
+        if inventory_diff.clave(r) in vistas: continue
+        vistas.add(inventory_diff.clave(r))
+        deseadas.append({k: r[k] for k in ("user_id", "sticker_num", "status", "price", "quantity")})
+    upserts, borrar = inventory_diff.calcular_diff(actuales, deseadas)
+    assert upserts == []
+    assert len(borrar) == len(actuales) - len(deseadas)
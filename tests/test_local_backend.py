@@ -0,0 +1,21 @@
+import local_backend
+from database import iter_paginas
+
+# --- PAGINACIÓN POR ID DESPUÉS DE ESCRIBIR ---
+# Un update/upsert saca la fila del dict y la vuelve a poner al final: ORDER BY id + LIMIT
+# tiene que seguir devolviendo la primera página por id, no por orden de escritura.
+
+def _cliente():
+    c = local_backend.crear_cliente({"users": [{"id": i, "nick": f"u{i}"} for i in range(1, 6)]})
+    c.table("users").update({"nick": "cambiado"}).eq("id", 1).execute()
+    c.table("users").upsert({"id": 3, "nick": "otro"}).execute()
+    return c
+
+def test_primera_pagina_por_id_despues_de_un_update():
+    c = _cliente()
+    assert [r['id'] for r in c.table("users").select("id").order("id").limit(2).execute().data] == [1, 2]
+
+def test_iter_paginas_no_pierde_filas_movidas():
+    c = _cliente()
+    vistos = [r['id'] for chunk in iter_paginas(lambda: c.table("users").select("id, nick"), page_size=2) for r in chunk]
+    assert vistos == [1, 2, 3, 4, 5]
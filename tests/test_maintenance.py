@@ -0,0 +1,30 @@
+import os
+
+os.environ.setdefault("FIGUS_BACKEND", "local")
+
+import database as db
+import local_backend
+
+# --- LIMPIEZA DE SOLICITUDES vs ROLLUPS ---
+# Una solicitud pendiente al plegar queda en rollup_state.pending: si se acepta mientras corre
+# el trabajo y se borra, rollups.resolver la cuenta como rechazada.
+
+def _solicitud(status):
+    return {"status": status, "sender_id": 1, "receiver_id": 2, "type": "exchange", "fig_sent": 1, "fig_received": 2}
+
+def test_no_borra_las_pendientes_al_plegar(monkeypatch):
+    cliente = local_backend.crear_cliente({"users": [{"id": 1, "province": "CABA"}, {"id": 2, "province": "CABA"}]})
+    monkeypatch.setattr(db, "supabase", cliente)
+    cliente.table("transaction_requests").insert([_solicitud("accepted")] * 3 + [_solicitud("pending")] + [_solicitud("accepted")] * 3).execute()
+    trabajo = db._trabajos_mantenimiento()[0]
+    params = trabajo.preparar()
+    assert params == {"hasta_id": 7, "sin_plegar": [4]}
+    cliente.table("transaction_requests").update({"status": "accepted"}).eq("id", 4).execute()
+    desde = 0
+    while rows := trabajo.leer(desde, 2, params):
+        trabajo.aplicar([r['id'] for r in rows], params)
+        desde = rows[-1]['id']
+    assert [r['id'] for r in cliente.tablas["transaction_requests"]] == [4]
+    db.run_rollups()
+    metricas = {r['metric'] for r in cliente.tablas["activity_rollups"] if r['dimension'] == 'total'}
+    assert 'rechazadas' not in metricas
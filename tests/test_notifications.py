@@ -0,0 +1,30 @@
+import notifications
+
+# --- RESUMEN: LARGO Y MARKDOWN ---
+
+def _filas(n_figus, nicks):
+    return [{'id': i * len(nicks) + j, 'chat_id': 1, 'sticker_num': num, 'uploader_nick': nick}
+            for i, num in enumerate(range(1, n_figus + 1)) for j, nick in enumerate(nicks)]
+
+def test_resumen_largo_se_parte_en_mensajes_validos():
+    filas = _filas(200, [f"coleccionista_{k:03d}" for k in range(8)])
+    partes = notifications.partes_resumen(filas)
+    assert len(partes) > 1
+    assert all(len(notifications.texto_resumen(p)) <= notifications.LIMITE_MENSAJE for p in partes)
+    # Cada fila sale en exactamente una parte y una figurita no se reparte entre dos
+    assert sorted(f['id'] for p in partes for f in p) == sorted(f['id'] for f in filas)
+    figus = [{f['sticker_num'] for f in p} for p in partes]
+    assert sum(map(len, figus)) == len(set().union(*figus))
+
+def test_resumen_corto_es_un_solo_mensaje():
+    filas = _filas(3, ["ana", "beto"])
+    assert notifications.partes_resumen(filas) == [filas]
+
+def test_nicks_con_markdown_se_escapan():
+    assert "x\\_figus" in notifications.texto_alerta("x_figus", [5])
+    texto = notifications.texto_resumen(_filas(2, ["x_figus", "*estrella*"]))
+    assert "x\\_figus" in texto and "\\*estrella\\*" in texto
+
+def test_muchos_nicks_por_figurita_se_resumen():
+    texto = notifications.texto_resumen(_filas(1, [f"n{k}" for k in range(12)]))
+    assert "y 7 más" in texto
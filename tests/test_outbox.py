@@ -0,0 +1,39 @@
+import os
+
+os.environ.setdefault("FIGUS_BACKEND", "local")
+
+import database as db
+import inventory_diff
+import local_backend
+
+# --- RECUPERACIÓN DEL OUTBOX DESDE EL WATERMARK ---
+# Si el proceso se cae entre la escritura del inventario y la del outbox, el drenador anota
+# la alerta en su próxima ronda (y no duplica las que la carga sí anotó).
+
+def _cliente(monkeypatch):
+    cliente = local_backend.crear_cliente({
+        "users": [{"id": 1, "nick": "vende"}, {"id": 2, "nick": "busca", "is_premium": True, "telegram_chat_id": "900"}],
+        "inventory": [{"user_id": 2, "sticker_num": 7, "status": "wishlist"}]})
+    monkeypatch.setattr(db, "supabase", cliente)
+    monkeypatch.setattr(db, "_find_premium_matches_internal",
+                        lambda stickers, uid: {"900": [n for n in stickers if n == 7]} if 7 in stickers else {})
+    return cliente
+
+def test_carga_sin_outbox_se_recupera(monkeypatch):
+    cliente = _cliente(monkeypatch)
+    assert db.recover_outbox_alerts() == 0  # primera vez: sólo fija el watermark
+    # La carga escribió el inventario y se cayó antes de anotar la alerta
+    db._aplicar_diff_pagina(1, 1, 20, inventory_diff.filas_carga_rapida(1, [], [7], []))
+    assert cliente.tablas.get("notification_outbox", []) == []
+    assert db.recover_outbox_alerts() == 1
+    assert [(r['chat_id'], r['sticker_num']) for r in cliente.tablas["notification_outbox"]] == [("900", 7)]
+    assert db.recover_outbox_alerts() == 0  # el watermark avanzó
+
+def test_no_duplica_lo_que_la_carga_ya_anoto(monkeypatch):
+    cliente = _cliente(monkeypatch)
+    db.recover_outbox_alerts()
+    monkeypatch.setattr(db, "_inventario_modificado", lambda *a: None)
+    ok, _ = db.bulk_smart_update(1, 1, 20, [], [7], [])
+    assert ok and len(cliente.tablas["notification_outbox"]) == 1
+    assert db.recover_outbox_alerts() == 0
+    assert len(cliente.tablas["notification_outbox"]) == 1
@@ -0,0 +1,39 @@
+import threading
+import pytest
+import premium_index
+
+# --- REARMADO EN SEGUNDO PLANO ---
+
+def _indice(wishlists, premium, soltar):
+    def cargar_premium():
+        soltar.wait(5)
+        return list(premium.items())
+    def cargar_wishlists(uids, stickers=None):
+        return [(u, n) for u in uids for n in wishlists.get(u, ()) if stickers is None or n in stickers]
+    return premium_index.IndicePremium(cargar_premium, cargar_wishlists, lambda u: (u in premium, premium.get(u)), ttl=600)
+
+def _esperar(indice):
+    while indice.stats()["rearmando"]: threading.Event().wait(0.01)
+
+def test_sin_primer_armado_no_bloquea_y_avisa():
+    soltar = threading.Event()
+    indice = _indice({1: {5}}, {1: 100}, soltar)
+    indice.iniciar()
+    with pytest.raises(premium_index.IndiceNoListo): indice.matches([5])
+    soltar.set()
+    _esperar(indice)
+    assert indice.matches([5]) == {100: [5]}
+    assert indice.recargas == 1
+
+def test_cambios_durante_el_rearmado_no_se_pierden():
+    soltar = threading.Event()
+    wishlists = {1: {5}}
+    indice = _indice(wishlists, {1: 100}, soltar)
+    indice.iniciar()
+    indice.iniciar()  # un solo rearmado a la vez
+    wishlists[1].add(7)
+    indice.wishlist_modificada(1)
+    soltar.set()
+    _esperar(indice)
+    assert indice.matches([5, 7]) == {100: [5, 7]}
+    assert indice.recargas == 1
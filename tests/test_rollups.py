@@ -0,0 +1,28 @@
+import threading
+import rollups
+
+# --- PLEGADOR: BOTÓN DEL ADMIN EN SEGUNDO PLANO ---
+
+def _esperar(cond):
+    for _ in range(500):
+        if cond(): return
+        threading.Event().wait(0.01)
+    raise AssertionError("no pasó a tiempo")
+
+def test_ahora_despierta_al_plegador_y_muestra_el_avance():
+    soltar, rondas = threading.Event(), []
+    def correr(avance):
+        rondas.append(1)
+        if len(rondas) == 1: return {}
+        avance("votes", 500)
+        soltar.wait(5)
+        return {"votes": 500}
+    plegador = rollups.Plegador(correr, intervalo=3600)
+    _esperar(lambda: plegador.rondas == 1)
+    plegador.ahora()  # sin esperar la hora del intervalo
+    _esperar(lambda: plegador.estado()['en_curso'] == {"votes": 500})
+    assert plegador.estado()['corriendo']
+    soltar.set()
+    _esperar(lambda: plegador.rondas == 2)
+    assert plegador.estado()['ultima']['plegadas'] == {"votes": 500}
+    plegador.parar()
@@ -0,0 +1,24 @@
+import threading
+import pytest
+import user_search
+
+# --- ARMADO EN SEGUNDO PLANO ---
+
+def test_armado_en_segundo_plano_no_pierde_altas_ni_cambios():
+    leyendo, soltar = threading.Event(), threading.Event()
+    filas = [{"id": 1, "nick": "martina", "zone": "Palermo", "province": "CABA"},
+             {"id": 2, "nick": "tomas", "zone": "Centro", "province": "Córdoba"}]
+    def cargar_todos():
+        leyendo.set()
+        soltar.wait(5)
+        yield from filas
+    indice = user_search.IndiceUsuarios(cargar_todos, lambda _: [], sync=10 ** 9)
+    with pytest.raises(user_search.IndiceNoListo): indice.buscar("martina")
+    leyendo.wait(5)
+    indice.agregar({"id": 3, "nick": "martin", "zone": "Nueva Córdoba", "province": "Córdoba"})
+    indice.actualizar(1, "Mendoza", "Godoy Cruz")  # el armado ya había leído la fila vieja
+    soltar.set()
+    while not indice.listo: threading.Event().wait(0.01)
+    assert indice.buscar("martin") == [3, 1]
+    assert indice.buscar("mendoza") == [1]
+    assert indice.buscar("palermo") == []
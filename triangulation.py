@@ -1,52 +1,113 @@
+from itertools import islice
+import config
 import database as db
+import graph_engine
 
-def buscar_triangulacion(user, figu_objetivo, mis_repes_ids):
+def iter_triangulacion(user, figu_objetivo, alcance="zona", limite=None):
     """
     [OPTIMIZADO]
-    Esta función ya no calcula nada pesado. 
-    Solo llama al motor SQL (PostgreSQL) que ya hizo el trabajo de grafos.
+    Cadenas A -> B -> C -> A que terminan dándole al usuario la figu_objetivo, ya ordenadas
+    (primero las de su zona, después por reputación) y de a una (generador).
+    El objetivo, el alcance ('zona' | 'provincia') y el límite son parte de la búsqueda:
+    no se enumeran ciclos para después descartarlos en Python.
+    Por defecto usa el motor de grafos en proceso (graph_engine.py); con FIGUS_TRIANGULACION=sql
+    usa el RPC del servidor (sql/003_find_triangulations.sql).
+    """
+    if not user or 'id' not in user or not figu_objetivo:
+        return iter(())
+
+    if config.TRIANGULACION_MOTOR != "sql":
+        return islice(_cadenas_grafo(user['id'], figu_objetivo, alcance), limite)
+
+    rows = db.get_triangulations_sql(user['id'], int(figu_objetivo), alcance, limite)
+    return (_formatear_fila_sql(row) for row in rows)
+
+def buscar_triangulacion(user, figu_objetivo, mis_repes_ids=None, alcance="zona", limite=config.TRIANGULACION_TOP_K):
+    """
+    Las mejores 'limite' cadenas para la figu_objetivo (lista, para guardar en session_state).
+    Con el motor de grafos pasa por el cache compartido (triangulation_cache.py).
+    """
+    if _usar_cache(user, figu_objetivo, limite):
+        try: return db.get_triangulation_cache().cadenas(user['id'], figu_objetivo, alcance, 3)[0][:limite]
+        except Exception as e: print(f"Error Cache Triangulación: {e}")
+    return list(iter_triangulacion(user, figu_objetivo, alcance, limite))
+
+def buscar_ciclos(user, figu_objetivo, k_max=config.CICLOS_K_MAX, alcance="zona", limite=config.TRIANGULACION_TOP_K):
+    """
+    Cadenas de 3 hasta k_max partes (vos incluido) para la figu_objetivo: primero las más
+    cortas. Las de 4-5 sirven en zonas chicas, donde muchas figuritas no tienen triángulo.
+    Corre con presupuesto de tiempo y nodos (config.CICLOS_*); devuelve (cadenas, cortada).
+    Sólo con el motor de grafos: con FIGUS_TRIANGULACION=sql se limita a triángulos.
+    """
+    if not user or 'id' not in user or not figu_objetivo:
+        return [], False
+    if config.TRIANGULACION_MOTOR == "sql" or k_max <= 3:
+        return buscar_triangulacion(user, figu_objetivo, None, alcance, limite), False
+
+    if _usar_cache(user, figu_objetivo, limite):
+        try:
+            cadenas, cortada = db.get_triangulation_cache().cadenas(user['id'], figu_objetivo, alcance, k_max)
+            return cadenas[:limite], cortada
+        except Exception as e: print(f"Error Cache Triangulación: {e}")
+
+    presupuesto = graph_engine.Presupuesto(ms=config.CICLOS_PRESUPUESTO_MS, nodos=config.CICLOS_MAX_NODOS)
+    try: cadenas = db.get_market_graph().ciclos(user['id'], figu_objetivo, k_max, alcance, limite, presupuesto)
+    except Exception as e:
+        print(f"Error Motor Ciclos: {e}")
+        return [], False
+    return cadenas, presupuesto.cortado
+
+def triangular_wishlist(user, alcance="zona"):
+    """
+    [OPTIMIZADO]
+    La mejor cadena para cada figurita de la wishlist del usuario, en una sola búsqueda
+    (antes: un click y una búsqueda completa por figurita).
+    Devuelve {figurita: cadena} con las que tienen solución, ordenado por número.
     """
     if not user or 'id' not in user:
-        return []
-
-    # 1. Llamada Única a Base de Datos (Eficiencia Máxima)
-    # Esto ejecuta la función recursiva en el servidor
-    raw_triangulations = db.get_triangulations_sql(user['id'])
-    
-    triangulaciones = []
-
-    # 2. Procesamiento ligero de respuesta
-    for row in raw_triangulations:
-        # La función SQL devuelve cadenas genéricas encontradas.
-        # Aquí filtramos: ¿Esta cadena termina dándome la figurita que quiero?
-        
-        # Nota: Ajustamos los nombres de las columnas según lo que devuelva tu SQL final.
-        # Asumimos que el SQL devuelve: 
-        # step1 (Puente), step2 (Target), sticker_to_me (Lo que recibo)
-        
-        sticker_que_recibo = int(row.get('step3_sticker', 0)) # La que tiene el Target
-        
-        # Si buscamos una específica y esta cadena no la tiene, la saltamos.
-        if figu_objetivo and sticker_que_recibo != int(figu_objetivo):
-            continue
-
-        # 3. Formateo para la UI
-        cadena = {
-            "tipo": "triangulacion",
-            
-            # DATOS DEL TARGET (El que tiene la que quiero) [C]
-            "target_id": row.get('step2_user_id'), 
-            "target_nick": row.get('step2_user', 'Usuario'), # Ajustado al SQL básico
-            "target_phone_enc": row.get('step2_phone', ''),
-            "target_tiene": sticker_que_recibo,
-            
-            # DATOS DEL PUENTE (El intermediario) [B]
-            "bridge_id": row.get('step1_user_id'),
-            "bridge_nick": row.get('step1_user', 'Puente'),
-            "bridge_phone_enc": row.get('step1_phone', ''),
-            "bridge_tiene": int(row.get('step2_sticker', 0)), # Lo que le da al Target
-            "bridge_quiere": int(row.get('step1_sticker', 0)) # Lo que yo le doy al Puente
-        }
-        triangulaciones.append(cadena)
-
-    return triangulaciones
\ No newline at end of file
+        return {}
+    wishlist = db.get_full_wishlist(user['id'])
+    if not wishlist: return {}
+
+    if config.TRIANGULACION_MOTOR != "sql":
+        try: return db.get_triangulation_cache().mejores_por_figurita(user['id'], alcance)
+        except Exception as e:
+            print(f"Error Motor Triangulación: {e}")
+            return {}
+
+    # Una sola consulta sin objetivo: llegan ordenadas, la primera de cada figurita es la mejor
+    mejores = {}
+    for row in db.get_triangulations_sql(user['id'], None, alcance, None):
+        cadena = _formatear_fila_sql(row)
+        mejores.setdefault(cadena['target_tiene'], cadena)
+    return dict(sorted(mejores.items()))
+
+def _usar_cache(user, figu_objetivo, limite):
+    # El cache guarda las mejores TRIANGULACION_TOP_K: pedidos más grandes van directo al motor
+    return (config.TRIANGULACION_MOTOR != "sql" and user and 'id' in user and figu_objetivo
+            and limite is not None and limite <= config.TRIANGULACION_TOP_K)
+
+def _cadenas_grafo(user_id, figu_objetivo, alcance):
+    try: yield from db.get_market_graph().iter_triangulaciones(user_id, figu_objetivo, alcance)
+    except Exception as e: print(f"Error Motor Triangulación: {e}")
+
+def _formatear_fila_sql(row):
+    # Formateo para la UI (misma forma que graph_engine.GrafoMercado._cadena)
+    return {
+        "tipo": "triangulacion",
+
+        # DATOS DEL TARGET (El que tiene la que quiero) [C]
+        "target_id": row.get('step2_user_id'),
+        "target_nick": row.get('step2_user', 'Usuario'),
+        "target_phone_enc": row.get('step2_phone', ''),
+        "target_tiene": int(row.get('step3_sticker', 0)),
+        "target_zone": row.get('step2_zone'),
+
+        # DATOS DEL PUENTE (El intermediario) [B]
+        "bridge_id": row.get('step1_user_id'),
+        "bridge_nick": row.get('step1_user', 'Puente'),
+        "bridge_phone_enc": row.get('step1_phone', ''),
+        "bridge_tiene": int(row.get('step2_sticker', 0)), # Lo que le da al Target
+        "bridge_quiere": int(row.get('step1_sticker', 0)), # Lo que yo le doy al Puente
+        "bridge_zone": row.get('step1_zone'),
+    }
@@ -0,0 +1,199 @@
+import queue
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+import graph_engine
+
+# --- CACHE DE TRIANGULACIONES (ENTRE SESIONES) ---
+# Antes cada click recalculaba desde cero y el resultado vivía sólo en session_state.
+# Ahora hay UN cache por proceso, con clave (usuario, figurita, alcance, largo máximo):
+# - Invalidación precisa: cada entrada recuerda a sus participantes y qué figuritas usa
+#   cada uno (da / recibe). Cuando alguien escribe su inventario (database._inventario_modificado)
+#   se tiran sólo las entradas donde participa con alguna de esas figuritas, y todas las
+#   del propio usuario (sus repes y su wishlist definen qué cadenas existen).
+# - Las cadenas NUEVAS que aparecen por cargas de terceros no invalidan nada: las toma el TTL.
+# - Calentamiento: un único hilo en segundo plano precalcula la wishlist de los premium
+#   (triángulos de su zona, lo que muestra el botón por defecto) y las re-calcula al invalidarse.
+#   Con topes: al arrancar se encolan como mucho 'calentar_inicial' premium; por usuario se
+#   precalculan sólo las primeras 'calentar_por_usuario' figuritas que tienen cadena; y el
+#   calentamiento nunca llena más de la mitad del cache (el resto es para lo que se pide de verdad).
+# Los resultados se comparten entre sesiones: NO modificarlos.
+
+TODA_LA_WISHLIST = 0  # "Figurita" de la clave para el modo "Triangular toda mi Wishlist"
+
+class CacheTriangulaciones:
+    def __init__(self, grafo, top_k=20, ttl=600, max_entradas=20000, presupuesto=None, cargar_premium=None,
+                 calentar_inicial=200, calentar_por_usuario=10):
+        """
+        grafo(): GrafoMercado actual (el del snapshot compartido).
+        top_k: cadenas que se guardan por búsqueda.
+        presupuesto(): Presupuesto nuevo para las búsquedas de 4-5 partes.
+        cargar_premium(): ids de usuarios premium, para el primer calentamiento (opcional).
+        calentar_inicial: premium que se encolan al arrancar (los primeros que devuelve cargar_premium).
+        calentar_por_usuario: figuritas sueltas que se precalculan por premium.
+        """
+        self._grafo = grafo
+        self._top_k = top_k
+        self._ttl = ttl
+        self._max = max_entradas
+        self._presupuesto = presupuesto or graph_engine.Presupuesto
+        self._cargar_premium = cargar_premium
+        self._calentar_inicial = calentar_inicial
+        self._calentar_por_usuario = calentar_por_usuario
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # clave -> (creado, valor, {participante: figuritas})
+        self._por_usuario = {}          # participante (o dueño) -> claves
+        self._seq = 0                   # Contador de escrituras
+        self._ultimo_cambio = {}        # user_id -> seq de su última escritura
+        self._premium = set()
+        self._pendientes = set()
+        self._cola = queue.Queue()
+        self._hilo = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidadas = 0
+        self.calentadas = 0
+
+    # --- LECTURA ---
+    def cadenas(self, user_id, figu, alcance='zona', k_max=3):
+        """(cadenas, cortada) para esa figurita: del cache o calculadas y guardadas."""
+        clave = (int(user_id), int(figu), alcance, k_max)
+        valor = self._leer(clave)
+        if valor is not None: return valor
+        desde = self._seq
+        valor = self._calcular(clave)
+        self._guardar(clave, valor, desde)
+        return valor
+
+    def mejores_por_figurita(self, user_id, alcance='zona'):
+        """{figurita: mejor cadena} de toda la wishlist (modo "Triangular toda mi Wishlist")."""
+        return self.cadenas(user_id, TODA_LA_WISHLIST, alcance, 3)[0]
+
+    def _leer(self, clave):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None and time.time() - entrada[0] <= self._ttl:
+                self._entradas.move_to_end(clave)
+                self.hits += 1
+                return entrada[1]
+            if entrada is not None: self._sacar(clave)
+            self.misses += 1
+            return None
+
+    def _calcular(self, clave):
+        user_id, figu, alcance, k_max = clave
+        g = self._grafo()
+        if figu == TODA_LA_WISHLIST:
+            return g.mejores_por_figurita(user_id, None, alcance), False
+        if k_max <= 3:
+            return list(islice(g.iter_triangulaciones(user_id, figu, alcance), self._top_k)), False
+        presupuesto = self._presupuesto()
+        return g.ciclos(user_id, figu, k_max, alcance, self._top_k, presupuesto), presupuesto.cortado
+
+    # --- ESCRITURA E INVALIDACIÓN ---
+    def _guardar(self, clave, valor, desde):
+        cadenas = valor[0].values() if isinstance(valor[0], dict) else valor[0]
+        usos = _participantes(clave[0], cadenas)
+        with self._lock:
+            # Si algún participante escribió mientras se calculaba, el resultado puede estar viejo
+            if any(self._ultimo_cambio.get(u, 0) > desde for u in usos): return
+            if clave in self._entradas: self._sacar(clave)
+            self._entradas[clave] = (time.time(), valor, usos)
+            for u in usos: self._por_usuario.setdefault(u, set()).add(clave)
+            while len(self._entradas) > self._max:
+                self._sacar(next(iter(self._entradas)))
+
+    def invalidar_usuario(self, user_id, stickers=None):
+        """Después de una escritura de user_id (stickers=None: cualquier figurita o su perfil)."""
+        user_id = int(user_id)
+        tocadas = None if stickers is None else {int(s) for s in stickers}
+        dueños = set()
+        with self._lock:
+            self._seq += 1
+            self._ultimo_cambio[user_id] = self._seq
+            for clave in list(self._por_usuario.get(user_id, ())):
+                usadas = self._entradas[clave][2][user_id]
+                if clave[0] == user_id or tocadas is None or usadas & tocadas:
+                    self._sacar(clave)
+                    self.invalidadas += 1
+                    dueños.add(clave[0])
+        for dueño in dueños & self._premium: self.calentar(dueño)
+
+    def vaciar(self):
+        with self._lock:
+            self._entradas.clear()
+            self._por_usuario.clear()
+
+    def _sacar(self, clave):
+        _, _, usos = self._entradas.pop(clave)
+        for u in usos:
+            claves = self._por_usuario.get(u)
+            if claves is not None:
+                claves.discard(clave)
+                if not claves: del self._por_usuario[u]
+
+    # --- CALENTAMIENTO EN SEGUNDO PLANO ---
+    def calentar(self, user_id):
+        """Encola a un usuario premium: su wishlist se precalcula en el hilo de fondo."""
+        user_id = int(user_id)
+        with self._lock:
+            self._premium.add(user_id)
+            if user_id in self._pendientes: return
+            self._pendientes.add(user_id)
+            self._iniciar_hilo()
+        self._cola.put(user_id)
+
+    def _iniciar_hilo(self):
+        if self._hilo is None:
+            self._hilo = threading.Thread(target=self._trabajar, name="calentar-triangulaciones", daemon=True)
+            self._hilo.start()
+
+    def _trabajar(self):
+        # Al arrancar (una vez por proceso) se encolan todos los premium
+        if self._cargar_premium is not None:
+            try:
+                for uid in islice(self._cargar_premium(), self._calentar_inicial): self.calentar(uid)
+            except Exception as e: print(f"Error cargando premium para calentar: {e}")
+        while True:
+            user_id = self._cola.get()
+            with self._lock: self._pendientes.discard(user_id)
+            try: self._calentar_usuario(user_id)
+            except Exception as e: print(f"Error calentando triangulaciones de {user_id}: {e}")
+
+    def _calentar_usuario(self, user_id):
+        g = self._grafo()
+        i = g.idx.get(user_id)
+        if i is None or not g.repetidas[i] or self._lleno(): return
+        # La wishlist entera sale en un recorrido; de ahí, sólo las figuritas que tienen cadena
+        # (las que el usuario va a abrir) y como mucho calentar_por_usuario
+        con_cadena = self.cadenas(user_id, TODA_LA_WISHLIST)[0]
+        for figu in islice(con_cadena, self._calentar_por_usuario):
+            clave = (user_id, figu, 'zona', 3)
+            with self._lock: listo = clave in self._entradas
+            if listo: continue
+            if self._lleno(): return
+            desde = self._seq
+            self._guardar(clave, self._calcular(clave), desde)
+            self.calentadas += 1
+            time.sleep(0)  # Cede el GIL a las sesiones entre figurita y figurita
+
+    def _lleno(self):
+        with self._lock: return len(self._entradas) >= self._max // 2
+
+    def stats(self):
+        return {"entradas": len(self._entradas), "hits": self.hits, "misses": self.misses,
+                "invalidadas": self.invalidadas, "calentadas": self.calentadas, "en_cola": self._cola.qsize()}
+
+def _participantes(dueño, cadenas):
+    """{user_id: figuritas que da o recibe en alguna de las cadenas} (el dueño siempre incluido)."""
+    usos = {dueño: set()}
+    for c in cadenas:
+        usos[dueño].update((c['bridge_quiere'], c['target_tiene']))
+        usos.setdefault(c['bridge_id'], set()).update((c['bridge_quiere'], c['bridge_tiene']))
+        recibe = c['bridge_tiene']
+        for p in c.get('intermedios') or []:
+            usos.setdefault(p['id'], set()).update((p['recibe'], p['entrega']))
+            recibe = p['entrega']
+        usos.setdefault(c['target_id'], set()).update((recibe, c['target_tiene']))
+    return usos
@@ -0,0 +1,224 @@
+import sys
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from functools import lru_cache
+
+# --- ÍNDICE DE BÚSQUEDA DE USUARIOS (ADMIN) ---
+# Antes la búsqueda del admin bajaba la tabla users entera y hacía astype(str) + contains sobre
+# TODAS las columnas (hashes y teléfonos incluidos) en cada tecla.
+# Ahora hay UN índice por proceso, sólo con id, nick, zona y provincia normalizados
+# (minúsculas, sin acentos):
+# - Nick: lista ordenada de nicks para prefijos (bisect) y trigramas -> ids (array compacto)
+#   para substrings de 3+ letras: se recorre la lista del trigrama más raro y se verifica.
+# - Zona y provincia: vocabulario chico (valor -> ids), se recorre el vocabulario, no los usuarios.
+# - Id: búsqueda exacta.
+# Los resultados salen ya en orden (id exacto, nick que empieza, nick que contiene, zona o
+# provincia) y se corta al llegar al límite: una palabra común no recorre a todos los usuarios.
+# Varias palabras: cada una tiene que aparecer en algún campo (AND); la más selectiva genera
+# los candidatos y las demás filtran.
+# Se arma una vez; register_user y update_profile lo mantienen, y cada 'sync' segundos se
+# traen los usuarios nuevos de otros procesos (id > último indexado).
+# El armado (~47s con 1M de usuarios) corre en un hilo aparte, fuera del lock: mientras tanto
+# buscar() levanta IndiceNoListo (el panel muestra "armando índice") y las altas y cambios de
+# perfil se anotan para aplicarlos sobre el índice nuevo.
+
+class IndiceNoListo(RuntimeError):
+    pass
+
+def normalizar(texto):
+    texto = str(texto or '').lower()
+    if texto.isascii(): return texto.strip()
+    texto = unicodedata.normalize('NFKD', texto)
+    return ''.join(c for c in texto if not unicodedata.combining(c)).strip()
+
+@lru_cache(maxsize=4096)
+def _lugar(valor):
+    # Zonas y provincias se repiten mucho: normalizadas una vez y la misma instancia de str para todos
+    return sys.intern(normalizar(valor))
+
+def trigramas(texto):
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+class IndiceUsuarios:
+    def __init__(self, cargar_todos, cargar_desde, sync=30):
+        """
+        cargar_todos(): filas (id, nick, zone, province) de todos los usuarios.
+        cargar_desde(id): las de id mayor (usuarios nuevos).
+        """
+        self._cargar_todos = cargar_todos
+        self._cargar_desde = cargar_desde
+        self._sync = sync
+        self._lock = threading.Lock()
+        self._listo = False
+        self._durante = None   # [(método, args)] llegados mientras se arma
+        self._sincronizado = 0.0
+        self._campos = {}      # id -> (nick, zona, provincia) normalizados
+        self._trigramas = {}   # trigrama -> array de ids (crecientes)
+        self._nicks = []       # [(nick, id)] ordenada, para prefijos
+        self._zonas = {}       # zona -> {ids}
+        self._provincias = {}  # provincia -> {ids}
+        self._max_id = 0
+
+    # --- CONSTRUCCIÓN Y MANTENIMIENTO ---
+    def iniciar(self):
+        """Arranca el armado en segundo plano (si no está armado ni armándose)."""
+        with self._lock:
+            if self._listo or self._durante is not None: return
+            self._durante = []
+        threading.Thread(target=self._armar, name="indice-usuarios", daemon=True).start()
+
+    def _armar(self):
+        try: self.construir()
+        except Exception as e: print(f"Error armando el índice de usuarios: {e}")
+        finally:
+            with self._lock: self._durante = None
+
+    def construir(self):
+        """Arma el índice completo en una instancia aparte y lo publica de una vez."""
+        with self._lock:
+            if self._durante is None: self._durante = []
+        nuevo = IndiceUsuarios(self._cargar_todos, self._cargar_desde, self._sync)
+        for row in self._cargar_todos(): nuevo._agregar(row, ordenar=False)
+        nuevo._nicks.sort()
+        with self._lock:
+            self._campos, self._trigramas, self._nicks = nuevo._campos, nuevo._trigramas, nuevo._nicks
+            self._zonas, self._provincias, self._max_id = nuevo._zonas, nuevo._provincias, nuevo._max_id
+            for metodo, args in self._durante: metodo(*args)
+            self._durante = None
+            self._listo = True
+            self._sincronizado = time.time()
+
+    @property
+    def listo(self):
+        return self._listo
+
+    def _asegurar(self):
+        if not self._listo:
+            self.iniciar()
+            raise IndiceNoListo("el índice de usuarios se está armando")
+        elif time.time() - self._sincronizado > self._sync:
+            filas = list(self._cargar_desde(self._max_id))
+            with self._lock:
+                for row in sorted(filas, key=lambda r: int(r['id'])): self._agregar(row)
+                self._sincronizado = time.time()
+
+    def agregar(self, row):
+        """Usuario nuevo (register_user). Si ya estaba, actualiza zona y provincia."""
+        with self._lock:
+            if self._listo: self._agregar(row)
+            if self._durante is not None: self._durante.append((self._agregar, (row,)))
+
+    def actualizar(self, user_id, province, zone):
+        """Cambio de perfil (update_profile): sólo zona y provincia (el nick no cambia)."""
+        with self._lock:
+            if self._listo: self._actualizar(int(user_id), province, zone)
+            if self._durante is not None: self._durante.append((self._actualizar, (int(user_id), province, zone)))
+
+    def _actualizar(self, uid, province, zone):
+        if uid not in self._campos: return
+        nick, zona, prov = self._campos[uid]
+        nueva_zona, nueva_prov = _lugar(zone), _lugar(province)
+        self._mover(self._zonas, zona, nueva_zona, uid)
+        self._mover(self._provincias, prov, nueva_prov, uid)
+        self._campos[uid] = (nick, nueva_zona, nueva_prov)
+
+    def _agregar(self, row, ordenar=True):
+        uid = int(row['id'])
+        if uid in self._campos: return self._actualizar(uid, row.get('province'), row.get('zone'))
+        nick, zona, prov = normalizar(row.get('nick')), _lugar(row.get('zone')), _lugar(row.get('province'))
+        self._campos[uid] = (nick, zona, prov)
+        for t in trigramas(nick):
+            ids = self._trigramas.get(t)
+            if ids is None: ids = self._trigramas[t] = array('q')
+            # Un id menor que el último (llegó desordenado) deja de estar al final: se inserta en su lugar
+            if ids and ids[-1] > uid: ids.insert(bisect_left(ids, uid), uid)
+            else: ids.append(uid)
+        if ordenar: insort(self._nicks, (nick, uid))
+        else: self._nicks.append((nick, uid))
+        self._zonas.setdefault(zona, set()).add(uid)
+        self._provincias.setdefault(prov, set()).add(uid)
+        self._max_id = max(self._max_id, uid)
+
+    @staticmethod
+    def _mover(vocabulario, antes, despues, uid):
+        if antes == despues: return
+        ids = vocabulario.get(antes)
+        if ids is not None:
+            ids.discard(uid)
+            if not ids: del vocabulario[antes]
+        vocabulario.setdefault(despues, set()).add(uid)
+
+    # --- CONSULTA ---
+    def buscar(self, texto, limite=50):
+        """
+        Ids de los primeros 'limite' resultados: id exacto, nicks que empiezan (alfabético),
+        nicks que contienen (3+ letras) y usuarios de las zonas/provincias que coinciden.
+        """
+        self._asegurar()
+        palabras = normalizar(texto).split()
+        if not palabras: return []
+        with self._lock:
+            i = min(range(len(palabras)), key=lambda k: self._estimar(palabras[k]))
+            p, otras = palabras[i], palabras[:i] + palabras[i + 1:]
+            res, vistos = [], set()
+            # Con varias palabras p se recorre en orden de id (el rango alfabético de prefijos puede
+            # venir agrupado justo por la otra palabra: "tomas..." con "qatar" al final) y las
+            # primeras 'limite' coincidencias se ordenan igual que con una sola palabra
+            for uid in self._candidatos(p, por_id=bool(otras)):
+                if uid in vistos or not all(self._coincide(uid, o) for o in otras): continue
+                vistos.add(uid)
+                res.append(uid)
+                if len(res) >= limite: break
+            return sorted(res, key=lambda uid: self._orden(uid, p)) if otras else res
+
+    def _candidatos(self, p, por_id=False):
+        if p.isdigit() and int(p) in self._campos: yield int(p)
+        if por_id and len(p) >= 3:
+            # La lista del trigrama ya incluye a los nicks que empiezan con p
+            for uid in self._lista_mas_corta(p):
+                if p in self._campos[uid][0]: yield uid
+        else:
+            yield from self._por_prefijo(p)
+            if len(p) >= 3:
+                for uid in self._lista_mas_corta(p):
+                    nick = self._campos[uid][0]
+                    if p in nick and not nick.startswith(p): yield uid
+        for usuarios in self._por_lugar(p): yield from usuarios
+
+    def _estimar(self, p):
+        """Cota de cuántos candidatos genera p (sin armarlos)."""
+        desde, hasta = self._rango_prefijo(p)
+        n = hasta - desde + sum(map(len, self._por_lugar(p)))
+        return n + (len(self._lista_mas_corta(p)) if len(p) >= 3 else 0)
+
+    def _orden(self, uid, p):
+        # Mismo orden que _candidatos: id exacto, nick que empieza (alfabético), contiene, lugar
+        nick = self._campos[uid][0]
+        if str(uid) == p: return (0, '', uid)
+        if nick.startswith(p): return (1, nick, uid)
+        return (2 if p in nick else 3, '', uid)
+
+    def _lista_mas_corta(self, p):
+        return min((self._trigramas.get(t, ()) for t in trigramas(p)), key=len)
+
+    def _rango_prefijo(self, p):
+        return bisect_left(self._nicks, (p, -1)), bisect_left(self._nicks, (p + '\uffff', -1))
+
+    def _por_prefijo(self, p):
+        desde, hasta = self._rango_prefijo(p)
+        for i in range(desde, hasta): yield self._nicks[i][1]
+
+    def _por_lugar(self, p):
+        return [usuarios for vocabulario in (self._zonas, self._provincias)
+                for valor, usuarios in vocabulario.items() if p in valor]
+
+    def _coincide(self, uid, p):
+        nick, zona, prov = self._campos[uid]
+        return p in nick or p in zona or p in prov or str(uid) == p
+
+    def stats(self):
+        return {"usuarios": len(self._campos), "trigramas": len(self._trigramas),
+                "zonas": len(self._zonas), "provincias": len(self._provincias)}
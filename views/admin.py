@@ -2,42 +2,37 @@ import streamlit as st
 import pandas as pd
 import database as db
 import utils
+import notifications
 import config
+import rollups
 import time
+import os
 
 def render_admin_panel(admin_user):
     st.title("🛡️ Panel de Control - Director Técnico")
     st.info(f"Sesión iniciada como: {admin_user['nick']} (Admin)")
 
-    # --- 1. DATA FETCHING (EXTRACCIÓN DE DATOS) ---
-    # Traemos datos crudos para procesar métricas en Python (seguro para MVP)
+    # --- 1. MÉTRICAS (YA CALCULADAS) ---
+    # [OPTIMIZADO] Antes se bajaban users y transaction_requests enteras y se contaba inventory
+    # en cada rerun. Ahora se leen contadores que mantienen las escrituras (admin_metrics.py).
     try:
-        # Usuarios
-        res_users = db.supabase.table("users").select("*").execute()
-        df_users = pd.DataFrame(res_users.data)
-        
-        # Transacciones
-        res_req = db.supabase.table("transaction_requests").select("*").execute()
-        df_req = pd.DataFrame(res_req.data)
-        
-        # Inventario (Solo conteo rápido para no saturar)
-        count_tengo = db.supabase.table("inventory").select("id", count="exact").eq("status", "tengo").execute().count
-        count_wish = db.supabase.table("inventory").select("id", count="exact").eq("status", "wishlist").execute().count
-        
+        metricas = db.get_admin_metrics()
     except Exception as e:
         st.error(f"Error conectando a DB: {e}")
         return
+    count_tengo = metricas['inventario'].get('tengo', 0)
+    count_wish = metricas['inventario'].get('wishlist', 0)
 
     # --- 2. KPI DASHBOARD (MÉTRICAS CLAVE) ---
     st.markdown("### 📊 Indicadores Principales")
     kpi1, kpi2, kpi3, kpi4 = st.columns(4)
 
-    total_users = len(df_users)
-    total_premium = len(df_users[df_users['is_premium'] == True])
+    total_users = metricas['usuarios']
+    total_premium = metricas['premium']
     revenue_est = total_premium * config.PRECIO_PREMIUM # Estimación simple
     tasa_conversion = round((total_premium / total_users * 100), 2) if total_users > 0 else 0
 
-    kpi1.metric("Usuarios Totales", total_users, delta=f"{len(df_users[df_users['reputation'] > 0])} activos")
+    kpi1.metric("Usuarios Totales", total_users, delta=f"{metricas['activos']} activos")
     kpi2.metric("Usuarios Premium", total_premium, delta=f"{tasa_conversion}% conv.")
     kpi3.metric("Ingresos Estimados", f"${revenue_est:,.0f}", help="Total histórico acumulado")
     kpi4.metric("Figuritas en el Mercado", count_tengo, delta=f"Demanda: {count_wish}")
@@ -53,8 +48,8 @@ def render_admin_panel(admin_user):
         
         with c1:
             st.subheader("🗺️ Mapa de Calor (Provincias)")
-            if not df_users.empty and 'province' in df_users.columns:
-                prov_counts = df_users['province'].value_counts()
+            if metricas['por_provincia']:
+                prov_counts = pd.Series(metricas['por_provincia']).sort_values(ascending=False)
                 st.bar_chart(prov_counts, color="#2e7d32") # Verde cancha
             else:
                 st.info("Faltan datos geográficos.")
@@ -69,27 +64,63 @@ def render_admin_panel(admin_user):
             st.bar_chart(data_market, horizontal=True)
             
             st.subheader("🏆 Top Traders (Reputación)")
-            if not df_users.empty:
-                top_users = df_users.sort_values(by='reputation', ascending=False).head(5)
+            if metricas['top']:
+                top_users = pd.DataFrame(metricas['top'])
                 st.dataframe(
                     top_users[['nick', 'reputation', 'province', 'is_premium']], 
                     hide_index=True, 
                     use_container_width=True
                 )
 
+        # --- ACTIVIDAD EN EL TIEMPO (rollups ya plegados, no tablas crudas) ---
+        st.subheader("📅 Actividad en el Tiempo")
+        f1, f2 = st.columns(2)
+        escala = f1.radio("Escala", ["Diaria (8 semanas)", "Horaria (3 días)"], horizontal=True)
+        provincias = ["Todas"] + sorted(metricas['por_provincia'])
+        provincia = f2.selectbox("Provincia", provincias)
+        granularidad, dias = ("d", 56) if escala.startswith("Diaria") else ("h", 3)
+        filas = db.get_activity_rollups(granularidad, dias, "total" if provincia == "Todas" else "provincia",
+                                        None if provincia == "Todas" else provincia)
+        if filas:
+            serie = pd.DataFrame(filas)
+            serie['bucket'] = pd.to_datetime(serie['bucket'], utc=True).dt.tz_convert(f"Etc/GMT{-config.ROLLUP_UTC_OFFSET:+d}").dt.tz_localize(None)
+            serie = serie.pivot_table(index='bucket', columns='metric', values='value', aggfunc='sum').fillna(0)
+            serie = serie.reindex(columns=list(rollups.METRICAS), fill_value=0)
+            st.line_chart(serie[['desbloqueos', 'canjes', 'compras', 'votos']])
+            tasa = (100 * serie['aceptadas'] / (serie['aceptadas'] + serie['rechazadas'])).dropna()
+            if not tasa.empty:
+                st.caption(f"Tasa de aceptación de solicitudes (%) — período: {rollups.tasa_aceptacion(serie['aceptadas'].sum(), serie['rechazadas'].sum())}%")
+                st.line_chart(tasa.rename("aceptación %"), color="#2e7d32")
+        else:
+            st.info("Todavía no hay actividad plegada (el job corre en segundo plano).")
+
+        if st.checkbox("Ver figuritas más canjeadas (últimos 7 días)"):
+            filas_figus = db.get_activity_rollups("d", 7, "figurita", metrics=("canjes", "compras"))
+            if filas_figus:
+                top_figus = pd.DataFrame(filas_figus).groupby('key')['value'].sum().nlargest(15)
+                top_figus.index = [f"#{k}" for k in top_figus.index]
+                st.bar_chart(top_figus)
+            else:
+                st.info("Sin canjes ni compras en la semana.")
+
     # --- TAB GESTIÓN USUARIOS ---
     with tab_users:
         st.subheader("Buscador de Usuarios")
+        db.start_user_search()  # El índice se arma en segundo plano desde que se abre el panel
         search = st.text_input("Buscar por Nick, Zona o ID", placeholder="Escribí algo...")
         
-        if search and not df_users.empty:
-            # Filtro local en pandas (más rápido para admins)
-            mask = df_users.astype(str).apply(lambda x: x.str.contains(search, case=False)).any(axis=1)
-            results = df_users[mask]
+        if search:
+            # [OPTIMIZADO] Índice en memoria por nick, zona, provincia e id: sólo bajan las filas del resultado
+            encontrados = db.search_users(search)
+            if encontrados is None:
+                st.info("⏳ Armando el índice de búsqueda (la primera vez tarda unos segundos). Probá de nuevo en un momento.")
+                if st.button("🔄 Reintentar búsqueda"): st.rerun()
+            results = pd.DataFrame(encontrados or [])
             
             if not results.empty:
+                results['usados_hoy'] = [db.credits_used_today(u) for u in results.to_dict('records')]
                 st.dataframe(
-                    results[['id', 'nick', 'province', 'daily_contacts_count', 'is_premium', 'reputation']],
+                    results[['id', 'nick', 'province', 'usados_hoy', 'is_premium', 'reputation']],
                     use_container_width=True
                 )
                 
@@ -100,13 +131,15 @@ def render_admin_panel(admin_user):
                 ac1, ac2, ac3, ac4 = st.columns(4)
                 
                 if ac1.button("💎 Dar Premium"):
-                    db.supabase.table("users").update({"is_premium": True}).eq("id", target_id).execute()
-                    st.toast("Usuario actualizado a Premium", icon="💎")
+                    ok, msg = db.set_premium(target_id, True)
+                    if ok: st.toast(msg, icon="💎")
+                    else: st.error(msg)
                     time.sleep(1); st.rerun()
                 
                 if ac2.button("🚫 Quitar Premium"):
-                    db.supabase.table("users").update({"is_premium": False}).eq("id", target_id).execute()
-                    st.toast("Premium removido", icon="⬇️")
+                    ok, msg = db.set_premium(target_id, False)
+                    if ok: st.toast(msg, icon="⬇️")
+                    else: st.error(msg)
                     time.sleep(1); st.rerun()
                     
                 if ac3.button("🎁 Resetear Límite Diario"):
@@ -117,7 +150,7 @@ def render_admin_panel(admin_user):
                     db.supabase.table("users").update({"is_admin": True}).eq("id", target_id).execute()
                     st.warning("¡Nuevo Admin designado!")
 
-            else:
+            elif encontrados is not None:
                 st.warning("No se encontraron usuarios.")
         else:
             st.info("Utilizá el buscador para gestionar permisos.")
@@ -126,29 +159,91 @@ def render_admin_panel(admin_user):
     with tab_db:
         st.subheader("Herramientas de Mantenimiento")
         
-        col_m1, col_m2 = st.columns(2)
-        
-        with col_m1:
-            st.markdown("### 📅 Ciclo Diario")
-            if st.button("🔄 Resetear Límites Diarios (GLOBAL)", type="primary"):
-                with utils.spinner_futbolero():
-                    db.supabase.table("users").update({"daily_contacts_count": 0}).neq("id", 0).execute()
-                st.success("¡Todos los usuarios tienen 0 créditos usados ahora!")
-        
-        with col_m2:
-            st.markdown("### 🧹 Limpieza")
-            st.caption("Elimina solicitudes de canje rechazadas o canceladas para ahorrar espacio.")
-            if st.button("🗑️ Limpiar Solicitudes Viejas"):
-                # Borramos solo las que NO están pendientes ('pending')
-                try:
-                    db.supabase.table("transaction_requests").delete().neq("status", "pending").execute()
-                    st.success("Se limpió el historial de transacciones finalizadas/canceladas.")
-                except Exception as e:
-                    st.error(f"Error: {e}")
+        # [OPTIMIZADO] Antes: un delete/update sin límite desde este hilo (timeouts y filas bloqueadas).
+        # Ahora: trabajos por lotes en segundo plano, con checkpoint y archivo .jsonl.gz (maintenance.py).
+        # El viejo "Reset Mercado" (delete de toda la tabla) se sacó: "Limpiar solicitudes cerradas"
+        # borra por lotes y archiva, sin tocar las pendientes que todavía cuentan los rollups.
+        trabajos = db.get_maintenance_status()
+        corriendo = any(t.get('estado') == 'corriendo' for t in trabajos.values())
+        st.caption(f"Se procesan de a {config.MANTENIMIENTO_LOTE} filas; lo borrado queda archivado en '{config.MANTENIMIENTO_DIR}/'.")
+        for nombre, t in trabajos.items():
+            with st.container(border=True):
+                c_info, c_accion = st.columns([3, 1])
+                c_info.markdown(f"**{t['titulo']}**")
+                estado = t.get('estado')
+                if estado:
+                    total = t.get('total') or 0
+                    hechas = t.get('procesadas', 0)
+                    detalle = f"{estado} · {hechas}" + (f" de ~{total}" if total else "") + " filas"
+                    if t.get('archivo'): detalle += f" · {os.path.basename(t['archivo'])}"
+                    c_info.progress(min(hechas / total, 1.0) if total else (1.0 if estado == 'terminado' else 0.0), text=detalle)
+                    if t.get('error'): c_info.error(t['error'])
+                if estado in ('cancelado', 'error'):
+                    if c_accion.button("▶️ Retomar", key=f"retomar_{nombre}", disabled=corriendo):
+                        ok, msg = db.resume_maintenance(nombre)
+                        (st.toast if ok else st.error)(msg)
+                        st.rerun()
+                if estado == 'corriendo':
+                    if c_accion.button("⏸️ Frenar", key=f"frenar_{nombre}"):
+                        db.cancel_maintenance()
+                        st.toast("Se frena al terminar el lote en curso.")
+                elif c_accion.button("Ejecutar", key=f"lanzar_{nombre}", disabled=corriendo, type="primary"):
+                    ok, msg = db.run_maintenance(nombre)
+                    (st.toast if ok else st.error)(msg)
+                    st.rerun()
+        if corriendo and st.button("🔄 Actualizar progreso"): st.rerun()
+
+        st.divider()
+        st.markdown("### 📊 Métricas del Panel")
+        st.caption(f"Se mantienen con cada escritura; el recálculo completo corrige diferencias (ej: cambios hechos directo en la base). Último: {time.strftime('%d/%m %H:%M', time.localtime(metricas['recalculado_en']))}{' (recalculando en segundo plano)' if metricas['recalculando'] else ''}")
+        if st.button("🔁 Recalcular Métricas"):
+            with utils.spinner_futbolero():
+                ok, msg = db.recompute_admin_metrics()
+            if ok: st.success(msg)
+            else: st.error(msg)
+
+        st.markdown("### 📅 Series de Actividad")
+        estado_rollups = db.get_rollup_state()
+        st.caption(" · ".join(f"{e['source']}: hasta id {e['last_id']} ({len(e.get('pending') or [])} pendientes)" for e in estado_rollups)
+                   or "Todavía no se plegó nada.")
+        # El plegado corre en el hilo del Plegador (rollups.py): el botón sólo lo despierta
+        progreso = db.get_rollup_progress()
+        if progreso['corriendo']:
+            st.info("🧮 Plegando: " + (", ".join(f"{f} {n:,} filas" for f, n in progreso['en_curso'].items()) or "arrancando..."))
+        elif progreso['ultima']:
+            ultima = progreso['ultima']
+            if ultima['error']: st.error(f"Última ronda con error: {ultima['error']}")
+            else: st.caption(f"Última ronda: {time.strftime('%d/%m %H:%M', time.localtime(ultima['fin']))} · plegadas: {ultima['plegadas']}")
+        c_plegar, c_ver = st.columns(2)
+        if c_plegar.button("🧮 Plegar Actividad Ahora"):
+            db.wake_rollups()
+            st.toast("Plegando en segundo plano.")
+            st.rerun()
+        if progreso['corriendo'] and c_ver.button("🔄 Actualizar progreso", key="progreso_rollups"): st.rerun()
 
         st.divider()
-        with st.expander("🚨 ZONA DE PELIGRO (SOLO DESARROLLO)"):
-            st.warning("Estas acciones son destructivas.")
-            if st.button("🔥 Borrar TODAS las Transacciones (Reset Mercado)"):
-                db.supabase.table("transaction_requests").delete().neq("id", 0).execute()
-                st.error("Tabla de transacciones vaciada.")
\ No newline at end of file
+        st.markdown("### 🗄️ Cache del Mercado")
+        stats = db.get_market_cache_stats()
+        cs1, cs2, cs3, cs4 = st.columns(4)
+        cs1.metric("Hits", stats['hits'])
+        cs2.metric("Misses (recarga completa)", stats['misses'])
+        cs3.metric("Patches", stats['patches'])
+        cs4.metric("Versión", stats['version'], help=f"{stats['filas']} filas en memoria")
+
+        st.markdown("### 📐 Cache de Triangulaciones")
+        tstats = db.get_triangulation_cache().stats()
+        ct1, ct2, ct3, ct4 = st.columns(4)
+        ct1.metric("Hits", tstats['hits'])
+        ct2.metric("Misses", tstats['misses'])
+        ct3.metric("Invalidadas", tstats['invalidadas'])
+        ct4.metric("Entradas", tstats['entradas'], help=f"{tstats['calentadas']} precalculadas, {tstats['en_cola']} premium en cola")
+
+        st.markdown("### 🔔 Notificaciones (Telegram)")
+        nstats = notifications.get_metricas()
+        if nstats is None: st.caption("Sin envíos en este proceso (o sin token configurado).")
+        else:
+            cn1, cn2, cn3, cn4 = st.columns(4)
+            cn1.metric("En cola", nstats['en_cola'], help=f"{nstats['en_vuelo']} enviándose")
+            cn2.metric("Enviados", nstats['enviados'], help=f"{nstats['reintentos']} reintentos; {nstats['resumenes']} resúmenes con {nstats['alertas_resumidas']} alertas ({nstats['en_resumen']} esperando)")
+            cn3.metric("Fallidos / descartados", f"{nstats['fallidos']} / {nstats['descartados']}")
+            cn4.metric("Latencia p95 (ms)", nstats['latencia_p95_ms'] or 0, help=f"p50: {nstats['latencia_p50_ms']} ms, demora en cola p95: {nstats['demora_p95_ms']} ms")
@@ -157,9 +157,9 @@ def render_inventory(user, start, end, seleccion_pais):
 
     if st.button(btn_lbl, type=btn_type, use_container_width=True):
         with utils.spinner_futbolero():
-            db.save_inventory_positive(user['id'], start, end, seleccion_tengo, seleccion_wishlist, edited_df)
+            cambios = db.save_inventory_positive(user['id'], start, end, seleccion_tengo, seleccion_wishlist, edited_df)
             st.session_state.unsaved_changes = False 
         
-        st.toast("¡Cambios guardados!", icon="✅")
+        st.toast(f"¡Cambios guardados! ({cambios} figus actualizadas)" if cambios else "¡Cambios guardados!", icon="✅")
         time.sleep(0.5)
         st.rerun()
\ No newline at end of file
@@ -53,15 +53,14 @@ def modal_seguridad(target_id, user):
     if st.button("✅ Dale, Ver Contacto", type="primary", use_container_width=True):
         if no_volver_a_mostrar: st.session_state.skip_security_modal = True
         
-        if db.check_contact_limit(user):
-            with utils.spinner_futbolero():
-                db.consume_credit(user)
+        with utils.spinner_futbolero():
+            ok, msg = db.consume_credit(user)  # Atómico: si otra pestaña ya lo usó, no se cobra dos veces
+            if ok:
                 db.log_unlock(user['id'], target_id)
                 st.session_state.unlocked_users.add(target_id)
                 time.sleep(1)
-            st.rerun()
-        else:
-            st.error("Error: Te quedaste sin créditos por hoy.")
+        if ok: st.rerun()
+        else: st.error(f"Error: {msg}")
 
 @st.dialog("💎 Pasate a Premium", width="small")
 def mostrar_modal_premium():
@@ -184,11 +183,13 @@ def render_card(item, tipo, user, is_pending_view=False):
                     if db.check_contact_limit(user):
                         if st.session_state.skip_security_modal:
                             with utils.spinner_futbolero():
-                                db.consume_credit(user)
-                                db.log_unlock(user['id'], target_id)
-                                st.session_state.unlocked_users.add(target_id)
-                                time.sleep(0.5)
-                            st.rerun()
+                                ok, _ = db.consume_credit(user)
+                                if ok:
+                                    db.log_unlock(user['id'], target_id)
+                                    st.session_state.unlocked_users.add(target_id)
+                                    time.sleep(0.5)
+                            if ok: st.rerun()
+                            else: mostrar_modal_premium()
                         else: modal_seguridad(target_id, user)
                     else: mostrar_modal_premium()
             
@@ -245,6 +246,22 @@ def render_market(user):
     st.subheader("🔍 Mercado")
     
     if 'triang_results' not in st.session_state: st.session_state.triang_results = None
+    # Premium: su wishlist se triangula en segundo plano (una vez por sesión) para que el botón responda al instante
+    if user.get('is_premium', False) and not st.session_state.get('triang_calentado'):
+        db.warm_triangulations(user['id'])
+        st.session_state.triang_calentado = True
+
+    # --- PROPUESTAS DEL MERCADO (precalculadas por market_clearing.py) ---
+    propuestas = db.get_trade_proposals(user['id'])
+    if propuestas:
+        with st.expander(f"🤝 Cambios reservados para vos ({len(propuestas)})", expanded=True):
+            st.caption("Cambios armados entre todo el mercado: nadie más tiene prometidas estas figuritas.")
+            for p in propuestas:
+                tipo = "🔄 Canje directo" if p['kind'] == 'canje' else "📐 Triángulo"
+                if p['give_to'] == p['receive_from']:
+                    st.markdown(f"{tipo}: le das la **#{p['give_sticker']}** a **{p['give_to_nick']}** y te da la **#{p['receive_sticker']}**.")
+                else:
+                    st.markdown(f"{tipo}: le das la **#{p['give_sticker']}** a **{p['give_to_nick']}** y **{p['receive_from_nick']}** te da la **#{p['receive_sticker']}**.")
 
     with st.expander("🔎 Filtros", expanded=True):
         col_f1, col_f2, col_f3, col_f4 = st.columns(4)
@@ -273,6 +290,11 @@ def render_market(user):
         if st.button("ℹ️", key="btn_info_triang", help="Ayuda Triangulación"):
             modal_explicacion_triangulacion()
 
+    c_opt_1, c_opt_2 = st.columns([0.6, 0.4])
+    ampliar_provincia = c_opt_1.checkbox("Incluir toda mi provincia (no sólo mi zona)", key="triang_provincia")
+    largo_max = c_opt_2.selectbox("Largo máximo de la cadena:", [3, 4, 5], key="triang_largo",
+                                  format_func=lambda k: f"{k} personas", help="En zonas chicas, las cadenas de 4 o 5 encuentran figuritas que no tienen triángulo.")
+
     if st.button(lbl_btn, type="primary", use_container_width=True):
         if not user.get('is_premium', False):
             mostrar_modal_premium()
@@ -288,23 +310,55 @@ def render_market(user):
                 else:
                     try:
                         target_val = int(filtro_num)
-                        resultados = triangulation.buscar_triangulacion(user, target_val, mis_repes_ids)
+                        alcance = "provincia" if ampliar_provincia else "zona"
+                        resultados, cortada = triangulation.buscar_ciclos(user, target_val, largo_max, alcance=alcance)
                         st.session_state.triang_results = resultados
                         if not resultados:
-                            st.warning("No se encontraron triangulaciones en tu zona para esta figurita.")
+                            donde = "tu provincia" if alcance == "provincia" else "tu zona"
+                            st.warning(f"No se encontraron triangulaciones en {donde} para esta figurita.")
+                        if cortada:
+                            st.caption("⏱️ La búsqueda de cadenas largas se cortó por tiempo: se muestran las encontradas hasta ahí.")
                     except ValueError:
                         st.error("Ingresá un número válido.")
 
+    # Modo wishlist completa: una sola búsqueda, la mejor cadena por cada figurita que falta
+    if st.button("📐 Triangular toda mi Wishlist", use_container_width=True, key="btn_triang_wishlist"):
+        if not user.get('is_premium', False):
+            mostrar_modal_premium()
+        else:
+            with utils.spinner_futbolero():
+                alcance = "provincia" if ampliar_provincia else "zona"
+                por_figu = triangulation.triangular_wishlist(user, alcance=alcance)
+                st.session_state.triang_results = list(por_figu.values())
+                if not por_figu:
+                    donde = "tu provincia" if alcance == "provincia" else "tu zona"
+                    st.warning(f"No se encontraron triangulaciones en {donde} para tu wishlist (¿cargaste Repetidas y Wishlist?).")
+
     if st.session_state.triang_results:
         st.success(f"¡Se encontraron {len(st.session_state.triang_results)} caminos posibles!")
         
         for i, t in enumerate(st.session_state.triang_results):
             with st.container(border=True):
-                st.markdown(f"### 📐 Triángulo Dorado")
-                c1, c2, c3 = st.columns(3)
-                c1.metric("1. Vos entregás", f"#{t['bridge_quiere']}", f"a {t['bridge_nick']}")
-                c2.metric("2. Puente entrega", f"#{t['bridge_tiene']}", f"a {t['target_nick']}")
-                c3.metric("3. Recibís", f"#{t['target_tiene']}", "de Objetivo")
+                intermedios = t.get('intermedios') or []
+                otras_zonas = {z for z in [t.get('bridge_zone'), t.get('target_zone')] + [p.get('zone') for p in intermedios] if z and z != user.get('zone')}
+                if not intermedios:
+                    st.markdown(f"### 📐 Triángulo Dorado")
+                    if otras_zonas: st.caption(f"📍 Fuera de tu zona: {', '.join(sorted(otras_zonas))}")
+                    c1, c2, c3 = st.columns(3)
+                    c1.metric("1. Vos entregás", f"#{t['bridge_quiere']}", f"a {t['bridge_nick']}")
+                    c2.metric("2. Puente entrega", f"#{t['bridge_tiene']}", f"a {t['target_nick']}")
+                    c3.metric("3. Recibís", f"#{t['target_tiene']}", "de Objetivo")
+                else:
+                    st.markdown(f"### 🔗 Cadena de {t.get('largo', len(intermedios) + 3)}")
+                    if otras_zonas: st.caption(f"📍 Fuera de tu zona: {', '.join(sorted(otras_zonas))}")
+                    pasos = [f"**Vos** → #{t['bridge_quiere']} → **{t['bridge_nick']}**"]
+                    anterior = t['bridge_nick']
+                    for p in intermedios:
+                        pasos.append(f"**{anterior}** → #{p['recibe']} → **{p['nick']}**")
+                        anterior = p['nick']
+                    pasos.append(f"**{anterior}** → #{intermedios[-1]['entrega']} → **{t['target_nick']}**")
+                    pasos.append(f"**{t['target_nick']}** → #{t['target_tiene']} → **Vos**")
+                    st.markdown("\n".join(f"{n}. {paso}" for n, paso in enumerate(pasos, 1)))
                 
                 bridge_phone = utils.decrypt_phone(t.get('bridge_phone_enc'))
                 target_phone = utils.decrypt_phone(t.get('target_phone_enc'))
@@ -314,7 +368,11 @@ def render_market(user):
                     # Construimos el mensaje de forma segura
                     info_contacto_target = f"{t['target_nick']} (WhatsApp: +549{target_phone})" if target_phone else t['target_nick']
                     
-                    msg_wa = f"Hola! Vi una triangulación en Figus26. Yo te doy la #{t['bridge_quiere']}, vos le das la #{t['bridge_tiene']} a *{info_contacto_target}*, y yo recibo la #{t['target_tiene']}. ¿Te copás?"
+                    if not intermedios:
+                        msg_wa = f"Hola! Vi una triangulación en Figus26. Yo te doy la #{t['bridge_quiere']}, vos le das la #{t['bridge_tiene']} a *{info_contacto_target}*, y yo recibo la #{t['target_tiene']}. ¿Te copás?"
+                    else:
+                        resto = ", ".join(f"{p['nick']} pasa la #{p['entrega']}" for p in intermedios)
+                        msg_wa = f"Hola! Vi una cadena de cambio en Figus26. Yo te doy la #{t['bridge_quiere']}, vos le das la #{t['bridge_tiene']} a {intermedios[0]['nick']}, {resto}, y *{info_contacto_target}* me da la #{t['target_tiene']}. ¿Te copás?"
                     msg_encoded = quote(msg_wa)
                     link = f"https://wa.me/549{bridge_phone}?text={msg_encoded}"
                     
@@ -351,7 +409,7 @@ def render_market(user):
                 temp_df['price'] = pd.to_numeric(temp_df['price'], errors='coerce').fillna(0).astype(int)
                 market_df = temp_df
         else:
-            # [LEGACY] Ruta lenta
+            # Snapshot compartido del mercado (uno por servidor, no por usuario)
             market_df = db.fetch_market(user['id'])
     
     # Procesamiento de coincidencias
@@ -217,9 +217,10 @@ def render_user_sidebar(user):
             st.success("💎 PREMIUM")
         else:
             st.info("👤 GRATIS")
-            contacts = user.get('daily_contacts_count', 0)
-            if contacts >= 1: st.progress(1.0, text="Límite: 1/1 (Agotado)")
-            else: st.progress(0.0, text="Límite: 0/1 (Disponible)")
+            contacts = db.credits_used_today(user)  # Sin reset: un día nuevo ya cuenta 0
+            limite = config.CREDITOS_DIARIOS
+            if contacts >= limite: st.progress(1.0, text=f"Límite: {limite}/{limite} (Agotado)")
+            else: st.progress(contacts / limite, text=f"Límite: {contacts}/{limite} (Disponible)")
             
             if st.button("💎 Hacete Premium", use_container_width=True): 
                 market.mostrar_modal_premium()